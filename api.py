@@ -1,53 +1,494 @@
+import asyncio
+import functools
+import json
 import time
-from fastapi import FastAPI
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 
 from backend.config import SETTINGS
 from backend.vectorstore import FaissStore
-from backend.embeddings import Embedder
-from backend.retriever import retrieve
-from backend.qa import answer_with_optional_llm
+from backend.retriever import retrieve, retrieve_many
+from backend.qa import answer_with_optional_llm, answer_with_llm_async, answer_sources, extractive_answer, stream_answer_async
+from backend.answer_cache import ANSWER_CACHE, answer_scope
+from backend.telemetry import collect_spans, log_run, span, WRITER
+from backend.utils import now_ms
+from backend.serving import AdmissionLimiter, Overloaded, run_cpu, shutdown_executor
+from backend.batching import BATCH_BUCKETS, QueryMicroBatcher
+from backend.embed_cache import cache_stats
+from backend.models import get_embedder, loaded_models
+from backend.profiling import PROFILE_HEADER, profiling, start_profile
+from backend.metrics import CONTENT_TYPE, GENERATION_FALLBACKS, REGISTRY, REQUESTS, counter, gauge, observe_request
 
-from google import genai
+# Loaded at startup (see lifespan); module-level so handlers and tools can swap them.
+store = None
+embedder = None
+gemini_client = None
+batcher = None
 
-app = FastAPI(title="Explainable RAG API (Gemini)")
+def init_resources():
+    global store, embedder, gemini_client, batcher
+    if store is None:
+        store = FaissStore(SETTINGS.index_dir)
+        store.load()
+    if embedder is None:
+        # shared per-process instance, loaded and warmed up once
+        embedder = get_embedder(SETTINGS.embedding_model)
+    if gemini_client is None:
+        from google import genai
+        # Gemini client
+        if SETTINGS.gemini_api_key.strip():
+            gemini_client = genai.Client(api_key=SETTINGS.gemini_api_key)
+        else:
+            gemini_client = genai.Client()
+    if batcher is None:
+        # concurrent /ask queries share one encode call
+        batcher = QueryMicroBatcher(embedder.embed_queries, SETTINGS.embed_batch_window_ms, SETTINGS.embed_max_batch)
 
-store = FaissStore(SETTINGS.index_dir)
-store.load()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_resources()
+    yield
+    shutdown_executor()
 
-embedder = Embedder(SETTINGS.embedding_model)
+app = FastAPI(title="Explainable RAG API (Gemini)", lifespan=lifespan)
 
-# Gemini client
-if SETTINGS.gemini_api_key.strip():
-    gemini_client = genai.Client(api_key=SETTINGS.gemini_api_key)
-else:
-    gemini_client = genai.Client()
+admission = AdmissionLimiter(SETTINGS.api_max_inflight, SETTINGS.api_admission_wait_s)
+# a batch holds one admission slot but fans out generations; this bounds them process-wide
+_batch_generations: Optional[asyncio.Semaphore] = None
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    REQUESTS.inc(endpoint=request.url.path, status="overloaded")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": exc.reason, "stage": exc.stage},
+        headers={"Retry-After": "1"},
+    )
+
+def _counts_errors(endpoint: str):
+    """
+    Counts a handler's unexpected exceptions as status="error" before they propagate
+    (Overloaded is counted by its exception handler; streamed failures by the stream).
+    """
+    def wrap(handler):
+        @functools.wraps(handler)  # keeps the signature FastAPI reads parameters from
+        async def counted(*args, **kwargs):
+            try:
+                return await handler(*args, **kwargs)
+            except Overloaded:
+                raise
+            except Exception:
+                REQUESTS.inc(endpoint=endpoint, status="error")
+                raise
+        return counted
+    return wrap
 
 class AskRequest(BaseModel):
     question: str
     top_k: int = SETTINGS.top_k
     use_mmr: bool = SETTINGS.use_mmr
+    lambda_mult: float = SETTINGS.mmr_lambda
 
-@app.post("/ask")
-def ask(req: AskRequest):
-    t0 = time.time()
-    retrieved = retrieve(store, embedder.embed_query, req.question, req.top_k, req.use_mmr)
-    t1 = time.time()
+class AskBatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=SETTINGS.api_max_batch_questions)
+    top_k: int = SETTINGS.top_k
+    use_mmr: bool = SETTINGS.use_mmr
+    lambda_mult: float = SETTINGS.mmr_lambda
+    generate: bool = True  # False: extractive answers only, no Gemini calls
+
+async def _embed_query(text: str):
+    try:
+        return await asyncio.wait_for(batcher.embed(text), timeout=SETTINGS.retrieval_timeout_s)
+    except asyncio.TimeoutError:
+        raise Overloaded(f"retrieval exceeded {SETTINGS.retrieval_timeout_s}s", stage="retrieval")
+
+async def _answer(question: str, retrieved, use_gemini: bool = True):
+    """
+    (out, generator). Gemini via the async client, bounded by generation_timeout_s;
+    on timeout or any error fall back to the extractive answer.
+    """
+    if use_gemini and gemini_client is not None and retrieved:
+        try:
+            out = await asyncio.wait_for(
+                answer_with_llm_async(question, retrieved, gemini_client, SETTINGS.gemini_model),
+                timeout=SETTINGS.generation_timeout_s
+            )
+            return out, "gemini"
+        except Exception as e:
+            GENERATION_FALLBACKS.inc(reason="timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+    return answer_with_optional_llm(question, retrieved, False, None, SETTINGS.gemini_model), "extractive"
+
+async def _batch_answer(question: str, retrieved, use_gemini: bool):
+    global _batch_generations
+    if _batch_generations is None:
+        _batch_generations = asyncio.Semaphore(max(1, SETTINGS.api_batch_generations))
+    async with _batch_generations:
+        return await _answer(question, retrieved, use_gemini)
+
+def _scope(req) -> tuple:
+    return answer_scope(store, SETTINGS.embedding_model, req.top_k, req.use_mmr, req.lambda_mult, SETTINGS.gemini_model)
+
+def _cache_value(out, retrieved, generation_ms: int):
+    return {
+        "answer": out["answer"],
+        "citations": out["citations"],
+        "retrieved": retrieved,
+        "generation_ms": generation_ms,
+    }
+
+def _profile_requested(header_value: Optional[str]) -> bool:
+    return bool(header_value) and header_value.strip().lower() not in ("0", "false", "no")
+
+def _log_run(question, req, latency, citations, cache_hit: bool, saved_ms: int = 0, prompt_tokens: int = None, spans=None,
+             profile=None) -> None:
+    # queued for the background telemetry writer; no sqlite work on the request path
+    log_run({
+        "ts_ms": now_ms(),
+        "query": question,
+        "top_k": req.top_k,
+        "use_mmr": req.use_mmr,
+        **latency,
+        "citations": json.dumps(citations, ensure_ascii=False),
+        "cache_hit": cache_hit,
+        "saved_ms": saved_ms,
+        "prompt_tokens": prompt_tokens,
+        "spans": spans,
+        "profile": profile,
+    })
 
+@app.post("/ask")
+@_counts_errors("/ask")
+async def ask(req: AskRequest, x_profile: Optional[str] = Header(None, alias=PROFILE_HEADER)):
+    # sampled (PROFILE_SAMPLE_RATE) or requested via the X-Profile header; covers the retrieval work
+    prof = start_profile(_profile_requested(x_profile))
     try:
-        out = answer_with_optional_llm(req.question, retrieved, True, gemini_client, SETTINGS.gemini_model)
-    except Exception:
-        out = answer_with_optional_llm(req.question, retrieved, False, None, SETTINGS.gemini_model)
+        async with admission:
+            with collect_spans() as spans:
+                t0 = time.time()
+                with span("query_embed"):
+                    qv = await _embed_query(req.question)
+                scope = _scope(req)
+                cached = ANSWER_CACHE.lookup(qv, scope)
+                if cached is None:
+                    retrieved = await run_cpu(
+                        "retrieval", SETTINGS.retrieval_timeout_s,
+                        prof.wrap(retrieve) if prof else retrieve,
+                        store, lambda _q: qv, req.question, req.top_k, req.use_mmr, req.lambda_mult
+                    )
+                    t1 = time.time()
+
+                    out, generator = await _answer(req.question, retrieved)
 
-    t2 = time.time()
+                    t2 = time.time()
+                    if generator == "gemini":
+                        ANSWER_CACHE.put(qv, scope, _cache_value(out, retrieved, int((t2 - t1) * 1000)))
+                else:
+                    t1 = t2 = time.time()
+                    out, retrieved = cached[1], cached[1]["retrieved"]
+    except BaseException:
+        if prof is not None:
+            prof.finish()
+        raise
+    profile = prof.finish() if prof else None
+
+    latency = {
+        "retrieval_ms": int((t1 - t0) * 1000),
+        "generation_ms": int((t2 - t1) * 1000),
+        "total_ms": int((t2 - t0) * 1000),
+    }
+    saved_ms = cached[1]["generation_ms"] if cached else 0
+    prompt_tokens = None if cached else (out["prompt_tokens"] or None)
+    _log_run(req.question, req, latency, out["citations"], cached is not None, saved_ms, prompt_tokens, spans, profile)
+    observe_request("/ask", t2 - t0, spans)
 
     return {
         "answer": out["answer"],
         "citations": out["citations"],
         "retrieved": [{"score": s, **it} for s, it in retrieved],
-        "latency_ms": {
-            "retrieval_ms": int((t1 - t0) * 1000),
-            "generation_ms": int((t2 - t1) * 1000),
-            "total_ms": int((t2 - t0) * 1000),
-        }
+        "latency_ms": latency,
+        "stages_ms": {k: round(v, 2) for k, v in spans.items()},
+        "prompt_tokens": prompt_tokens,
+        "context_info": None if cached else out["context_info"],
+        "cache": {"hit": cached is not None, "similarity": cached[0] if cached else None, "saved_ms": saved_ms},
+        "profiled": profile is not None,
+    }
+
+@app.post("/ask/batch")
+@_counts_errors("/ask/batch")
+async def ask_batch(req: AskBatchRequest):
+    """
+    N questions -> one embedding call + one FAISS search (+ batched MMR),
+    then the generations the answer cache can't serve run concurrently
+    (at most API_BATCH_GENERATIONS at a time across all batches).
+    """
+    async with admission:
+        with collect_spans() as spans:
+            t0 = time.time()
+            with span("query_embed"):
+                qvs = await run_cpu("retrieval", SETTINGS.retrieval_timeout_s, embedder.embed_queries, req.questions)
+            retrieved_all = await run_cpu(
+                "retrieval", SETTINGS.retrieval_timeout_s,
+                retrieve_many, store, lambda _qs: qvs, req.questions, req.top_k, req.use_mmr, req.lambda_mult
+            )
+            t1 = time.time()
+
+            scope = _scope(req)
+            cached = [ANSWER_CACHE.lookup(qv, scope) if req.generate else None for qv in qvs]
+            misses = [i for i, c in enumerate(cached) if c is None]
+            # concurrent generations (at most api_batch_generations): the generation span sums them
+            generated = await asyncio.gather(*[
+                _batch_answer(req.questions[i], retrieved_all[i], req.generate) for i in misses
+            ])
+
+            t2 = time.time()
+
+    outs = [c[1] if c else None for c in cached]
+    for i, (out, generator) in zip(misses, generated):
+        outs[i] = out
+        if generator == "gemini":
+            ANSWER_CACHE.put(qvs[i], scope, _cache_value(out, retrieved_all[i], int((t2 - t1) * 1000)))
+
+    results = [{
+        "question": question,
+        "answer": out["answer"],
+        "citations": out["citations"],
+        "retrieved": [{"score": s, **it} for s, it in (c[1]["retrieved"] if c else retrieved)],
+        "cache_hit": c is not None,
+    } for question, retrieved, out, c in zip(req.questions, retrieved_all, outs, cached)]
+
+    latency = {
+        "retrieval_ms": int((t1 - t0) * 1000),
+        "generation_ms": int((t2 - t1) * 1000),
+        "total_ms": int((t2 - t0) * 1000),
+    }
+    # one run per question; latencies and spans are the batch's
+    for r, out, c in zip(results, outs, cached):
+        _log_run(r["question"], req, latency, out["citations"], c is not None,
+                 c[1]["generation_ms"] if c else 0, None if c else (out.get("prompt_tokens") or None), spans)
+    observe_request("/ask/batch", t2 - t0, spans)
+
+    return {
+        "results": results,
+        "latency_ms": latency,
+        "stages_ms": {k: round(v, 2) for k, v in spans.items()},
+    }
+
+class _AdmittedStream(StreamingResponse):
+    """
+    A StreamingResponse that holds an admission slot until the response is over,
+    however it ends: the body generator's own finally never runs if the client
+    leaves before the first chunk is pulled from it.
+    """
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_tokens(question: str, retrieved, context: str):
+    """
+    (generator, text) pairs: Gemini pieces, or one extractive piece if Gemini fails
+    or times out before its first token. Every wait is bounded by generation_timeout_s.
+    context: the packed context from answer_sources().
+    """
+    if gemini_client is not None and retrieved:
+        it = stream_answer_async(question, retrieved, gemini_client, SETTINGS.gemini_model, context).__aiter__()
+        started = False
+        try:
+            while True:
+                piece = await asyncio.wait_for(it.__anext__(), timeout=SETTINGS.generation_timeout_s)
+                started = True
+                yield "gemini", piece
+        except StopAsyncIteration:
+            return
+        except Exception as e:
+            if started:
+                raise
+            GENERATION_FALLBACKS.inc(reason="timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+        finally:
+            await it.aclose()  # also on fallback and early exit: closes the Gemini stream
+    yield "extractive", extractive_answer(question, retrieved) if retrieved else "I don't know."
+
+@app.post("/ask/stream")
+@_counts_errors("/ask/stream")
+async def ask_stream(req: AskRequest, x_profile: Optional[str] = Header(None, alias=PROFILE_HEADER)):
+    """
+    Server-Sent Events:
+      retrieval  {retrieved, citations, retrieval_ms}   as soon as retrieve() returns
+      token      {text}                                  per generated piece (one piece on a cache hit)
+      done       {answer, generator, latency_ms}         incl. ttft_ms; generator "cache" on a hit
+      error      {detail}                                generation failed mid-stream
+    done carries profiled: true when the run was profiled (retrieval + context build).
+    """
+    prof = start_profile(_profile_requested(x_profile))
+    try:
+        await admission.acquire()
+    except BaseException:
+        if prof is not None:
+            prof.finish()
+        raise
+    t0 = time.time()
+    try:
+        with collect_spans() as spans:
+            with span("query_embed"):
+                qv = await _embed_query(req.question)
+            scope = _scope(req)
+            cached = ANSWER_CACHE.lookup(qv, scope)
+            if cached is None:
+                retrieved = await run_cpu(
+                    "retrieval", SETTINGS.retrieval_timeout_s,
+                    prof.wrap(retrieve) if prof else retrieve,
+                    store, lambda _q: qv, req.question, req.top_k, req.use_mmr, req.lambda_mult
+                )
+            else:
+                retrieved = cached[1]["retrieved"]
+    except BaseException:
+        admission.release()
+        if prof is not None:
+            prof.finish()
+        raise
+    t1 = time.time()
+
+    async def pieces(context):
+        if cached is not None:
+            yield "cache", cached[1]["answer"]
+            return
+        async for generator, piece in _stream_tokens(req.question, retrieved, context):
+            yield generator, piece
+
+    async def events():
+        nonlocal prof
+        ttft = None
+        try:
+            # the response streams outside the handler's context, so stages are timed by hand here
+            tc = time.perf_counter()
+            with profiling(prof):
+                src = None if cached else answer_sources(retrieved, req.question)
+            citations = cached[1]["citations"] if cached else src["citations"]
+            spans["context_build"] = (time.perf_counter() - tc) * 1000
+            yield _sse("retrieval", {
+                "retrieved": [{"score": s, **it} for s, it in retrieved],
+                "citations": citations,
+                "retrieval_ms": int((t1 - t0) * 1000),
+            })
+
+            parts, generator = [], "extractive"
+            try:
+                async for generator, piece in pieces(src["context"] if src else None):
+                    if ttft is None:
+                        ttft = time.time()
+                    parts.append(piece)
+                    yield _sse("token", {"text": piece})
+            except Exception as e:
+                generator = "error"
+                yield _sse("error", {"detail": f"generation failed: {type(e).__name__}"})
+            t2 = time.time()
+            if not cached:
+                spans["generation"] = (t2 - t1) * 1000 - spans["context_build"]
+
+            answer = "".join(parts).strip() or "I don't know."
+            latency = {
+                "retrieval_ms": int((t1 - t0) * 1000),
+                "ttft_ms": int(((ttft or t2) - t0) * 1000),
+                "generation_ms": int((t2 - t1) * 1000),
+                "total_ms": int((t2 - t0) * 1000),
+            }
+            prompt_tokens = src["prompt_tokens"] if generator == "gemini" else None
+            profile, prof = (prof.finish() if prof else None), None
+            yield _sse("done", {
+                "answer": answer, "generator": generator, "latency_ms": latency, "prompt_tokens": prompt_tokens,
+                "profiled": profile is not None,
+            })
+
+            if generator == "gemini" and "".join(parts).strip():  # never cache an empty stream
+                ANSWER_CACHE.put(qv, scope, _cache_value(
+                    {"answer": answer, "citations": citations}, retrieved, latency["generation_ms"]
+                ))
+            saved_ms = cached[1]["generation_ms"] if cached else 0
+            _log_run(req.question, req, latency, citations, cached is not None, saved_ms, prompt_tokens, spans, profile)
+            observe_request("/ask/stream", t2 - t0, spans, "error" if generator == "error" else "ok")
+        finally:
+            if prof is not None:  # client went away before "done"
+                prof.finish()
+
+    return _AdmittedStream(
+        events(),
+        admission.release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stats")
+def stats():
+    """
+    In-process counters: admission, query micro-batching (batch-size histogram), caches.
+    """
+    return {
+        "admission": admission.stats(),
+        "embed_batching": batcher.stats() if batcher else None,
+        "answer_cache": ANSWER_CACHE.stats(),
+        "telemetry": WRITER.stats(),
+        "models": loaded_models(),
+        **cache_stats(),
     }
+
+# ---- /metrics ----
+
+INDEX_VECTORS = gauge("rag_index_vectors", "Vectors in the loaded FAISS index.")
+INDEX_INFO = gauge("rag_index_info", "Loaded index build (always 1).", ("version", "type"))
+MODEL_INFO = gauge("rag_model_info", "Loaded models (always 1); generator is gemini or extractive.", ("embedding_model", "gemini_model", "generator"))
+MODEL_LOAD_SECONDS = gauge("rag_model_load_seconds", "Embedding model load and warm-up time in this process.", ("model", "phase"))
+INFLIGHT = gauge("rag_inflight_requests", "Requests holding an admission slot.")
+CACHE_LOOKUPS = counter("rag_cache_lookups_total", "Cache lookups by cache (answer | query_embedding | chunk_embedding) and result.", ("cache", "result"))
+EMBED_BATCHES = counter("rag_embed_batches_total", "Query-embedding micro-batches by size bucket.", ("size",))
+TELEMETRY_QUEUED = gauge("rag_telemetry_queued", "Runs waiting for the telemetry writer.")
+TELEMETRY_DROPPED = counter("rag_telemetry_dropped_total", "Runs dropped because the telemetry queue was full.")
+
+@REGISTRY.on_scrape
+def _scrape_gauges():
+    if store is not None and store.index is not None:
+        INDEX_VECTORS.set(len(store))  # live chunks; ntotal also counts HNSW tombstones
+        INDEX_INFO.clear()
+        INDEX_INFO.set(1, version=store.version, type=store.meta.get("index", {}).get("type", "flat"))
+    MODEL_INFO.clear()
+    MODEL_INFO.set(1, embedding_model=SETTINGS.embedding_model, gemini_model=SETTINGS.gemini_model,
+                   generator="gemini" if gemini_client is not None else "extractive")
+    for model, t in loaded_models().items():
+        MODEL_LOAD_SECONDS.set(t["load_s"], model=model, phase="load")
+        MODEL_LOAD_SECONDS.set(t["warmup_s"], model=model, phase="warmup")
+    INFLIGHT.set(admission.inflight)
+
+    caches = {"answer": ANSWER_CACHE.stats(), **cache_stats()}
+    for cache, name in (("answer", "answer"), ("query_lru", "query_embedding"), ("chunk_disk", "chunk_embedding")):
+        st = caches[cache]
+        if "hits" in st:
+            CACHE_LOOKUPS.set(st["hits"], cache=name, result="hit")
+            CACHE_LOOKUPS.set(st["misses"], cache=name, result="miss")
+
+    if batcher is not None:
+        b = batcher.stats()
+        for size, n in b["histogram"].items():
+            EMBED_BATCHES.set(n, size=size)
+        EMBED_BATCHES.set(b["overflow"], size=f">{BATCH_BUCKETS[-1]}")
+
+    w = WRITER.stats()
+    TELEMETRY_QUEUED.set(w["queued"])
+    TELEMETRY_DROPPED.set(w["dropped"])
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus text format: request counts/latency, per-stage histograms,
+    Gemini fallbacks, cache lookups, index size and loaded models.
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
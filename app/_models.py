@@ -0,0 +1,11 @@
+import streamlit as st
+
+from backend.models import get_embedder
+
+@st.cache_resource(show_spinner="Loading embedding model...")
+def load_embedder(model_name: str):
+    """
+    Embedder shared across reruns and sessions; only the first call per model
+    loads it (see backend/models.py).
+    """
+    return get_embedder(model_name)
@@ -4,11 +4,12 @@ import pandas as pd
 
 from backend.config import SETTINGS
 from backend.utils import ensure_dir
-from backend.loaders import load_pdf_pages
-from backend.chunking import chunk_pages
-from backend.embeddings import Embedder
+from backend.pipeline import index_files, make_chunker
+from backend.chunking import CHUNK_MODES, model_limit_warning
 from backend.vectorstore import FaissStore
+from backend.index_factory import INDEX_TYPES
 from app._bootstrap import bootstrap
+from app._models import load_embedder
 bootstrap()
 
 st.title("Ingest & Build FAISS Index")
@@ -26,6 +27,30 @@ with col2:
 with col3:
     model_name = st.text_input("Embedding model", SETTINGS.embedding_model)
 
+index_options = ["auto", *INDEX_TYPES]
+index_type = st.selectbox(
+    "FAISS index type (auto picks from corpus size)",
+    index_options,
+    index=index_options.index(SETTINGS.index_type) if SETTINGS.index_type in index_options else 0
+)
+
+mode = st.radio(
+    "Mode",
+    ["Add / update these files (incremental)", "Rebuild index from scratch"],
+    horizontal=True,
+    help="Incremental mode only embeds new or changed chunks; other documents stay in the index."
+)
+rebuild = mode.startswith("Rebuild")
+
+chunk_mode = st.radio(
+    "Chunking",
+    CHUNK_MODES,
+    index=CHUNK_MODES.index(SETTINGS.chunk_mode) if SETTINGS.chunk_mode in CHUNK_MODES else 0,
+    horizontal=True,
+    help="tokens: fixed cl100k token windows. sentences: whole sentences packed up to the "
+         "embedding model's own token limit, so nothing is truncated at embed time."
+)
+
 if uploaded:
     st.write("Uploaded files:")
     for f in uploaded:
@@ -40,16 +65,33 @@ if st.button("Build Index", type="primary", disabled=not uploaded):
             out.write(f.getbuffer())
         paths.append(path)
 
-    # Load pages
-    pages = []
-    for path in paths:
-        pages.extend(load_pdf_pages(path))
+    embedder = load_embedder(model_name)
+    limit_msg = model_limit_warning(chunk_mode, chunk_tokens, embedder.token_budget())
+    if limit_msg:
+        st.warning(limit_msg)
+    store = FaissStore(SETTINGS.index_dir)
+    if not rebuild:
+        store.load()
+
+    # Parallel pipeline: PDF extraction (processes) -> chunking -> batched embedding
+    progress = st.progress(0.0, text="Extracting pages...")
 
-    st.write(f"Loaded pages: {len(pages)}")
+    def on_progress(s):
+        done = s["embedded"] / max(1, s["chunks"])
+        progress.progress(min(1.0, done), text=(
+            f"{s['pages']} pages, {s['chunks']} chunks, {s['embedded']} embedded "
+            f"({s['pages_per_s']} pages/s, {s['chunks_per_s']} chunks/s)"
+        ))
 
-    # Chunk
-    chunks = chunk_pages(pages, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
-    st.write(f"Created chunks: {len(chunks)}")
+    chunks, stats = index_files(
+        paths, store, embedder.embed_texts, chunk_tokens, overlap_tokens,
+        rebuild=rebuild, index_type=index_type, on_progress=on_progress,
+        chunker=make_chunker(chunk_mode, chunk_tokens, overlap_tokens, embedder)
+    )
+    progress.progress(1.0, text="Done")
+
+    st.write(f"Loaded pages: {stats['pages']} | Created chunks: {stats['chunks']} | Embedded: {stats['embedded']}")
+    st.write({k: stats[k] for k in ("seconds", "pages_per_s", "chunks_per_s")})
 
     df = pd.DataFrame([{
         "chunk_id": c["chunk_id"],
@@ -61,14 +103,27 @@ if st.button("Build Index", type="primary", disabled=not uploaded):
     st.subheader("Chunk preview")
     st.dataframe(df, use_container_width=True)
 
-    # Embed
-    embedder = Embedder(model_name)
-    texts = [c["text"] for c in chunks]
-    vecs = embedder.embed_texts(texts)
+    if "documents" in stats:
+        st.subheader("Incremental update")
+        st.dataframe(pd.DataFrame(stats["documents"]), use_container_width=True)
 
-    # Build FAISS
-    store = FaissStore(SETTINGS.index_dir)
-    store.build(vecs, chunks)
+    if not chunks:
+        st.error("No text could be extracted from these PDFs.")
+        st.stop()
 
-    st.success("Index built and saved to disk (index/faiss.index + index/meta.json).")
+    st.write("Index:", store.meta["index"])
+    st.success("Index built and saved to disk (index/faiss.index + index/vectors.npy + index/meta_*).")
     st.info("Next: go to “Ask & Explain” and try questions.")
+
+st.subheader("Indexed documents")
+existing = FaissStore(SETTINGS.index_dir)
+if existing.load() and existing.sources():
+    counts = existing.source_counts()
+    st.dataframe(pd.DataFrame({"source": list(counts), "chunks": list(counts.values())}), use_container_width=True)
+
+    to_remove = st.selectbox("Remove a document from the index", existing.sources())
+    if st.button("Remove document"):
+        removed = existing.delete_source(to_remove)
+        st.success(f"Removed {removed} chunks from {to_remove}.")
+else:
+    st.caption("No documents indexed yet.")
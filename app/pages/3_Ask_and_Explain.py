@@ -4,13 +4,15 @@ import time
 import json
 
 from backend.config import SETTINGS
-from backend.embeddings import Embedder
 from backend.vectorstore import FaissStore
 from backend.retriever import retrieve
-from backend.qa import answer_with_optional_llm
-from backend.telemetry import log_run
+from backend.qa import answer_sources, extractive_answer, stream_answer
+from backend.answer_cache import ANSWER_CACHE, answer_scope
+from backend.telemetry import collect_spans, log_run, span
+from backend.profiling import profiling, start_profile
 from backend.utils import now_ms
 from app._bootstrap import bootstrap
+from app._models import load_embedder
 bootstrap()
 
 st.title("Ask & Explain (Retrieval + Citations)")
@@ -30,7 +32,17 @@ with col2:
 with col3:
     embed_model = st.text_input("Embedding model", SETTINGS.embedding_model)
 
+lambda_mult = st.slider(
+    "MMR lambda (1.0 = relevance only, 0.0 = diversity only)",
+    0.0, 1.0, SETTINGS.mmr_lambda, 0.05,
+    disabled=not use_mmr
+)
+
 question = st.text_area("Your question", height=120, placeholder="Ask something from your documents...")
+profile_this = st.checkbox(
+    "Profile this question (cProfile + tracemalloc; see the Profiles page)",
+    help=f"Also sampled automatically for {SETTINGS.profile_sample_rate:.0%} of questions (PROFILE_SAMPLE_RATE)."
+)
 
 use_gemini = True  # We default to Gemini; fallback occurs if key missing
 st.caption("Generator: Gemini (falls back to extractive if no API key detected)")
@@ -41,13 +53,13 @@ gemini_model = SETTINGS.gemini_model
 # Init Gemini client
 # If GEMINI_API_KEY is set in env, genai.Client() will pick it up automatically.
 # You can also pass api_key explicitly.
-from google import genai
-
 gemini_client = None
 use_gemini = False
 
 if SETTINGS.gemini_api_key.strip():
     try:
+        from google import genai  # only imported when a key is configured
+
         gemini_client = genai.Client(api_key=SETTINGS.gemini_api_key)
         use_gemini = True
     except Exception as e:
@@ -59,48 +71,41 @@ else:
 
 # If no key is actually available, requests will fail; we detect that at runtime and fallback.
 if st.button("Ask", type="primary", disabled=not question.strip()):
-    embedder = Embedder(embed_model)
+    embedder = load_embedder(embed_model)
 
+    spans = {}  # per-stage timings (telemetry.span), logged with the run
+    prof = start_profile(profile_this)  # None unless requested or sampled
     t0 = time.time()
-    retrieved = retrieve(
-        store=store,
-        embed_query_fn=embedder.embed_query,
-        query=question,
-        top_k=top_k,
-        use_mmr=use_mmr
-    )
-    t1 = time.time()
-
-    # Try Gemini, fallback if it errors (missing key / quota / etc.)
-    try:
-        out = answer_with_optional_llm(
-                    question=question,
-                    retrieved_items=retrieved,
-                    use_gemini=use_gemini,
-                    gemini_client=gemini_client,
-                    gemini_model=gemini_model
-                )
-    except Exception:
-        out = answer_with_optional_llm(
-            question=question,
-            retrieved_items=retrieved,
-            use_gemini=False,
-            gemini_client=None,
-            gemini_model=gemini_model
-        )
-
-    t2 = time.time()
+    with collect_spans(spans), profiling(prof):
+        with span("query_embed"):
+            qv = embedder.embed_query(question)
+        # Paraphrased repeats under the same index build + settings reuse the earlier answer
+        scope = answer_scope(store, embed_model, top_k, use_mmr, lambda_mult, gemini_model)
+        cached = ANSWER_CACHE.lookup(qv, scope)
+        if cached is None:
+            retrieved = retrieve(
+                store=store,
+                embed_query_fn=lambda _q: qv,
+                query=question,
+                top_k=top_k,
+                use_mmr=use_mmr,
+                lambda_mult=lambda_mult
+            )
+        else:
+            retrieved = cached[1]["retrieved"]
+        t1 = time.time()
 
     retrieval_ms = int((t1 - t0) * 1000)
-    generation_ms = int((t2 - t1) * 1000)
-    total_ms = int((t2 - t0) * 1000)
+    with collect_spans(spans), profiling(prof):
+        src = answer_sources(retrieved, question)
 
+    # Answer streams into this slot; retrieval results below render first
     st.subheader("Answer")
-    st.write(out["answer"])
+    answer_box = st.empty()
 
     st.subheader("Citations (2–3)")
-    if out["citations"]:
-        st.table(pd.DataFrame(out["citations"]))
+    if src["citations"]:
+        st.table(pd.DataFrame(src["citations"]))
     else:
         st.write("No citations available.")
 
@@ -116,15 +121,75 @@ if st.button("Ask", type="primary", disabled=not question.strip()):
         })
     st.dataframe(pd.DataFrame(rows), use_container_width=True)
 
+    timing = {}
+
+    def answer_pieces():
+        if cached is not None:
+            timing["first_token"] = time.time()
+            yield cached[1]["answer"]
+            return
+        # Try Gemini, fallback if it errors (missing key / quota / etc.) before the first token
+        try:
+            for piece in stream_answer(question, retrieved, use_gemini, gemini_client, gemini_model, src["context"]):
+                timing.setdefault("first_token", time.time())
+                timing["has_text"] = timing.get("has_text") or bool(piece.strip())
+                yield piece
+            timing["generator"] = "gemini" if use_gemini and retrieved else "extractive"
+            if not timing.get("has_text"):
+                yield "I don't know."
+        except Exception:
+            if "first_token" in timing:
+                yield "\n\n_(generation interrupted)_"
+                return
+            timing["first_token"] = time.time()
+            yield extractive_answer(question, retrieved) if retrieved else "I don't know."
+
+    with answer_box.container(), collect_spans(spans), profiling(prof):
+        answer = st.write_stream(answer_pieces())
+        if cached is not None:
+            st.caption(f"Answered from the semantic cache (query similarity {cached[0]:.3f}).")
+
+    t2 = time.time()
+    profile = prof.finish() if prof else None
+
+    ttft_ms = int((timing.get("first_token", t2) - t0) * 1000)
+    generation_ms = int((t2 - t1) * 1000)
+    total_ms = int((t2 - t0) * 1000)
+    saved_ms = cached[1]["generation_ms"] if cached else 0
+    prompt_tokens = src["prompt_tokens"] if timing.get("generator") == "gemini" else None
+    if timing.get("generator") == "gemini" and timing.get("has_text"):  # an empty stream is not an answer
+        ANSWER_CACHE.put(qv, scope, {
+            "answer": answer,
+            "citations": src["citations"],
+            "retrieved": retrieved,
+            "generation_ms": generation_ms,
+        })
+
     st.subheader("Context sent to the generator")
-    st.code(out["context"][:6000])
+    info = src["context_info"]
+    st.caption(
+        f"{info['chunks_used']}/{info['chunks_in']} chunks, {info['tokens_used']}/{info['tokens_full']} tokens "
+        f"(budget {info['budget_tokens'] or 'none'}, overlap dropped {info['overlap_tokens_dropped']}, "
+        f"trimmed {info['chunks_trimmed']}) · prompt ≈ {src['prompt_tokens']} tokens"
+    )
+    st.code(src["context"][:6000])
 
     st.subheader("Latency")
     st.write({
         "retrieval_ms": retrieval_ms,
+        "ttft_ms": ttft_ms,
         "generation_ms": generation_ms,
-        "total_ms": total_ms
+        "total_ms": total_ms,
+        "cache_hit": cached is not None,
+        "saved_ms": saved_ms,
+        "prompt_tokens": prompt_tokens,
+        "stages_ms": {k: round(v, 1) for k, v in spans.items()}
     })
+    if profile:
+        st.caption(
+            f"Profiled: peak traced memory {profile['peak_kb'] or 0:.0f} KB. "
+            "Top functions and allocation sites are on the Profiles page."
+        )
 
     # Log run to SQLite
     log_run({
@@ -135,5 +200,11 @@ if st.button("Ask", type="primary", disabled=not question.strip()):
         "retrieval_ms": retrieval_ms,
         "generation_ms": generation_ms,
         "total_ms": total_ms,
-        "citations": json.dumps(out["citations"], ensure_ascii=False)
+        "ttft_ms": ttft_ms,
+        "cache_hit": cached is not None,
+        "saved_ms": saved_ms,
+        "prompt_tokens": prompt_tokens,
+        "spans": spans,
+        "profile": profile,
+        "citations": json.dumps(src["citations"], ensure_ascii=False)
     })
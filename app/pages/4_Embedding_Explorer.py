@@ -1,12 +1,9 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 
 from backend.config import SETTINGS
 from backend.vectorstore import FaissStore
-from backend.embeddings import Embedder
-
-import umap
+from backend.projection import PCA_DIMS, cached_projection, project
 
 st.title("Embedding Space Explorer (UMAP)")
 
@@ -15,48 +12,32 @@ if not store.load():
     st.warning("No index found. Build one first.")
     st.stop()
 
-items = store.meta["items"]
-N_total = len(items)
+N_total = len(store)
 
 st.write(f"Chunks in index: {N_total}")
+if N_total < 5:
+    st.error("Not enough chunks to run UMAP. Ingest a bigger PDF or more documents (need at least ~5 chunks).")
+    st.stop()
 
-max_points = st.slider("Max chunks to plot (for speed)", 50, 3000, min(800, N_total), step=50)
-subset = items[:max_points]
-N = len(subset)
-
-embed_model = st.text_input("Embedding model", SETTINGS.embedding_model)
-embedder = Embedder(embed_model)
+lo = min(50, N_total)
+max_points = st.slider("Max chunks to plot (sampled across sources)", lo, max(lo + 1, min(10000, N_total)),
+                       min(800, N_total), step=50 if lo == 50 else 1)
 
 # UMAP controls
-requested_neighbors = st.slider("UMAP n_neighbors", 2, 50, 15, 1)
+n_neighbors = st.slider("UMAP n_neighbors", 2, 50, 15, 1)
 min_dist = st.slider("UMAP min_dist", 0.0, 0.99, 0.1, 0.01)
 
-if st.button("Generate 2D Map", type="primary"):
-    if N < 5:
-        st.error("Not enough chunks to run UMAP. Ingest a bigger PDF or more documents (need at least ~5 chunks).")
-        st.stop()
-
-    # Embed chunk texts
-    texts = [c["text"] for c in subset]
-    vecs = embedder.embed_texts(texts)
-
-    # ✅ Make UMAP safe for small N
-    # n_neighbors must be < N
-    n_neighbors = min(requested_neighbors, max(2, N - 1))
-
-    # For very small N, spectral init can fail. Use random init.
-    init_mode = "random" if N < 20 else "spectral"
-
-    reducer = umap.UMAP(
-        n_neighbors=n_neighbors,
-        min_dist=min_dist,
-        metric="cosine",
-        init=init_mode,
-        random_state=42
-    )
+# vectors come from the index (no re-embedding); maps are saved per index version + parameters
+proj = cached_projection(store, n_neighbors, min_dist, max_points)
+if proj is None and st.button("Generate 2D Map", type="primary"):
+    with st.spinner("Projecting stored vectors..."):
+        proj = project(store, n_neighbors, min_dist, max_points)
 
-    xy = reducer.fit_transform(vecs)
+if proj is not None:
+    import plotly.express as px
 
+    subset = store.get_items(proj["ids"])
+    xy = proj["xy"]
     df = pd.DataFrame({
         "x": xy[:, 0],
         "y": xy[:, 1],
@@ -70,8 +51,14 @@ if st.button("Generate 2D Map", type="primary"):
         df, x="x", y="y",
         hover_data=["chunk_id", "source", "page", "preview"],
         color="source",
-        title=f"Chunk Embeddings in 2D (UMAP) | N={N}, n_neighbors={n_neighbors}, init={init_mode}"
+        title=f"Chunk Embeddings in 2D (UMAP) | N={len(df)}, n_neighbors={proj['n_neighbors']}"
+              + (f", PCA {PCA_DIMS}d" if proj["pca"] else "")
     )
     st.plotly_chart(fig, use_container_width=True)
+    st.caption({
+        "cached": "Saved map for this index version.",
+        "transformed": f"Saved map; {proj['new']} chunk(s) added since were placed without refitting ({proj['seconds']} s).",
+        "fitted": f"UMAP fitted and saved ({proj['seconds']} s).",
+    }[proj["mode"]])
 
 st.info("If UMAP fails, it’s usually because there are too few chunks. Upload more PDFs or lower max_points / neighbors.")
@@ -1,15 +1,16 @@
+import glob
 import json
+import os
 import streamlit as st
 import pandas as pd
 
-from google import genai
-
 from backend.config import SETTINGS
 from backend.vectorstore import FaissStore
-from backend.embeddings import Embedder
-from backend.retriever import retrieve
+from backend.retriever import retrieve_many
 from backend.qa import answer_with_optional_llm
-from backend.eval import run_eval
+from backend.eval import TokenBucket, run_eval_parallel, evaluate_retrieval
+from backend.sweep import SWEEP_REPORT_FILE, parse_configs, sweep_chunking
+from app._models import load_embedder
 
 st.title("Evaluation (Accuracy + Failure Analysis)")
 
@@ -29,11 +30,154 @@ Upload an eval set JSON in this format:
 
 Note: This page uses a simple, transparent scoring rule:
 - Score = 1 if the expected phrase appears in the model answer (case-insensitive), else 0.
+
+Retrieval-only mode scores the retrieved chunks instead (no generation, no Gemini quota).
+A chunk is relevant if it matches, in this order of precedence:
+`"chunk_ids": [...]`, `"source": "file.pdf"` (+ optional `"page": 3` or `[3, 4]`),
+or contains the `"expected"` phrase.
+
+Chunking sweep uses the same scoring to compare chunk size / overlap settings on the PDFs in data/,
+each with its own temporary index.
 """
 )
 
 eval_file = st.file_uploader("Upload eval_set.json", type=["json"])
 
+def load_items():
+    try:
+        items = json.loads(eval_file.getvalue().decode("utf-8"))
+    except Exception:
+        st.error("Could not parse eval_set.json. Make sure it is valid JSON.")
+        st.stop()
+    if not isinstance(items, list) or len(items) == 0:
+        st.error("Invalid eval_set.json. It must be a non-empty list of objects.")
+        st.stop()
+    return items
+
+mode = st.radio(
+    "Mode",
+    ["Full (retrieval + generation)", "Retrieval only (hit rate@k / MRR / nDCG)", "Chunking sweep"],
+    horizontal=True
+)
+
+# ----------------------------
+# Chunking parameter sweep
+# ----------------------------
+if mode == "Chunking sweep":
+    pdfs = sorted(glob.glob(os.path.join("data", "*.pdf")))
+    indexed = set(store.sources())
+    col1, col2 = st.columns(2)
+    with col1:
+        sweep_paths = st.multiselect("PDFs (data/)", pdfs, default=[p for p in pdfs if os.path.basename(p) in indexed] or pdfs,
+                                     format_func=os.path.basename)
+        configs_text = st.text_input(
+            "Configs (chunk_tokens/overlap, comma-separated; prefix sentences: for sentence mode)",
+            f"250/50, {SETTINGS.chunk_tokens}/{SETTINGS.chunk_overlap}, 600/100"
+        )
+    with col2:
+        ks = st.multiselect("k values", list(range(1, 21)), default=[1, 3, 5, 10])
+        embed_model = st.text_input("Embedding model", SETTINGS.embedding_model)
+
+    if st.button("Run sweep", type="primary", disabled=not eval_file or not sweep_paths or not ks):
+        eval_items = load_items()
+        try:
+            configs = parse_configs(configs_text, SETTINGS.chunk_mode)
+        except ValueError as e:
+            st.error(f"Invalid configs: {e}")
+            st.stop()
+        if not configs:
+            st.error("Enter at least one chunk_tokens/overlap config.")
+            st.stop()
+
+        embedder = load_embedder(embed_model)
+        bar = st.progress(0.0, text="Extracting pages...")
+
+        def on_progress(p):
+            bar.progress(p["done"] / max(1, p["total"]),
+                         text=f"{p['stage']}: {p['done']} / {p['total']} ({p['elapsed_s']:.0f} s)")
+
+        st.session_state["sweep_report"] = sweep_chunking(
+            sweep_paths, configs, embedder.embed_texts, embedder.embed_queries, eval_items, ks,
+            embedder=embedder, out_dir="outputs", on_progress=on_progress
+        )
+        bar.progress(1.0, text="Done")
+
+    report = st.session_state.get("sweep_report")
+    if report is not None:
+        st.subheader("Summary")
+        st.write({"pages": report["pages"], "extract_s": report["extract_s"], **report.get("embedding", {}),
+                  "questions_scored": report["eval"]["n"], "skipped_unannotated": report["eval"]["skipped"],
+                  "elapsed_s": report["elapsed_s"]})
+        if report["rows"]:
+            df = pd.DataFrame(report["rows"]).set_index("config")
+            cols = [c for c in ("chunks", "avg_tokens", "new_texts", "chunk_s", "build_s", "index_mb",
+                                "retrieve_p50_ms", "retrieve_p95_ms") if c in df]
+            metric_cols = [c for c in df.columns if "@" in c]
+            st.dataframe(df[cols + metric_cols], use_container_width=True)
+            if metric_cols:
+                import plotly.express as px
+
+                default = f"hit_rate@{max(report['ks'])}"
+                metric = st.selectbox("Accuracy metric", metric_cols,
+                                      index=metric_cols.index(default) if default in metric_cols else 0)
+                fig = px.scatter(df.reset_index(), x="index_mb", y=metric, size="chunks", color="config",
+                                 hover_data=["retrieve_p50_ms", "build_s"], title=f"{metric} vs index size")
+                st.plotly_chart(fig, use_container_width=True)
+        st.caption("new_texts: chunk texts no earlier config produced (each distinct text is embedded once). "
+                   f"Saved to outputs/{SWEEP_REPORT_FILE}")
+    st.stop()
+
+# ----------------------------
+# Retrieval-only evaluation
+# ----------------------------
+if mode.startswith("Retrieval"):
+    col1, col2 = st.columns(2)
+    with col1:
+        ks = st.multiselect("k values", list(range(1, 21)), default=[1, 3, 5, 10])
+        embed_model = st.text_input("Embedding model", SETTINGS.embedding_model)
+    with col2:
+        include_plain = st.toggle("Plain similarity ranking", value=True)
+        lambdas_text = st.text_input("MMR lambda sweep (comma-separated, empty = no MMR)", "0.3, 0.5, 0.7")
+
+    if st.button("Run retrieval eval", type="primary", disabled=not eval_file or not ks):
+        eval_items = load_items()
+        try:
+            lambdas = [float(x) for x in lambdas_text.split(",") if x.strip()]
+            if any(not 0.0 <= lam <= 1.0 for lam in lambdas):
+                raise ValueError
+        except ValueError:
+            st.error("MMR lambdas must be numbers between 0 and 1.")
+            st.stop()
+        lambdas = ([None] if include_plain else []) + lambdas
+
+        embedder = load_embedder(embed_model)
+        with st.spinner("Embedding all questions and searching in one batch..."):
+            # kept in session state so switching the metric below doesn't rerun the eval
+            st.session_state["retrieval_report"] = evaluate_retrieval(
+                store, embedder.embed_queries, eval_items, ks, lambdas, out_dir="outputs"
+            )
+
+    report = st.session_state.get("retrieval_report")
+    if report is not None:
+        st.subheader("Summary")
+        st.write({"questions_scored": report["n"], "skipped_unannotated": report["skipped"],
+                  "elapsed_s": report["elapsed_s"]})
+        if report["rows"]:
+            df = pd.DataFrame(report["rows"])
+            df["run"] = df.apply(lambda r: "similarity" if r["mode"] == "similarity" else f"mmr λ={r['lambda_mult']:g}", axis=1)
+            import plotly.express as px
+
+            metric = st.radio("Metric", ["hit_rate", "mrr", "ndcg", "precision"], horizontal=True)
+            st.plotly_chart(px.line(df, x="k", y=metric, color="run", markers=True, title=f"{metric}@k"),
+                            use_container_width=True)
+            st.dataframe(df.pivot_table(index="run", columns="k", values=metric), use_container_width=True)
+            st.dataframe(df[["run", "k", "hit_rate", "mrr", "ndcg", "precision"]], use_container_width=True, hide_index=True)
+        if report["misses"]:
+            st.subheader(f"Missed questions ({len(report['misses'])}, similarity ranking, top {max(report['ks'])})")
+            st.dataframe(pd.DataFrame(report["misses"]).head(50), use_container_width=True)
+        st.caption("Saved to outputs/retrieval_eval.json")
+    st.stop()
+
 col1, col2, col3 = st.columns(3)
 with col1:
     top_k = st.slider("Top-K", 3, 12, SETTINGS.top_k, 1)
@@ -42,6 +186,15 @@ with col2:
 with col3:
     embed_model = st.text_input("Embedding model", SETTINGS.embedding_model)
 
+col4, col5, col6 = st.columns(3)
+with col4:
+    workers = st.number_input("Worker threads", 1, 64, SETTINGS.eval_workers)
+with col5:
+    gemini_rps = st.number_input("Gemini requests / s (0 = unlimited)", 0.0, 100.0, SETTINGS.eval_gemini_rps, 0.5)
+with col6:
+    resume = st.toggle("Resume from checkpoint", value=True,
+                       help="Skip questions already answered with these settings (outputs/eval_checkpoint.jsonl).")
+
 # ----------------------------
 # Gemini client init (safe)
 # ----------------------------
@@ -51,6 +204,8 @@ gemini_model = SETTINGS.gemini_model
 
 if SETTINGS.gemini_api_key.strip():
     try:
+        from google import genai
+
         gemini_client = genai.Client(api_key=SETTINGS.gemini_api_key)
         use_gemini = True
         st.caption(f"Generator: Gemini enabled ({gemini_model})")
@@ -64,25 +219,15 @@ else:
 # Run evaluation
 # ----------------------------
 if st.button("Run Evaluation", type="primary", disabled=not eval_file):
-    try:
-        eval_items = json.loads(eval_file.getvalue().decode("utf-8"))
-        if not isinstance(eval_items, list) or len(eval_items) == 0:
-            st.error("Invalid eval_set.json. It must be a non-empty list of objects.")
-            st.stop()
-    except Exception:
-        st.error("Could not parse eval_set.json. Make sure it is valid JSON.")
-        st.stop()
+    eval_items = load_items()
 
-    embedder = Embedder(embed_model)
+    embedder = load_embedder(embed_model)
 
-    def ask_fn(q: str):
-        retrieved = retrieve(
-            store=store,
-            embed_query_fn=embedder.embed_query,
-            query=q,
-            top_k=top_k,
-            use_mmr=use_mmr
-        )
+    def retrieve_batch(questions):
+        # one embedding call + one FAISS search for the whole batch
+        return retrieve_many(store, embedder.embed_queries, questions, top_k, use_mmr)
+
+    def answer_fn(q: str, retrieved):
         return answer_with_optional_llm(
             question=q,
             retrieved_items=retrieved,
@@ -91,10 +236,41 @@ if st.button("Run Evaluation", type="primary", disabled=not eval_file):
             gemini_model=gemini_model
         )
 
-    report = run_eval(eval_items, ask_fn, out_dir="outputs")
+    bar = st.progress(0.0, text="Starting...")
+    status = st.empty()
+
+    def on_progress(p):
+        bar.progress(p["done"] / max(1, p["total"]), text=f"{p['done']} / {p['total']} questions")
+        remaining = p["total"] - p["done"]
+        eta = f"{remaining / p['qps']:.0f} s" if p["qps"] > 0 else "…"
+        status.caption(
+            f"{p['qps']:.2f} questions/s · {p['elapsed_s']:.0f} s elapsed · ETA {eta} · "
+            f"resumed {p['resumed']} · errors {p['errors']}"
+        )
+
+    report = run_eval_parallel(
+        eval_items, retrieve_batch, answer_fn, out_dir="outputs",
+        run_config={
+            "index": store.version, "embedding_model": embed_model, "top_k": top_k, "use_mmr": use_mmr,
+            "generator": gemini_model if use_gemini else "extractive",
+        },
+        workers=int(workers),
+        batch_size=SETTINGS.eval_batch_size,
+        limiter=TokenBucket(gemini_rps, SETTINGS.eval_gemini_burst) if use_gemini else None,
+        resume=resume,
+        on_progress=on_progress,
+    )
 
     st.subheader("Summary")
-    st.write({"n": report["n"], "accuracy": report["accuracy"]})
+    st.write({
+        "n": report["n"],
+        "accuracy": report["accuracy"],
+        "errors": report["errors"],
+        "resumed_from_checkpoint": report["resumed"],
+        "throughput_qps": report["throughput_qps"],
+    })
+    if report["errors"]:
+        st.warning(f"{report['errors']} question(s) failed; run again with resume on to retry only those.")
 
     df = pd.DataFrame(report["results"])
 
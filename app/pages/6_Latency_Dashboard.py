@@ -2,31 +2,96 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
-from backend.telemetry import fetch_runs
+from backend.telemetry import fetch_runs, fetch_spans, fetch_rollups, rollup_granularity, RUN_COLUMNS, SPAN_NAMES
+from backend.rollups import ROLLUP_COLUMNS, RUN_STAGES
+from backend.utils import now_ms
+from backend.embed_cache import cache_stats
+from backend.answer_cache import ANSWER_CACHE
 from app._bootstrap import bootstrap
 bootstrap()
 
 st.title("Latency & Observability")
 
-rows = fetch_runs(limit=200)
+RANGES_MS = {"Last hour": 3_600_000, "Last 24 hours": 86_400_000, "Last 7 days": 7 * 86_400_000, "Last 30 days": 30 * 86_400_000}
+range_label = st.selectbox("Time range", list(RANGES_MS), index=1)
+end_ms = now_ms()
+start_ms = end_ms - RANGES_MS[range_label]
+granularity = rollup_granularity(start_ms, end_ms)
+
+# ---- rollups: percentiles over the whole range, from pre-aggregated buckets ----
+
+rollup_rows = fetch_rollups(start_ms, end_ms, granularity)
+if rollup_rows:
+    ru = pd.DataFrame(rollup_rows, columns=list(ROLLUP_COLUMNS))
+    ru["ts"] = pd.to_datetime(ru["bucket_ms"], unit="ms")
+    st.subheader(f"Requests per {granularity}")
+    totals = ru[ru["stage"] == "total"]
+    st.plotly_chart(px.bar(totals, x="ts", y="count", title=f"Runs per {granularity}"), use_container_width=True)
+    st.caption(f"{int(totals['count'].sum())} runs in range")
+
+    stage_order = list(RUN_STAGES) + list(SPAN_NAMES)
+    present = [s for s in stage_order if s in set(ru["stage"])]
+    stage = st.selectbox("Stage", present, index=0)
+    one = ru[ru["stage"] == stage].melt(id_vars=["ts"], value_vars=["p50_ms", "p95_ms", "p99_ms"],
+                                        var_name="percentile", value_name="ms")
+    st.plotly_chart(px.line(one, x="ts", y="ms", color="percentile", title=f"{stage} latency per {granularity}"),
+                    use_container_width=True)
+    st.caption("Percentiles come from log-scale histograms (10% bins) kept per bucket.")
+
+rows = fetch_runs(limit=200, start_ms=start_ms, end_ms=end_ms)
 if not rows:
-    st.info("No runs logged yet. Ask a few questions first.")
+    st.info("No runs logged in this range. Ask a few questions first.")
     st.stop()
 
-df = pd.DataFrame(rows, columns=[
-    "ts_ms", "query", "top_k", "use_mmr", "retrieval_ms", "generation_ms", "total_ms", "citations"
-])
+df = pd.DataFrame(rows, columns=list(RUN_COLUMNS))
 df["ts"] = pd.to_datetime(df["ts_ms"], unit="ms")
 
-st.subheader("Recent runs")
-st.dataframe(df[["ts", "query", "top_k", "use_mmr", "retrieval_ms", "generation_ms", "total_ms"]], use_container_width=True)
+st.subheader("Recent runs (latest 200 in range)")
+st.dataframe(df[["ts", "query", "top_k", "use_mmr", "retrieval_ms", "ttft_ms", "generation_ms", "total_ms", "prompt_tokens", "cache_hit"]], use_container_width=True)
+
+cached_runs = df.dropna(subset=["cache_hit"])
+if not cached_runs.empty:
+    st.subheader("Semantic answer cache")
+    c1, c2 = st.columns(2)
+    c1.metric("Hit rate (recent runs)", f"{cached_runs['cache_hit'].mean():.0%}")
+    c2.metric("Generation time saved", f"{int(cached_runs['saved_ms'].fillna(0).sum())} ms")
 
 st.subheader("Latency distribution (total_ms)")
 fig1 = px.histogram(df, x="total_ms", nbins=25, title="Total latency distribution")
 st.plotly_chart(fig1, use_container_width=True)
 
+streamed = df.dropna(subset=["ttft_ms"])
+if not streamed.empty:
+    st.subheader("Time to first token (streamed runs)")
+    fig_ttft = px.histogram(streamed, x="ttft_ms", nbins=25, title="TTFT distribution (from question submit)")
+    st.plotly_chart(fig_ttft, use_container_width=True)
+
+prompted = df.dropna(subset=["prompt_tokens"])
+if not prompted.empty:
+    st.subheader("Prompt size vs generation latency")
+    fig_prompt = px.scatter(prompted, x="prompt_tokens", y="generation_ms", title="Generation latency by prompt tokens")
+    st.plotly_chart(fig_prompt, use_container_width=True)
+    st.caption(f"Mean prompt: {prompted['prompt_tokens'].mean():.0f} tokens (budget: CONTEXT_TOKENS_PER_CHUNK x top_k, or CONTEXT_TOKEN_BUDGET)")
+
+span_rows = fetch_spans(limit=200, start_ms=start_ms, end_ms=end_ms)
+if span_rows:
+    st.subheader("Per-stage latency (recent runs)")
+    spans = pd.DataFrame(span_rows, columns=["ts_ms", "stage", "ms"])
+    stage_stats = spans.groupby("stage")["ms"].describe(percentiles=[0.5, 0.95])[["count", "mean", "50%", "95%"]]
+    order = [s for s in SPAN_NAMES if s in stage_stats.index]
+    stage_stats = stage_stats.reindex(order + [s for s in stage_stats.index if s not in order])
+    st.dataframe(stage_stats.rename(columns={"50%": "p50_ms", "95%": "p95_ms", "mean": "mean_ms"}).round(2),
+                 use_container_width=True)
+    fig_stages = px.box(spans, x="stage", y="ms", category_orders={"stage": list(stage_stats.index)},
+                        title="Stage latency distribution")
+    st.plotly_chart(fig_stages, use_container_width=True)
+
 st.subheader("Latency over time")
 fig2 = px.line(df.sort_values("ts"), x="ts", y="total_ms", title="Total latency over time")
 st.plotly_chart(fig2, use_container_width=True)
 
+st.subheader("Embedding + answer caches (this app process)")
+stats = {**cache_stats(), "answers": ANSWER_CACHE.stats()}
+st.dataframe(pd.DataFrame.from_dict(stats, orient="index"), use_container_width=True)
+
 st.caption("In production, you’d also log token usage, cache hits, and model response times.")
@@ -0,0 +1,67 @@
+import streamlit as st
+import pandas as pd
+
+from backend.config import SETTINGS
+from backend.telemetry import fetch_profiled_runs, fetch_profile, PROFILED_RUN_COLUMNS, SPAN_NAMES
+from app._bootstrap import bootstrap
+bootstrap()
+
+st.title("Request Profiles")
+st.caption(
+    f"Runs profiled with cProfile + tracemalloc: {SETTINGS.profile_sample_rate:.0%} sampled (PROFILE_SAMPLE_RATE), "
+    "plus any asked with “Profile this question” or the X-Profile API header."
+)
+
+rows = fetch_profiled_runs(limit=200)
+if not rows:
+    st.info("No profiled runs yet. Tick “Profile this question” on Ask & Explain, or send X-Profile: 1 to the API.")
+    st.stop()
+
+runs = pd.DataFrame(rows, columns=list(PROFILED_RUN_COLUMNS))
+runs["ts"] = pd.to_datetime(runs["ts_ms"], unit="ms")
+st.subheader("Profiled runs (slowest first)")
+st.dataframe(runs[["run_id", "ts", "query", "total_ms", "retrieval_ms", "generation_ms", "peak_kb"]],
+             use_container_width=True, hide_index=True)
+
+labels = {
+    r.run_id: f"#{r.run_id} · {r.total_ms} ms · {r.ts:%Y-%m-%d %H:%M:%S} · {str(r.query)[:60]}"
+    for r in runs.itertuples()
+}
+run_id = st.selectbox("Run", list(labels), format_func=labels.get)
+prof = fetch_profile(int(run_id))
+if prof is None:
+    st.warning("Profile not found (it may have been compacted away).")
+    st.stop()
+
+c1, c2, c3 = st.columns(3)
+c1.metric("Profiled wall time", f"{prof['wall_ms']:.0f} ms")
+c2.metric("Peak traced memory", f"{prof['peak_kb']:.0f} KB" if prof["peak_kb"] is not None else "n/a")
+c3.metric("Functions recorded", len(prof["functions"]))
+
+if prof["spans"]:
+    import plotly.express as px
+
+    spans = pd.DataFrame(list(prof["spans"].items()), columns=["stage", "ms"])
+    order = [s for s in SPAN_NAMES if s in set(spans["stage"])]
+    fig = px.bar(spans, x="ms", y="stage", orientation="h", category_orders={"stage": order}, title="Stages of this run")
+    st.plotly_chart(fig, use_container_width=True)
+
+st.subheader("Top functions")
+funcs = pd.DataFrame(prof["functions"])
+if funcs.empty:
+    st.write("No function calls recorded.")
+else:
+    sort_by = st.radio("Sort by", ["cumtime_ms", "tottime_ms", "ncalls"], horizontal=True)
+    only_project = st.toggle("Project code only (backend/, app/)", value=False)
+    if only_project:
+        funcs = funcs[funcs["function"].str.contains(r"[/\\](?:backend|app)[/\\]", regex=True)]
+    st.dataframe(funcs.sort_values(sort_by, ascending=False).head(50), use_container_width=True, hide_index=True)
+    st.caption("cumtime includes callees, tottime doesn't. Only retrieval / context build / generation sections are profiled.")
+
+st.subheader("Allocation sites")
+allocs = pd.DataFrame(prof["allocations"])
+if allocs.empty:
+    st.write("No allocation data (PROFILE_TRACEMALLOC=false, or nothing retained).")
+else:
+    st.dataframe(allocs, use_container_width=True, hide_index=True)
+    st.caption("Memory still held at the end of the request, by allocating line (vs. the start of the request).")
@@ -0,0 +1,138 @@
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import threading
+import time
+import numpy as np
+import faiss
+
+from .config import SETTINGS
+
+def answer_scope(store, embedding_model: str, top_k: int, use_mmr: bool, lambda_mult: float, gemini_model: str) -> Tuple:
+    """
+    Cached answers are only reused under the same index build and retrieval /
+    generation settings; anything else changes which chunks (and answer) we'd get.
+    """
+    return (store.version, embedding_model, int(top_k), bool(use_mmr), round(float(lambda_mult), 4), gemini_model)
+
+class SemanticAnswerCache:
+    """
+    Response cache looked up by query embedding rather than query text, so
+    paraphrased repeats hit. A lookup hits when a cached query in the same scope
+    has cosine similarity >= threshold (inner product of normalized vectors).
+
+    Each scope has its own small exact index (IndexIDMap over IndexFlatIP).
+    Entries expire after ttl_s; past max_entries the least recently used is evicted.
+    Thread-safe.
+    """
+    def __init__(self, max_entries: int, threshold: float, ttl_s: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self._indexes: Dict[Hashable, faiss.Index] = {}
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # id -> {scope, ts, value}, LRU order
+        self._by_age: "OrderedDict[int, float]" = OrderedDict()  # id -> ts, insertion (= expiry) order
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.saved_ms = 0
+
+    def _remove(self, eid: int) -> None:
+        entry = self._entries.pop(eid)
+        del self._by_age[eid]
+        index = self._indexes[entry["scope"]]
+        index.remove_ids(np.array([eid], dtype="int64"))
+        if index.ntotal == 0:
+            del self._indexes[entry["scope"]]
+
+    def _expire(self, now: float) -> None:
+        # ts is never refreshed, so insertion order is expiry order (unlike the
+        # LRU order of _entries, which hits reshuffle)
+        while self._by_age:
+            eid, ts = next(iter(self._by_age.items()))
+            if now - ts <= self.ttl_s:
+                break
+            self._remove(eid)
+            self.expired += 1
+
+    def lookup(self, qvec: np.ndarray, scope: Hashable) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """
+        (similarity, cached value) for the closest live entry above threshold, else None.
+        """
+        if self.max_entries <= 0:
+            return None
+        q = np.ascontiguousarray(qvec, dtype="float32").reshape(1, -1)
+        with self._lock:
+            now = time.time()
+            index = self._indexes.get(scope)
+            if index is not None and index.ntotal:
+                sims, ids = index.search(q, min(4, index.ntotal))
+                for sim, eid in zip(sims[0], ids[0]):
+                    if eid < 0 or sim < self.threshold:
+                        break
+                    entry = self._entries.get(int(eid))
+                    if entry is None:
+                        continue
+                    if now - entry["ts"] > self.ttl_s:
+                        self._remove(int(eid))
+                        self.expired += 1
+                        continue
+                    self._entries.move_to_end(int(eid))
+                    self.hits += 1
+                    self.saved_ms += int(entry["value"].get("generation_ms", 0))
+                    return float(sim), entry["value"]
+            self.misses += 1
+            return None
+
+    def put(self, qvec: np.ndarray, scope: Hashable, value: Dict[str, Any]) -> None:
+        """
+        value: whatever the caller needs to replay the response; its "generation_ms"
+        is what a later hit reports as saved.
+        """
+        if self.max_entries <= 0:
+            return
+        q = np.ascontiguousarray(qvec, dtype="float32").reshape(1, -1)
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            index = self._indexes.get(scope)
+            if index is None:
+                index = faiss.IndexIDMap(faiss.IndexFlatIP(q.shape[1]))
+                self._indexes[scope] = index
+            eid = self._next_id
+            self._next_id += 1
+            index.add_with_ids(q, np.array([eid], dtype="int64"))
+            self._entries[eid] = {"scope": scope, "ts": now, "value": value}
+            self._by_age[eid] = now
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
+            self._by_age.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "scopes": len(self._indexes),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "saved_generation_ms": self.saved_ms,
+            }
+
+ANSWER_CACHE = SemanticAnswerCache(
+    SETTINGS.answer_cache_size, SETTINGS.answer_cache_threshold, SETTINGS.answer_cache_ttl_s
+)
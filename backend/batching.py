@@ -0,0 +1,99 @@
+"""
+Dynamic micro-batching of query embeddings for the API server.
+
+Concurrent requests each need one query vector; encoding them one at a time
+wastes most of a CPU forward pass. QueryMicroBatcher collects queries that
+arrive within a short window (or until max_batch are waiting), encodes them in
+one embed_queries call on the CPU executor and hands each caller its own row.
+
+When no batch is being encoded, a query is flushed right away, so a lightly
+loaded server pays no window latency. Queries that arrive while the encoder is
+busy accumulate until it finishes, the window expires, or max_batch is reached.
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from .serving import cpu_executor
+
+# upper bounds of the batch-size histogram buckets
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+class QueryMicroBatcher:
+    """
+        batcher = QueryMicroBatcher(embedder.embed_queries, window_ms=3, max_batch=32)
+        qv = await batcher.embed("question")   # (1, d)
+
+    window_ms <= 0 or max_batch <= 1 disables batching (one encode per call).
+    """
+    def __init__(self, embed_queries_fn: Callable[[List[str]], np.ndarray], window_ms: float, max_batch: int):
+        self.embed_queries_fn = embed_queries_fn
+        self.window_s = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = 0  # batches currently encoding
+        self.batches = 0
+        self.items = 0
+        self.histogram = {b: 0 for b in BATCH_BUCKETS}
+        self.overflow = 0  # batches larger than the last bucket
+
+    async def embed(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch or self.window_s <= 0 or self._running == 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self._record(len(batch))
+            self._running += 1
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            vecs = await loop.run_in_executor(cpu_executor(), self.embed_queries_fn, [t for t, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self._running -= 1
+            # encoder free again: whatever queued meanwhile goes now
+            if self._pending and self._running == 0:
+                self._flush()
+        for i, (_, fut) in enumerate(batch):
+            if not fut.done():  # caller may have timed out
+                fut.set_result(vecs[i:i + 1])
+
+    def _record(self, size: int) -> None:
+        self.batches += 1
+        self.items += size
+        for b in BATCH_BUCKETS:
+            if size <= b:
+                self.histogram[b] += 1
+                return
+        self.overflow += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": round(self.window_s * 1000, 3),
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pending),
+            # batches per size bucket, keyed by the bucket's upper bound
+            "histogram": {f"<={b}": n for b, n in self.histogram.items()},
+            "overflow": self.overflow,
+        }
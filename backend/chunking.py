@@ -1,13 +1,52 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Callable, Optional
+from functools import lru_cache
+import hashlib
+import math
+import os
+import re
 import tiktoken
 
+CHUNK_MODES = ("tokens", "sentences")
+
+# sentence ends, or blank lines (headings / bullet blocks in PDFs rarely end with punctuation)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+@lru_cache(maxsize=None)
 def _get_encoder():
     # 'cl100k_base' works well for GPT-style tokenization.
+    # Cached once per process: tiktoken's own registry lookup takes a lock every call.
     return tiktoken.get_encoding("cl100k_base")
 
+def _num_threads() -> int:
+    return min(8, os.cpu_count() or 1)
+
+def chunk_id_for(source: str, page: int, text: str) -> str:
+    """
+    Stable content-hash chunk id: the same text on the same page of the same source
+    always gets the same id, across builds. 15 hex digits fit a positive int64
+    FAISS id (see backend.vectorstore.faiss_id).
+    """
+    h = hashlib.sha1(f"{source}\x1f{page}\x1f{text}".encode("utf-8")).hexdigest()
+    return "c" + h[:15]
+
 def count_tokens(text: str) -> int:
     enc = _get_encoder()
-    return len(enc.encode(text))
+    return len(enc.encode_ordinary(text))
+
+def token_windows(n_tokens: int, chunk_tokens: int, overlap_tokens: int) -> List[Tuple[int, int]]:
+    """
+    (start, end) token windows covering n_tokens with the given overlap.
+    """
+    step = max(1, chunk_tokens - overlap_tokens)  # overlap >= size would never advance
+    windows = []
+    start = 0
+    while start < n_tokens:
+        end = min(start + chunk_tokens, n_tokens)
+        windows.append((start, end))
+        if end == n_tokens:
+            break
+        start += step
+    return windows
 
 def chunk_text_token_based(
     text: str,
@@ -19,19 +58,9 @@ def chunk_text_token_based(
     Keeps overlap for better cross-boundary retrieval.
     """
     enc = _get_encoder()
-    tokens = enc.encode(text)
-
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = min(start + chunk_tokens, len(tokens))
-        chunk = enc.decode(tokens[start:end]).strip()
-        if chunk:
-            chunks.append(chunk)
-        if end == len(tokens):
-            break
-        start = max(0, end - overlap_tokens)
-    return chunks
+    tokens = enc.encode_ordinary(text)
+    pieces = enc.decode_batch([tokens[s:e] for s, e in token_windows(len(tokens), chunk_tokens, overlap_tokens)])
+    return [p.strip() for p in pieces if p.strip()]
 
 def chunk_pages(
     pages: List[Dict[str, Any]],
@@ -40,22 +69,142 @@ def chunk_pages(
 ) -> List[Dict[str, Any]]:
     """
     Converts PDF pages into chunk objects with metadata.
+    chunk_id is a content hash, so re-chunking unchanged pages yields the same ids.
+
+    Single pass: all pages are encoded in one threaded encode_ordinary_batch call,
+    windows are decoded in one decode_batch call, and token_count is the window
+    length, so no text is encoded twice.
     """
+    if not pages:
+        return []
+    enc = _get_encoder()
+    threads = _num_threads()
+    page_tokens = enc.encode_ordinary_batch([p["text"] for p in pages], num_threads=threads)
+
+    owners, windows = [], []
+    for page_idx, tokens in enumerate(page_tokens):
+        for s, e in token_windows(len(tokens), chunk_tokens, overlap_tokens):
+            owners.append(page_idx)
+            windows.append(tokens[s:e])
+    pieces = enc.decode_batch(windows, num_threads=threads)
+
     all_chunks = []
-    chunk_id = 0
+    seen = set()
 
-    for p in pages:
-        page_text = p["text"]
-        pieces = chunk_text_token_based(page_text, chunk_tokens, overlap_tokens)
+    for page_idx, window, piece in zip(owners, windows, pieces):
+        piece = piece.strip()
+        if not piece:
+            continue
+        p = pages[page_idx]
+        chunk_id = chunk_id_for(p["source"], p["page"], piece)
+        if chunk_id in seen:
+            # identical text on the same page: one copy is enough for retrieval
+            continue
+        seen.add(chunk_id)
+        all_chunks.append({
+            "chunk_id": chunk_id,
+            "source": p["source"],
+            "page": p["page"],
+            "text": piece,
+            "token_count": len(window),
+        })
 
-        for piece in pieces:
-            chunk_id += 1
+    return all_chunks
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_BREAK.split(text) if s and s.strip()]
+
+def _split_long(sentence: str, n_tokens: int, max_tokens: int) -> List[str]:
+    # word-level split for sentences that alone exceed the budget
+    words = sentence.split()
+    parts = max(2, math.ceil(n_tokens / max_tokens))
+    step = max(1, math.ceil(len(words) / parts))
+    return [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+
+def _fit_sentences(
+    sentences: List[str],
+    count_tokens_fn: Callable[[List[str]], List[int]],
+    max_tokens: int
+) -> List[Tuple[str, int]]:
+    counted = list(zip(sentences, count_tokens_fn(sentences))) if sentences else []
+    for _ in range(4):  # a few refinement rounds are plenty in practice
+        if all(n <= max_tokens for _, n in counted):
+            break
+        pieces = []
+        for s, n in counted:
+            pieces.extend(_split_long(s, n, max_tokens) if n > max_tokens and len(s.split()) > 1 else [s])
+        counted = list(zip(pieces, count_tokens_fn(pieces)))
+    return counted
+
+def pack_sentences(
+    counted: List[Tuple[str, int]],
+    max_tokens: int,
+    overlap_tokens: int
+) -> List[Tuple[str, int]]:
+    """
+    Greedily packs (sentence, n_tokens) into chunks of at most max_tokens, carrying
+    whole trailing sentences (up to overlap_tokens) into the next chunk.
+    Returns (chunk_text, n_tokens); counts add up because the model tokenizer
+    pre-splits on whitespace.
+    """
+    chunks = []
+    cur: List[Tuple[str, int]] = []
+    cur_tokens = 0
+    for s, n in counted:
+        if cur and cur_tokens + n > max_tokens:
+            chunks.append((" ".join(x for x, _ in cur), cur_tokens))
+            carry: List[Tuple[str, int]] = []
+            carry_tokens = 0
+            for cs, cn in reversed(cur):
+                if carry_tokens + cn > overlap_tokens:
+                    break
+                carry.insert(0, (cs, cn))
+                carry_tokens += cn
+            cur, cur_tokens = (carry, carry_tokens) if carry_tokens + n <= max_tokens else ([], 0)
+        cur.append((s, n))
+        cur_tokens += n
+    if cur:
+        chunks.append((" ".join(x for x, _ in cur), cur_tokens))
+    return chunks
+
+def chunk_pages_by_sentences(
+    pages: List[Dict[str, Any]],
+    max_tokens: int,
+    overlap_tokens: int,
+    count_tokens_fn: Callable[[List[str]], List[int]]
+) -> List[Dict[str, Any]]:
+    """
+    Sentence-aware chunker budgeted in the embedding model's own tokenizer
+    (count_tokens_fn, e.g. Embedder.count_tokens), so no chunk is silently truncated
+    at the model's max_seq_length. Same chunk dict shape as chunk_pages.
+    """
+    all_chunks = []
+    seen = set()
+    for p in pages:
+        counted = _fit_sentences(split_sentences(p["text"]), count_tokens_fn, max_tokens)
+        for piece, n_tokens in pack_sentences(counted, max_tokens, overlap_tokens):
+            chunk_id = chunk_id_for(p["source"], p["page"], piece)
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
             all_chunks.append({
-                "chunk_id": f"c{chunk_id:06d}",
+                "chunk_id": chunk_id,
                 "source": p["source"],
                 "page": p["page"],
                 "text": piece,
-                "token_count": count_tokens(piece),
+                "token_count": n_tokens,
             })
-
     return all_chunks
+
+def model_limit_warning(mode: str, chunk_tokens: int, model_max_tokens: int) -> Optional[str]:
+    """
+    Message when the configured chunk size can't fit the embedding model's input limit.
+    """
+    if chunk_tokens <= model_max_tokens:
+        return None
+    if mode == "sentences":
+        return (f"Chunk size {chunk_tokens} exceeds the embedding model limit ({model_max_tokens} tokens); "
+                f"chunks are capped at {model_max_tokens}.")
+    return (f"Chunk size {chunk_tokens} (cl100k tokens) exceeds the embedding model limit "
+            f"({model_max_tokens} model tokens); text past the limit is truncated and never embedded. "
+            "Use sentence mode or a smaller chunk size.")
@@ -9,21 +9,75 @@ class Settings:
     # chunking
     chunk_tokens: int = int(os.getenv("CHUNK_TOKENS", "420"))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", "80"))
+    chunk_mode: str = os.getenv("CHUNK_MODE", "tokens")  # tokens (cl100k windows) | sentences (model tokenizer)
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 = extract in-process
 
     # retrieval
     top_k: int = int(os.getenv("TOP_K", "6"))
     use_mmr: bool = os.getenv("USE_MMR", "true").lower() == "true"
+    mmr_lambda: float = float(os.getenv("MMR_LAMBDA", "0.5"))  # 1.0 = relevance only, 0.0 = diversity only
+    mmr_candidate_k: int = int(os.getenv("MMR_CANDIDATE_K", "30"))
+
+    # generator context
+    # prompt budget per retrieved chunk, so it scales with the request's top_k (0 = no limit);
+    # the default fits a full chunk plus its header, leaving only overlap to drop
+    context_tokens_per_chunk: int = int(os.getenv("CONTEXT_TOKENS_PER_CHUNK", str(chunk_tokens + 32)))
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))  # fixed total instead, 0 = per-chunk budget
+    context_trim_sentences: bool = os.getenv("CONTEXT_TRIM_SENTENCES", "false").lower() == "true"  # partial chunks: question-relevant sentences only
+
+    # vector index ("auto" picks flat / hnsw / ivf_flat from corpus size, checked against the target recall)
+    index_type: str = os.getenv("INDEX_TYPE", "auto")
+    index_target_recall: float = float(os.getenv("INDEX_TARGET_RECALL", "0.95"))  # nprobe / efSearch tuning target
+    index_compact_fraction: float = float(os.getenv("INDEX_COMPACT_FRACTION", "0.2"))  # HNSW: rebuild once deleted ids exceed this share of live ones
 
     # embedding
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", "2048"))  # in-memory LRU entries, 0 = off
+    embed_cache_mb: int = int(os.getenv("EMBED_CACHE_MB", "512"))  # on-disk chunk vector cache, 0 = off
+
+    # semantic answer cache (paraphrased repeats reuse a previous answer)
+    answer_cache_size: int = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))  # entries, 0 = off
+    answer_cache_threshold: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # min query cosine for a hit
+    answer_cache_ttl_s: float = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
 
     # Gemini generation
     gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")  # optional: SDK can also auto-pick from env
     gemini_model: str = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
+    # API serving
+    api_cpu_workers: int = int(os.getenv("API_CPU_WORKERS", str(os.cpu_count() or 1)))  # embed + FAISS executor
+    api_max_inflight: int = int(os.getenv("API_MAX_INFLIGHT", "64"))  # admitted requests; beyond this -> 503
+    api_admission_wait_s: float = float(os.getenv("API_ADMISSION_WAIT_S", "0.1"))  # wait for a slot before 503
+    embed_batch_window_ms: float = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))  # query micro-batch window, 0 = off
+    embed_max_batch: int = int(os.getenv("EMBED_MAX_BATCH", "32"))  # flush early at this many queued queries
+    retrieval_timeout_s: float = float(os.getenv("RETRIEVAL_TIMEOUT_S", "5"))  # embed + search, timeout -> 503
+    generation_timeout_s: float = float(os.getenv("GENERATION_TIMEOUT_S", "30"))  # Gemini, timeout -> extractive
+    api_max_batch_questions: int = int(os.getenv("API_MAX_BATCH_QUESTIONS", "256"))  # /ask/batch size limit, beyond this -> 422
+    api_batch_generations: int = int(os.getenv("API_BATCH_GENERATIONS", "8"))  # concurrent Gemini calls across /ask/batch requests
+
+    # telemetry (runs.db is written by a background thread)
+    telemetry_batch_size: int = int(os.getenv("TELEMETRY_BATCH_SIZE", "64"))  # rows per insert transaction
+    telemetry_flush_ms: float = float(os.getenv("TELEMETRY_FLUSH_MS", "500"))  # max delay before a partial batch is written
+    telemetry_max_queue: int = int(os.getenv("TELEMETRY_MAX_QUEUE", "10000"))  # beyond this, runs are dropped
+    telemetry_raw_days: int = int(os.getenv("TELEMETRY_RAW_DAYS", "7"))  # raw runs/spans; rollups keep the timings
+    telemetry_minute_days: int = int(os.getenv("TELEMETRY_MINUTE_DAYS", "30"))  # per-minute rollups
+    telemetry_hour_days: int = int(os.getenv("TELEMETRY_HOUR_DAYS", "365"))  # per-hour rollups
+
+    # per-request profiling (cProfile + tracemalloc; see backend/profiling.py)
+    profile_sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # fraction of requests, 0 = on demand only
+    profile_tracemalloc: bool = os.getenv("PROFILE_TRACEMALLOC", "true").lower() == "true"  # memory peak + allocation sites
+
+    # evaluation runner (backend/eval.run_eval_parallel)
+    eval_workers: int = int(os.getenv("EVAL_WORKERS", "8"))  # concurrent generation threads
+    eval_batch_size: int = int(os.getenv("EVAL_BATCH_SIZE", "64"))  # questions per retrieve_many call
+    eval_gemini_rps: float = float(os.getenv("EVAL_GEMINI_RPS", "1"))  # token-bucket rate for Gemini calls, 0 = unlimited
+    eval_gemini_burst: int = int(os.getenv("EVAL_GEMINI_BURST", "4"))
+
     # paths
     index_dir: str = "index"
     outputs_dir: str = "outputs"
     runs_db_path: str = os.path.join("outputs", "runs.db")
+    embed_cache_path: str = os.path.join("outputs", "embed_cache.db")
+    projections_dir: str = os.path.join("outputs", "projections")
 
 SETTINGS = Settings()
@@ -0,0 +1,177 @@
+from typing import Any, Dict, Hashable, List, Optional
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+
+from .config import SETTINGS
+from .utils import ensure_dir
+
+def normalize_query(text: str) -> str:
+    """
+    Cache key normalization: Unicode NFKC + collapsed whitespace.
+    Case is kept because cased embedding models treat it as signal.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU with hit / miss counters.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+class ChunkEmbeddingCache:
+    """
+    Persistent chunk-vector cache in SQLite, keyed by (model name, sha1(text)).
+    Vectors are stored as raw float32 bytes. When the cache grows past max_bytes,
+    the least recently used entries are evicted down to 90% of the budget.
+    """
+    def __init__(self, path: str, max_bytes: int):
+        ensure_dir(os.path.dirname(path) or ".")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_vectors (
+            model TEXT,
+            h TEXT,
+            dim INTEGER,
+            vec BLOB,
+            last_used INTEGER,
+            PRIMARY KEY (model, h)
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_vectors_last_used ON chunk_vectors(last_used)")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM chunk_vectors").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Returns {position in texts: vector} for cached texts.
+        """
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                part = sorted(set(hashes[start:start + 500]))
+                rows = self._conn.execute(
+                    f"SELECT h, vec FROM chunk_vectors WHERE model = ? AND h IN ({','.join('?' * len(part))})",
+                    [model, *part]
+                ).fetchall()
+                found.update({h: np.frombuffer(v, dtype="float32") for h, v in rows})
+            if found:
+                now = int(time.time())
+                self._conn.executemany(
+                    "UPDATE chunk_vectors SET last_used = ? WHERE model = ? AND h = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+            out = {i: found[h] for i, h in enumerate(hashes) if h in found}
+            self.hits += len(out)
+            self.misses += len(texts) - len(out)
+        return out
+
+    def put_many(self, model: str, texts: List[str], vecs: np.ndarray) -> None:
+        vecs = np.asarray(vecs, dtype="float32")
+        now = int(time.time())
+        rows = [(model, text_hash(t), vecs.shape[1], v.tobytes(), now) for t, v in zip(texts, vecs)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_vectors (model, h, dim, vec, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM chunk_vectors").fetchone()[0]
+            if self._bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target_bytes: int) -> None:
+        row_bytes = self._conn.execute("SELECT AVG(LENGTH(vec)) FROM chunk_vectors").fetchone()[0] or 1
+        n_drop = int((self._bytes - target_bytes) / row_bytes) + 1
+        self._conn.execute("""
+        DELETE FROM chunk_vectors WHERE rowid IN (
+            SELECT rowid FROM chunk_vectors ORDER BY last_used ASC LIMIT ?
+        )
+        """, (n_drop,))
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM chunk_vectors").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "bytes": int(self._bytes),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+# Process-wide caches, shared by every Embedder (keys include the model name).
+QUERY_CACHE = LRUCache(SETTINGS.query_cache_size)
+_chunk_cache = None
+_chunk_cache_lock = threading.Lock()
+
+def get_chunk_cache() -> Optional[ChunkEmbeddingCache]:
+    global _chunk_cache
+    if SETTINGS.embed_cache_mb <= 0:
+        return None
+    with _chunk_cache_lock:
+        if _chunk_cache is None:
+            _chunk_cache = ChunkEmbeddingCache(SETTINGS.embed_cache_path, SETTINGS.embed_cache_mb * 1024 * 1024)
+    return _chunk_cache
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Hit / miss counters for this process, e.g. for the latency dashboard.
+    """
+    chunk = get_chunk_cache()
+    return {
+        "query_lru": QUERY_CACHE.stats(),
+        "chunk_disk": chunk.stats() if chunk else {"disabled": True},
+    }
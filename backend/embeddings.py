@@ -1,23 +1,111 @@
 from typing import List
+import copy
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from .embed_cache import QUERY_CACHE, get_chunk_cache, normalize_query
 
 class Embedder:
     """
     Local embedding model wrapper using SentenceTransformers.
+    Query vectors go through a process-wide in-memory LRU; chunk vectors through
+    a persistent on-disk cache (see backend/embed_cache.py). Both are keyed by
+    model name, so switching models never returns stale vectors.
+
+    Loading a model is slow; get one through backend.models.get_embedder, which
+    keeps a single loaded instance per model name.
     """
     def __init__(self, model_name: str):
+        # imported here: sentence-transformers pulls in torch, which dominates import time
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self._count_tokenizer = None
+        self._count_lock = threading.Lock()
 
-    def embed_texts(self, texts: List[str]) -> np.ndarray:
+    @property
+    def max_seq_length(self) -> int:
+        """
+        Input length (model tokens, incl. special tokens) past which encode() truncates.
+        """
+        return int(self.model.max_seq_length or 512)
+
+    def token_budget(self) -> int:
+        """
+        Usable text tokens per input: max_seq_length minus [CLS]/[SEP]-style specials.
+        """
+        tok = self.model.tokenizer
+        specials = tok.num_special_tokens_to_add(pair=False) if hasattr(tok, "num_special_tokens_to_add") else 2
+        return self.max_seq_length - specials
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Token counts in the model's own tokenizer (no special tokens).
+        Uses a private tokenizer copy: encode() reconfigures padding/truncation on the
+        shared one, which is not safe to call concurrently from chunking threads.
+        """
+        if not texts:
+            return []
+        with self._count_lock:
+            if self._count_tokenizer is None:
+                self._count_tokenizer = copy.deepcopy(self.model.tokenizer)
+            ids = self._count_tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(x) for x in ids]
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
         vecs = self.model.encode(
             texts,
-            batch_size=32,
+            batch_size=batch_size,
             show_progress_bar=False,
             normalize_embeddings=True
         )
         return np.asarray(vecs, dtype="float32")
 
+    def warm_up(self) -> None:
+        """
+        One throwaway encode, so the first real query doesn't pay for lazy kernel
+        and thread-pool setup. Bypasses the caches.
+        """
+        self._encode(["warm-up"], batch_size=1)
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        cache = get_chunk_cache()
+        if cache is None or not texts:
+            return self._encode(texts, batch_size=32)
+
+        cached = cache.get_many(self.model_name, texts)
+        # each distinct missing text is encoded once
+        missing = list(dict.fromkeys(t for i, t in enumerate(texts) if i not in cached))
+        if missing:
+            fresh = self._encode(missing, batch_size=32)
+            cache.put_many(self.model_name, missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            cached.update({i: by_text[t] for i, t in enumerate(texts) if i not in cached})
+        return np.stack([cached[i] for i in range(len(texts))]).astype("float32")
+
     def embed_query(self, text: str) -> np.ndarray:
-        vec = self.model.encode([text], normalize_embeddings=True)
-        return np.asarray(vec, dtype="float32")
+        return self.embed_queries([text])
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        (N, d) query vectors; cache misses are encoded in a single model call.
+        """
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype="float32")
+        keys = [(self.model_name, normalize_query(t)) for t in texts]
+        found = [QUERY_CACHE.get(k) for k in keys]
+        # first position of each distinct missing key
+        first = {}
+        for i, k in enumerate(keys):
+            if found[i] is None:
+                first.setdefault(k, i)
+        missing = list(first.values())
+        if missing:
+            fresh = self._encode([texts[i] for i in missing], batch_size=64)
+            by_key = {keys[i]: v for i, v in zip(missing, fresh)}
+            for k, v in by_key.items():
+                QUERY_CACHE.put(k, v)
+            found = [by_key[k] if v is None else v for k, v in zip(keys, found)]
+        # copies, so callers can't mutate cached vectors in place
+        return np.array(found, dtype="float32").reshape(len(texts), -1)
@@ -1,8 +1,20 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
 import json
 import os
+import threading
+import time
+import numpy as np
+
+from .config import SETTINGS
+from .retriever import mmr_select_batch
 from .utils import ensure_dir, write_json
 
+CHECKPOINT_FILE = "eval_checkpoint.jsonl"
+REPORT_FILE = "eval_report.json"
+RETRIEVAL_REPORT_FILE = "retrieval_eval.json"
+
 def load_eval_set(path: str) -> List[Dict[str, Any]]:
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -46,5 +58,366 @@ def run_eval(eval_items: List[Dict[str, Any]], ask_fn, out_dir: str) -> Dict[str
         "accuracy": (score_sum / max(1, len(eval_items))),
         "results": results
     }
-    write_json(os.path.join(out_dir, "eval_report.json"), report)
+    write_json(os.path.join(out_dir, REPORT_FILE), report)
+    return report
+
+# ---- parallel, resumable runner ----
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: at most rate_per_s acquisitions per second on average,
+    bursts of up to `burst`. rate_per_s <= 0 means unlimited.
+    """
+    def __init__(self, rate_per_s: float, burst: int = 1):
+        self.rate = rate_per_s
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_s = 0.0
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+                self.waited_s += wait_s
+            time.sleep(wait_s)
+
+def item_key(item: Dict[str, Any], run_config: Dict[str, Any]) -> str:
+    """
+    Checkpoint key: the question, its expected answer and the run settings, so a
+    resumed run only reuses results produced under the same configuration.
+    """
+    raw = json.dumps([item.get("question", ""), item.get("expected", ""), run_config], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    {key: result} from a checkpoint; a line cut short by a crash is skipped.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(row, dict) and "key" in row:
+                done[row["key"]] = row
+    return done
+
+def run_eval_parallel(
+    eval_items: List[Dict[str, Any]],
+    retrieve_batch_fn: Callable[[List[str]], List[Any]],
+    answer_fn: Callable[[str, Any], Dict[str, Any]],
+    out_dir: str,
+    run_config: Optional[Dict[str, Any]] = None,
+    workers: int = 8,
+    batch_size: int = 64,
+    limiter: Optional[TokenBucket] = None,
+    resume: bool = True,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Concurrent version of run_eval.
+
+    retrieve_batch_fn(questions) -> retrieved items per question (e.g. retriever.retrieve_many),
+    called on the caller's thread for batch_size questions at a time.
+    answer_fn(question, retrieved) -> {answer, citations, ...}, run on `workers` threads;
+    limiter (a TokenBucket) is acquired before each call, e.g. to stay within Gemini quota.
+
+    Each finished result is appended to out_dir/eval_checkpoint.jsonl; with resume=True,
+    results already there (same question, expected and run_config) are not re-run.
+    Failed questions are reported but not checkpointed, so a rerun retries them.
+    on_progress({done, total, resumed, errors, elapsed_s, qps}) runs on the caller's thread.
+    """
+    ensure_dir(out_dir)
+    run_config = run_config or {}
+    ckpt_path = os.path.join(out_dir, CHECKPOINT_FILE)
+    if not resume and os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+
+    keys = [item_key(item, run_config) for item in eval_items]
+    done = load_checkpoint(ckpt_path) if resume else {}
+    pending = [i for i, k in enumerate(keys) if k not in done]
+    resumed = len(eval_items) - len(pending)
+    errors: Dict[int, str] = {}
+    t0 = time.time()
+    finished = 0
+
+    def progress():
+        if on_progress is not None:
+            elapsed = time.time() - t0
+            on_progress({
+                "done": resumed + finished + len(errors),
+                "total": len(eval_items),
+                "resumed": resumed,
+                "errors": len(errors),
+                "elapsed_s": round(elapsed, 1),
+                "qps": round(finished / elapsed, 3) if elapsed > 0 else 0.0,
+            })
+
+    def task(i: int, retrieved) -> Dict[str, Any]:
+        if limiter is not None:
+            limiter.acquire()
+        item = eval_items[i]
+        out = answer_fn(item["question"], retrieved)
+        exp = item.get("expected", "")
+        return {
+            "key": keys[i],
+            "question": item["question"],
+            "expected": exp,
+            "answer": out["answer"],
+            "citations": out.get("citations", []),
+            "score": simple_accuracy(out["answer"], exp),
+        }
+
+    progress()
+    with open(ckpt_path, "a", encoding="utf-8") as ckpt, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        inflight = {}
+
+        def collect(block: bool):
+            nonlocal finished
+            if not inflight:
+                return
+            ready, _ = wait(list(inflight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for fut in ready:
+                i = inflight.pop(fut)
+                try:
+                    row = fut.result()
+                except Exception as e:
+                    errors[i] = f"{type(e).__name__}: {e}"
+                else:
+                    ckpt.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    ckpt.flush()
+                    done[row["key"]] = row
+                    finished += 1
+                progress()
+
+        for start in range(0, len(pending), max(1, batch_size)):
+            idx = pending[start:start + batch_size]
+            try:
+                retrieved_all = retrieve_batch_fn([eval_items[i]["question"] for i in idx])
+            except Exception as e:
+                for i in idx:
+                    errors[i] = f"retrieval: {type(e).__name__}: {e}"
+                progress()
+                continue
+            for i, retrieved in zip(idx, retrieved_all):
+                inflight[pool.submit(task, i, retrieved)] = i
+            # keep roughly one batch ahead of the workers
+            collect(block=False)
+            while len(inflight) > max(workers, batch_size):
+                collect(block=True)
+        while inflight:
+            collect(block=True)
+
+    results = []
+    for i, (item, k) in enumerate(zip(eval_items, keys)):
+        if k in done:
+            results.append({key: v for key, v in done[k].items() if key != "key"})
+        else:
+            results.append({
+                "question": item["question"], "expected": item.get("expected", ""),
+                "answer": "", "citations": [], "score": 0.0, "error": errors.get(i, "not run"),
+            })
+    elapsed = time.time() - t0
+    report = {
+        "n": len(eval_items),
+        "accuracy": sum(r["score"] for r in results) / max(1, len(eval_items)),
+        "errors": len(errors),
+        "resumed": resumed,
+        "elapsed_s": round(elapsed, 1),
+        "throughput_qps": round(finished / elapsed, 3) if elapsed > 0 else 0.0,
+        "run_config": run_config,
+        "results": results,
+    }
+    write_json(os.path.join(out_dir, REPORT_FILE), report)
+    return report
+
+# ---- retrieval-only evaluation ----
+
+def relevance_kind(item: Dict[str, Any]) -> Optional[str]:
+    """
+    How an eval item marks its relevant chunks, by precedence:
+    chunk_ids | source (+ optional page, int or list) | expected (phrase in the chunk text).
+    """
+    if item.get("chunk_ids"):
+        return "chunk_ids"
+    if item.get("source"):
+        return "source"
+    if (item.get("expected") or "").strip():
+        return "expected"
+    return None
+
+def relevance_matrix(store, eval_items: List[Dict[str, Any]], ids: np.ndarray) -> np.ndarray:
+    """
+    (Q, C) bool: is the chunk with FAISS id ids[q, c] relevant to eval_items[q].
+    Source / page / chunk id checks are column compares on the MetaStore;
+    only phrase items read chunk text.
+    """
+    Q, C = ids.shape
+    rel = np.zeros((Q, C), dtype=bool)
+    valid = ids != -1
+    if not valid.any():
+        return rel
+    rows = np.full((Q, C), -1, dtype="int64")
+    rows[valid] = store.rows_for(ids[valid])
+    cols = store.chunks.cols
+    src = np.where(valid, cols["source"][np.maximum(rows, 0)], -1)
+    page = np.where(valid, cols["page"][np.maximum(rows, 0)], -1)
+    chunk_ids = cols["chunk_id"][np.maximum(rows, 0)]
+
+    # annotations may name the source with or without its directory
+    source_pos: Dict[str, int] = {}
+    for i, name in enumerate(store.chunks.sources):
+        source_pos[name] = i
+        source_pos.setdefault(os.path.basename(name), i)
+
+    texts: Dict[int, str] = {}
+    for q, item in enumerate(eval_items):
+        kind = relevance_kind(item)
+        if kind == "chunk_ids":
+            wanted = np.array([str(c).encode("ascii") for c in item["chunk_ids"]])
+            rel[q] = np.isin(chunk_ids[q], wanted) & valid[q]
+        elif kind == "source":
+            pos = source_pos.get(item["source"], source_pos.get(os.path.basename(item["source"]), -2))
+            hit = src[q] == pos
+            if item.get("page") is not None:
+                pages = item["page"] if isinstance(item["page"], list) else [item["page"]]
+                hit &= np.isin(page[q], np.asarray(pages, dtype="int64"))
+            rel[q] = hit & valid[q]
+        elif kind == "expected":
+            phrase = item["expected"].lower().strip()
+            for c in np.flatnonzero(valid[q]):
+                r = int(rows[q, c])
+                if r not in texts:
+                    texts[r] = store.chunks.text(r).lower()
+                rel[q, c] = phrase in texts[r]
+    return rel
+
+def ranking_metrics(rel: np.ndarray, ks: Sequence[int], n_rel: Optional[np.ndarray] = None) -> Dict[int, Dict[str, float]]:
+    """
+    hit rate / precision / MRR / nDCG at every k in one pass over a (Q, K) bool matrix
+    of ranked results (K >= max(ks)).
+
+    hit_rate@k: share of questions with a relevant chunk in their top k. (Not recall:
+    that needs every relevant chunk in the corpus, unknown for phrase items.)
+    nDCG@k: binary gains against an ideal ranking of n_rel relevant chunks per question
+    (default: those in rel). The corpus-wide count isn't known for phrase items, so
+    evaluate_retrieval passes the count in the shared candidate pool.
+    """
+    Q, K = rel.shape
+    if Q == 0:
+        return {k: {"hit_rate": 0.0, "precision": 0.0, "mrr": 0.0, "ndcg": 0.0} for k in ks}
+    relf = rel.astype("float64")
+    pos = np.arange(1, K + 1)
+    discounts = 1.0 / np.log2(pos + 1)
+
+    hits = np.cumsum(relf, axis=1)  # (Q, K): relevant within top k
+    first = np.where(rel.any(axis=1), rel.argmax(axis=1), K)  # 0-based rank of first hit
+    dcg = np.cumsum(relf * discounts, axis=1)
+    ideal_cum = np.concatenate([[0.0], np.cumsum(discounts)])  # ideal DCG with n relevant
+    n_rel = rel.sum(axis=1) if n_rel is None else np.asarray(n_rel)
+    idcg = ideal_cum[np.minimum(n_rel[:, None], pos[None, :])]  # (Q, K)
+
+    hit_rate = (hits > 0).mean(axis=0)
+    precision = (hits / pos).mean(axis=0)
+    mrr = np.where(first[:, None] < pos[None, :], 1.0 / (first[:, None] + 1), 0.0).mean(axis=0)
+    ndcg = np.divide(dcg, idcg, out=np.zeros_like(dcg), where=idcg > 0).mean(axis=0)
+    return {
+        k: {
+            "hit_rate": round(float(hit_rate[k - 1]), 4),
+            "precision": round(float(precision[k - 1]), 4),
+            "mrr": round(float(mrr[k - 1]), 4),
+            "ndcg": round(float(ndcg[k - 1]), 4),
+        }
+        for k in ks
+    }
+
+def _mmr_pool(k: int, candidate_k: int) -> int:
+    # same candidate pool retrieve() uses for top_k = k
+    return min(candidate_k, max(k * 5, k))
+
+def evaluate_retrieval(
+    store,
+    embed_queries_fn: Callable[[List[str]], np.ndarray],
+    eval_items: List[Dict[str, Any]],
+    ks: Sequence[int] = (1, 3, 5, 10),
+    lambdas: Sequence[Optional[float]] = (None,),
+    candidate_k: int = SETTINGS.mmr_candidate_k,
+    out_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Retrieval-only eval: no generation, no Gemini quota.
+
+    All questions are embedded in one embed_queries_fn call and searched with one
+    FAISS call at the largest k (or MMR pool) needed. lambdas: None = plain similarity
+    ranking, a float = MMR with that lambda_mult, batched over all questions and
+    computed once per candidate-pool size, so every top_k matches what retrieve() returns.
+
+    Returns {n, skipped, ks, rows: [{mode, lambda_mult, k, hit_rate, precision, mrr, ndcg}],
+    misses: questions with no relevant chunk in the top max(ks) (plain ranking), elapsed_s}.
+    """
+    t0 = time.time()
+    ks = sorted({int(k) for k in ks if int(k) > 0})
+    items = [it for it in eval_items if relevance_kind(it)]
+    skipped = len(eval_items) - len(items)
+    report: Dict[str, Any] = {"n": len(items), "skipped": skipped, "ks": ks, "rows": [], "misses": []}
+    if not items or not ks:
+        report["elapsed_s"] = round(time.time() - t0, 3)
+        return report
+
+    K = max(ks)
+    mmr_lambdas = [lam for lam in lambdas if lam is not None]
+    C = max([K] + [_mmr_pool(k, candidate_k) for k in ks] if mmr_lambdas else [K])
+    qv = np.asarray(embed_queries_fn([it["question"] for it in items]), dtype="float32")
+    scores, ids = store.search_ids_batch(qv, C)
+    rel = relevance_matrix(store, items, ids)
+    n_rel = rel.sum(axis=1)  # nDCG ideal: same for every mode and k
+
+    if None in lambdas:
+        for k, m in ranking_metrics(rel[:, :K], ks, n_rel).items():
+            report["rows"].append({"mode": "similarity", "lambda_mult": None, "k": k, **m})
+        hit_any = rel[:, :K].any(axis=1)
+        for q in np.flatnonzero(~hit_any):
+            top = ids[q, :3][ids[q, :3] != -1]
+            report["misses"].append({
+                "question": items[q]["question"],
+                "relevance": relevance_kind(items[q]),
+                "top_hits": [f"{it['source']} p.{it['page']}" for it in store.get_items(top)],
+            })
+
+    if mmr_lambdas:
+        valid = ids != -1
+        vecs = np.zeros((ids.shape[0], C, qv.shape[1]), dtype="float32")
+        vecs[valid] = store.get_vectors(ids[valid])
+        pools: Dict[int, List[int]] = {}
+        for k in ks:
+            pools.setdefault(_mmr_pool(k, candidate_k), []).append(k)
+        for lam in mmr_lambdas:
+            for pool, pool_ks in sorted(pools.items()):
+                # greedy MMR is prefix-consistent: one run at the pool's largest k covers its smaller ks
+                chosen = mmr_select_batch(scores[:, :pool], vecs[:, :pool], max(pool_ks), lam, valid=valid[:, :pool])
+                picked = np.take_along_axis(rel[:, :pool], np.maximum(chosen, 0), axis=1) & (chosen != -1)
+                if picked.shape[1] < max(pool_ks):  # pool smaller than k: nothing beyond it
+                    picked = np.pad(picked, ((0, 0), (0, max(pool_ks) - picked.shape[1])))
+                for k, m in ranking_metrics(picked, pool_ks, n_rel).items():
+                    report["rows"].append({"mode": "mmr", "lambda_mult": float(lam), "k": k, **m})
+
+    report["rows"].sort(key=lambda r: (r["mode"] != "similarity", r["lambda_mult"] or 0.0, r["k"]))
+    report["elapsed_s"] = round(time.time() - t0, 3)
+    if out_dir:
+        ensure_dir(out_dir)
+        write_json(os.path.join(out_dir, RETRIEVAL_REPORT_FILE), report)
     return report
@@ -0,0 +1,210 @@
+from typing import Any, Dict, Optional
+import math
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# "auto" steps to the next type when tuning can't reach the target recall
+MORE_EXACT = {"ivf_pq": "ivf_flat", "ivf_flat": "hnsw", "hnsw": "flat"}
+
+def choose_index_type(n: int) -> str:
+    """
+    Picks an index type from corpus size.
+    Exact search is cheap below ~10k vectors; HNSW gives the best latency/recall up to
+    a few hundred thousand; IVF keeps memory flat beyond that. ivf_pq is never picked:
+    PQ codes alone plateau well below usual recall targets (0.34 recall@10 on
+    20k vectors in bench.ann_recall), so it is opt-in via INDEX_TYPE.
+    """
+    if n < 10_000:
+        return "flat"
+    if n < 250_000:
+        return "hnsw"
+    return "ivf_flat"
+
+def _pq_subquantizers(d: int) -> int:
+    # ~8 dims per sub-quantizer, and m must divide d
+    for m in range(max(1, d // 8), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+def default_params(index_type: str, n: int, d: int) -> Dict[str, Any]:
+    """
+    Build + search parameters for an index type, scaled to corpus size.
+    """
+    if index_type == "flat":
+        return {}
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # ~4·sqrt(N) lists, but keep >= 39 training points per list
+        nlist = int(min(max(16, 4 * math.sqrt(n)), max(1, n // 39), 65536))
+        params = {"nlist": nlist, "nprobe": max(1, min(nlist, nlist // 16 or 1))}
+        if index_type == "ivf_pq":
+            # 8-bit codebooks want >= 39·256 training points; shrink them on small corpora
+            nbits = int(min(8, max(4, math.log2(max(2, n // 39)))))
+            params.update({"pq_m": _pq_subquantizers(d), "pq_nbits": nbits})
+        return params
+    if index_type == "hnsw":
+        return {"hnsw_m": 32, "ef_construction": 80, "ef_search": 64}
+    raise ValueError(f"Unknown index type: {index_type!r} (expected one of {INDEX_TYPES} or 'auto')")
+
+def factory_string(index_type: str, params: Dict[str, Any]) -> str:
+    """
+    faiss.index_factory description for an index type + params.
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{params['nlist']},Flat"
+    if index_type == "ivf_pq":
+        return f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']},Flat"
+    raise ValueError(f"Unknown index type: {index_type!r}")
+
+def create_index(d: int, index_type: str, params: Dict[str, Any]) -> faiss.Index:
+    """
+    Creates an empty inner-product index (cosine on normalized vectors).
+    """
+    index = faiss.index_factory(d, factory_string(index_type, params), faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = params["ef_construction"]
+    return index
+
+def wrap_with_ids(index: faiss.Index) -> faiss.Index:
+    """
+    Makes an index addressable by caller-chosen int64 ids.
+    IVF indexes store ids natively (and renumbering them breaks IndexIDMap.remove_ids),
+    so only Flat / HNSW get an IndexIDMap wrapper.
+    """
+    if isinstance(index, faiss.IndexIVF):
+        return index
+    wrapped = faiss.IndexIDMap(index)
+    wrapped.own_fields = True
+    index.this.disown()
+    return wrapped
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]) -> None:
+    """
+    Sets query-time knobs (nprobe / efSearch) on an index, looking through wrappers.
+    """
+    if "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = int(params["nprobe"])
+    if "ef_search" in params:
+        inner = index
+        while not hasattr(inner, "hnsw"):
+            inner = faiss.downcast_index(inner.index)
+        inner.hnsw.efSearch = int(params["ef_search"])
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """
+    Mean fraction of the true top-k ids present in the found top-k, per query.
+    """
+    k = truth.shape[1]
+    hits = sum(len(set(f[:k].tolist()) & set(t.tolist()) - {-1}) for f, t in zip(found, truth))
+    return hits / float(truth.shape[0] * k)
+
+def tune_search_params(
+    index: faiss.Index,
+    index_type: str,
+    params: Dict[str, Any],
+    vectors: np.ndarray,
+    target_recall: float = 0.95,
+    k: int = 10,
+    n_queries: int = 200,
+    seed: int = 0,
+    ids: Optional[np.ndarray] = None
+) -> Dict[str, Any]:
+    """
+    Finds the smallest nprobe / efSearch whose recall@k against exact search
+    reaches target_recall, using perturbed stored vectors as probe queries.
+    ids: the index labels aligned with vectors (default: row positions).
+    """
+    if index_type == "flat" or len(vectors) <= k:
+        return params
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = np.asarray(vectors[np.sort(sample)], dtype="float32")
+    queries = queries + rng.normal(0, 0.05, size=queries.shape).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype="float32"))
+    _, truth = exact.search(queries, k)
+    if ids is not None:
+        truth = np.asarray(ids)[truth]
+
+    if index_type == "hnsw":
+        key, candidates = "ef_search", [16, 32, 64, 128, 256, 512]
+    else:
+        key = "nprobe"
+        nlist = params["nlist"]
+        candidates = sorted({min(nlist, 2 ** i) for i in range(0, int(math.log2(nlist)) + 2)})
+
+    tuned = dict(params)
+    prev = None
+    for value in candidates:
+        tuned[key] = value
+        apply_search_params(index, tuned)
+        _, found = index.search(queries, k)
+        recall = recall_at_k(found, truth)
+        if recall >= target_recall:
+            break
+        if prev is not None and recall - prev[1] < 0.005:
+            # plateau (e.g. PQ quantization error): wider search only costs latency
+            tuned[key], recall = prev
+            break
+        prev = (value, recall)
+    tuned["tuned_recall"] = round(recall, 4)
+    apply_search_params(index, tuned)
+    return tuned
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str = "auto",
+    params: Optional[Dict[str, Any]] = None,
+    target_recall: Optional[float] = 0.95,
+    ids: Optional[np.ndarray] = None
+):
+    """
+    Creates, trains, fills and (optionally) tunes an index for the given vectors.
+    Rows are addressed by the int64 ids (default: 0..N-1, see wrap_with_ids) so they
+    can be added / removed later without a rebuild.
+    index_type "auto" picks from corpus size (choose_index_type) and verifies the
+    choice: if tuning can't reach target_recall it builds the next more exact type.
+    Returns (index, info) where info = {"type": ..., **params} is what gets persisted
+    in the store metadata so load() can restore the same search settings.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    ids = np.arange(len(vectors), dtype="int64") if ids is None else np.ascontiguousarray(ids, dtype="int64")
+    if index_type != "auto":
+        return _build(vectors, ids, index_type, params, target_recall)
+
+    index_type = choose_index_type(len(vectors))
+    while True:
+        index, info = _build(vectors, ids, index_type, params, target_recall)
+        if not target_recall or info.get("tuned_recall", 1.0) >= target_recall or index_type not in MORE_EXACT:
+            return index, info
+        index_type = MORE_EXACT[index_type]
+
+def _build(vectors: np.ndarray, ids: np.ndarray, index_type: str, params: Optional[Dict[str, Any]],
+           target_recall: Optional[float]):
+    n, d = vectors.shape
+    merged = default_params(index_type, n, d)
+    merged.update(params or {})
+
+    inner = create_index(d, index_type, merged)
+    if not inner.is_trained:
+        # IVF coarse quantizer / PQ codebooks: a few hundred points per list is plenty
+        rng = np.random.default_rng(0)
+        max_train = min(n, 256 * merged.get("nlist", 1))
+        train = vectors if n <= max_train else vectors[np.sort(rng.choice(n, size=max_train, replace=False))]
+        inner.train(train)
+    index = wrap_with_ids(inner)
+    index.add_with_ids(vectors, ids)
+
+    apply_search_params(index, merged)
+    if target_recall:
+        merged = tune_search_params(index, index_type, merged, vectors, target_recall=target_recall, ids=ids)
+    return index, {"type": index_type, "factory": factory_string(index_type, merged), **merged}
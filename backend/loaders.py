@@ -1,7 +1,13 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pypdf import PdfReader
 
-def load_pdf_pages(pdf_path: str) -> List[Dict[str, Any]]:
+def source_name(pdf_path: str) -> str:
+    return pdf_path.split("/")[-1].split("\\")[-1]
+
+def pdf_page_count(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+def load_pdf_pages(pdf_path: str, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Loads a PDF and returns a list of page dicts:
       {
@@ -9,12 +15,15 @@ def load_pdf_pages(pdf_path: str) -> List[Dict[str, Any]]:
         "page": page_number (1-based),
         "text": extracted_text
       }
+    start / end (0-based, end exclusive) restrict extraction to a page range,
+    so large PDFs can be split across worker processes.
     """
     reader = PdfReader(pdf_path)
-    source = pdf_path.split("/")[-1].split("\\")[-1]
+    source = source_name(pdf_path)
     pages = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text() or ""
+    end = len(reader.pages) if end is None else min(end, len(reader.pages))
+    for i in range(start, end):
+        text = reader.pages[i].extract_text() or ""
         text = text.replace("\x00", " ").strip()
         if text:
             pages.append({"source": source, "page": i + 1, "text": text})
@@ -0,0 +1,206 @@
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+import os
+import sys
+import numpy as np
+
+from .utils import ensure_dir, read_json, write_json
+
+COLS_FILE = "meta_cols.npy"
+TEXTS_FILE = "meta_texts.bin"
+SOURCES_FILE = "meta_sources.json"
+META_FORMAT = "columnar-v1"
+
+COLS_DTYPE = np.dtype([
+    ("id", "<i8"),           # FAISS id, faiss_id(chunk_id)
+    ("chunk_id", "S16"),
+    ("source", "<i4"),       # position in the sources list
+    ("page", "<i4"),
+    ("token_count", "<i4"),
+    ("text_len", "<i4"),     # bytes
+    ("text_off", "<i8"),     # byte offset into meta_texts.bin
+])
+
+def faiss_id(chunk_id: str) -> int:
+    """
+    int64 FAISS id for a chunk id ("c" + hex digits, see chunking.chunk_id_for).
+    """
+    return int(chunk_id[1:], 16)
+
+def _map_blob(path: str) -> np.ndarray:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+def _save_npy_atomic(path: str, arr: np.ndarray) -> None:
+    # never truncate a file that may be memory-mapped: write aside, then rename
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+class MetaStore:
+    """
+    Columnar chunk metadata, aligned by row with the vectors.
+    Stores:
+      - index/meta_cols.npy: one fixed-width row per chunk (ids, source, page,
+        token_count, text offset/length), memory-mapped on load
+      - index/meta_texts.bin: UTF-8 chunk texts back to back, memory-mapped on load
+      - index/meta_sources.json: source names (the source column holds positions)
+
+    Only rows a caller asks for are turned into dicts, so loading costs the same
+    whatever the corpus text size. Texts are append-only: deleted rows leave dead
+    bytes in the blob, which save() compacts once they outweigh the live text.
+    """
+    def __init__(self, cols: np.ndarray = None, sources: List[str] = None, blob_path: str = None):
+        self.cols = np.zeros(0, dtype=COLS_DTYPE) if cols is None else cols
+        self.sources = list(sources or [])
+        self._source_pos = {s: i for i, s in enumerate(self.sources)}
+        self.blob_path = blob_path
+        self._blob = _map_blob(blob_path) if blob_path else np.zeros(0, dtype=np.uint8)
+        self._pending = bytearray()  # texts added since the last save
+
+    @classmethod
+    def from_items(cls, items: Iterable[Dict[str, Any]]) -> "MetaStore":
+        store = cls()
+        store.extend(list(items))
+        return store
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["MetaStore"]:
+        cols_path = os.path.join(index_dir, COLS_FILE)
+        if not os.path.exists(cols_path):
+            return None
+        try:
+            cols = np.load(cols_path, mmap_mode="r")
+        except ValueError:
+            cols = np.load(cols_path)  # empty arrays cannot be mapped
+        sources = read_json(os.path.join(index_dir, SOURCES_FILE))
+        return cls(cols, sources, os.path.join(index_dir, TEXTS_FILE))
+
+    def __len__(self) -> int:
+        return len(self.cols)
+
+    # ---- reads ----
+
+    def text(self, row: int) -> str:
+        off = int(self.cols["text_off"][row])
+        n = int(self.cols["text_len"][row])
+        on_disk = len(self._blob)
+        if off >= on_disk:
+            off -= on_disk
+            return bytes(self._pending[off:off + n]).decode("utf-8")
+        return self._blob[off:off + n].tobytes().decode("utf-8")
+
+    def item(self, row: int) -> Dict[str, Any]:
+        r = self.cols[row]
+        return {
+            "chunk_id": r["chunk_id"].decode("ascii"),
+            "source": self.sources[int(r["source"])],
+            "page": int(r["page"]),
+            "text": self.text(row),
+            "token_count": int(r["token_count"]),
+        }
+
+    def items(self, rows: Iterable[int] = None) -> List[Dict[str, Any]]:
+        rows = range(len(self)) if rows is None else rows
+        return [self.item(int(r)) for r in rows]
+
+    def iter_items(self) -> Iterator[Dict[str, Any]]:
+        for r in range(len(self)):
+            yield self.item(r)
+
+    def source_rows(self, source: str) -> np.ndarray:
+        pos = self._source_pos.get(source)
+        if pos is None:
+            return np.zeros(0, dtype="int64")
+        return np.flatnonzero(self.cols["source"] == pos)
+
+    def source_counts(self) -> Dict[str, int]:
+        counts = np.bincount(self.cols["source"], minlength=len(self.sources))
+        return {s: int(c) for s, c in zip(self.sources, counts.tolist()) if c}
+
+    # ---- writes ----
+
+    def extend(self, items: List[Dict[str, Any]]) -> None:
+        rows = np.zeros(len(items), dtype=COLS_DTYPE)
+        off = len(self._blob) + len(self._pending)
+        for i, it in enumerate(items):
+            data = it["text"].encode("utf-8")
+            pos = self._source_pos.get(it["source"])
+            if pos is None:
+                pos = self._source_pos[it["source"]] = len(self.sources)
+                self.sources.append(it["source"])
+            rows[i] = (
+                faiss_id(it["chunk_id"]), it["chunk_id"].encode("ascii"), pos,
+                it["page"], it.get("token_count", 0), len(data), off
+            )
+            self._pending += data
+            off += len(data)
+        self.cols = np.concatenate([np.asarray(self.cols), rows])
+
+    def select(self, keep: np.ndarray) -> None:
+        """
+        Keeps only rows where keep is True (text bytes are reclaimed on save).
+        """
+        self.cols = np.asarray(self.cols)[keep]
+
+    def save(self, index_dir: str) -> None:
+        ensure_dir(index_dir)
+        blob_path = os.path.join(index_dir, TEXTS_FILE)
+        live = int(self.cols["text_len"].sum())
+        total = len(self._blob) + len(self._pending)
+        same_blob = self.blob_path is not None and os.path.abspath(self.blob_path) == os.path.abspath(blob_path)
+
+        cols = np.array(self.cols)  # detach from any mapping of the file we are replacing
+        if same_blob and live * 2 >= total:
+            with open(blob_path, "ab") as f:
+                f.write(self._pending)
+        else:
+            cols = self._write_compacted(blob_path, cols)
+
+        self.cols = cols
+        _save_npy_atomic(os.path.join(index_dir, COLS_FILE), cols)
+        write_json(os.path.join(index_dir, SOURCES_FILE), self.sources)
+        self.blob_path = blob_path
+        self._pending = bytearray()
+        self._blob = _map_blob(blob_path)
+
+    def _write_compacted(self, blob_path: str, cols: np.ndarray) -> np.ndarray:
+        tmp = blob_path + ".tmp"
+        new_off = np.zeros(len(cols), dtype="int64")
+        off = 0
+        with open(tmp, "wb") as f:
+            for r in range(len(cols)):
+                data = self.text(r).encode("utf-8")
+                f.write(data)
+                new_off[r] = off
+                off += len(data)
+        self._blob = np.zeros(0, dtype=np.uint8)  # release our mapping before replacing
+        os.replace(tmp, blob_path)
+        cols["text_off"] = new_off
+        return cols
+
+def migrate_meta_json(index_dir: str, meta_file: str = "meta.json") -> bool:
+    """
+    One-shot migration of a legacy meta.json ({"items": [...], ...}) into the
+    columnar format. The remaining small header (index params etc.) stays in
+    meta.json. Returns False if there was nothing to migrate.
+    """
+    meta_path = os.path.join(index_dir, meta_file)
+    if not os.path.exists(meta_path):
+        return False
+    meta = read_json(meta_path)
+    if "items" not in meta:
+        return False
+
+    MetaStore.from_items(meta["items"]).save(index_dir)
+    # header last: if we crash before this, the legacy file is still intact
+    header = {k: v for k, v in meta.items() if k != "items"}
+    header["format"] = META_FORMAT
+    write_json(meta_path, header)
+    return True
+
+if __name__ == "__main__":
+    # python -m backend.metastore [index_dir]
+    target = sys.argv[1] if len(sys.argv) > 1 else "index"
+    print("migrated" if migrate_meta_json(target) else "nothing to migrate", target)
@@ -0,0 +1,163 @@
+"""
+In-process Prometheus metrics for the API (text exposition format 0.0.4).
+
+No client library or pushgateway: counters, gauges and fixed-bucket histograms
+are plain dicts behind a lock, keyed by label values. Recording is a dict
+lookup and an increment. Values that other components already count
+(caches, admission, telemetry queue) are copied in by on_scrape() hooks when
+/metrics is read, so they cost nothing on the request path.
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; spans range from ~0.1 ms (MMR on a small pool) to tens of seconds (generation)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        # mirrors a monotonic count kept elsewhere (see on_scrape)
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.bounds, value)  # first bound >= value (le semantics)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        out = []
+        for key, counts, total, n in items:
+            cum = 0
+            for bound, c in zip(self.bounds + (math.inf,), counts):
+                cum += c
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._hooks: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def on_scrape(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """
+        Registers fn to run before each render(), e.g. to copy gauges from live objects.
+        """
+        self._hooks.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for fn in self._hooks:
+            fn()
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, tuple(labelnames)))
+
+def gauge(name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, tuple(labelnames)))
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = STAGE_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, tuple(labelnames), buckets))
+
+# ---- request path (recorded by api.py) ----
+
+REQUESTS = counter("rag_requests_total", "API requests by endpoint and outcome (ok | overloaded | error).", ("endpoint", "status"))
+REQUEST_SECONDS = histogram("rag_request_duration_seconds", "End-to-end request latency.", ("endpoint",))
+STAGE_SECONDS = histogram("rag_stage_duration_seconds", "Per-stage latency (query_embed, faiss_search, mmr, context_build, generation).", ("stage",))
+GENERATION_FALLBACKS = counter("rag_generation_fallbacks_total", "Gemini calls that fell back to the extractive answer.", ("reason",))
+
+def observe_request(endpoint: str, seconds: float, spans: Dict[str, float], status: str = "ok") -> None:
+    """
+    One finished request: the request counter and latency, plus its spans ({stage: ms}).
+    """
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    for stage, ms in spans.items():
+        STAGE_SECONDS.observe(ms / 1000.0, stage=stage)
@@ -0,0 +1,48 @@
+"""
+Process-wide model registry: each embedding model is loaded once per process,
+keyed by name, and shared by the API, the Streamlit pages and offline tools.
+
+    embedder = get_embedder(SETTINGS.embedding_model)   # loads + warms up on first use
+
+Loading is lazy and thread-safe: concurrent first calls for the same model wait for
+one load instead of each loading a copy, while different models load in parallel.
+A failed load is not cached, so the next call retries.
+"""
+from typing import Dict
+import threading
+import time
+
+from .config import SETTINGS
+from .embeddings import Embedder
+
+_embedders: Dict[str, Embedder] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+_load_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()  # guards _load_locks
+
+def get_embedder(model_name: str = SETTINGS.embedding_model, warm_up: bool = True) -> Embedder:
+    """
+    The shared Embedder for model_name; the first call loads it (and runs a warm-up encode).
+    """
+    embedder = _embedders.get(model_name)
+    if embedder is not None:
+        return embedder
+    with _lock:
+        load_lock = _load_locks.setdefault(model_name, threading.Lock())
+    with load_lock:
+        embedder = _embedders.get(model_name)
+        if embedder is None:
+            t0 = time.perf_counter()
+            embedder = Embedder(model_name)
+            t1 = time.perf_counter()
+            if warm_up:
+                embedder.warm_up()
+            _timings[model_name] = {"load_s": round(t1 - t0, 3), "warmup_s": round(time.perf_counter() - t1, 3)}
+            _embedders[model_name] = embedder
+    return embedder
+
+def loaded_models() -> Dict[str, Dict[str, float]]:
+    """
+    {model_name: {load_s, warmup_s}} for every model loaded in this process.
+    """
+    return {name: dict(t) for name, t in _timings.items()}
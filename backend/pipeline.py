@@ -0,0 +1,285 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import queue
+import threading
+import time
+import numpy as np
+
+from .chunking import chunk_pages, chunk_pages_by_sentences
+from .config import SETTINGS
+from .loaders import load_pdf_pages, pdf_page_count
+from .metastore import faiss_id
+
+_DONE = object()
+
+class _Failed:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+def _extract(job: Tuple[str, int, int]) -> List[Dict[str, Any]]:
+    # top-level so it pickles into worker processes (spawn on Windows / macOS)
+    path, start, end = job
+    return load_pdf_pages(path, start, end)
+
+def _page_jobs(paths: List[str], pages_per_job: int) -> List[Tuple[str, int, int]]:
+    jobs = []
+    for path in paths:
+        n = pdf_page_count(path)
+        jobs.extend((path, s, min(s + pages_per_job, n)) for s in range(0, n, pages_per_job))
+    return jobs
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    # bounded put that gives up once the pipeline is being torn down
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    # blocking get that returns _DONE once the pipeline is being torn down, since
+    # _put stops delivering sentinels at that point
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+class IngestPipeline:
+    """
+    Streaming PDF -> pages -> chunks -> embeddings pipeline.
+
+      1) extraction: pypdf page ranges in a process pool (at most `workers * 2` jobs in flight)
+      2) chunking:   `chunk_workers` threads tokenizing + chunking page by page
+      3) embedding:  the calling thread batches chunks into `embed_fn` calls
+
+    Stages are connected by bounded queues, so extraction of later pages overlaps
+    with embedding of earlier ones and only a few batches of pages are held at once.
+    Embedding runs on the calling thread, so `on_progress` can safely update a UI.
+    """
+    def __init__(
+        self,
+        chunk_tokens: int,
+        overlap_tokens: int,
+        embed_fn: Callable[[List[str]], np.ndarray],
+        workers: int = SETTINGS.ingest_workers,
+        chunk_workers: int = 1,
+        batch_size: int = 256,
+        pages_per_job: int = 8,
+        queue_size: int = 64,
+        skip_chunk: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        chunker: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None
+    ):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.embed_fn = embed_fn
+        self.workers = workers
+        self.chunk_workers = max(1, chunk_workers)
+        self.batch_size = batch_size
+        self.pages_per_job = pages_per_job
+        self.queue_size = queue_size
+        # chunks for which skip_chunk(chunk) is True are kept but not embedded
+        # (e.g. already in the store); their vector slot is left as zeros
+        self.skip_chunk = skip_chunk
+        # pages -> chunks; defaults to token windows (see make_chunker)
+        self.chunker = chunker or (lambda pages: chunk_pages(pages, chunk_tokens, overlap_tokens))
+
+    def _extract_stage(self, paths: List[str], pages_q: queue.Queue, stop: threading.Event, counters: Dict[str, int]):
+        try:
+            jobs = _page_jobs(paths, self.pages_per_job)
+            if self.workers <= 0:
+                for job in jobs:
+                    for page in _extract(job):
+                        counters["pages"] += 1
+                        if not _put(pages_q, page, stop):
+                            return
+                return
+
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                pending = set()
+                todo = iter(jobs)
+                while True:
+                    while len(pending) < self.workers * 2:
+                        job = next(todo, None)
+                        if job is None:
+                            break
+                        pending.add(pool.submit(_extract, job))
+                    if not pending or stop.is_set():
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        for page in fut.result():
+                            counters["pages"] += 1
+                            if not _put(pages_q, page, stop):
+                                return
+        except BaseException as exc:
+            _put(pages_q, _Failed(exc), stop)
+        finally:
+            for _ in range(self.chunk_workers):
+                _put(pages_q, _DONE, stop)
+
+    def _chunk_stage(self, pages_q: queue.Queue, chunks_q: queue.Queue, stop: threading.Event):
+        try:
+            while not stop.is_set():
+                page = _get(pages_q, stop)
+                if page is _DONE:
+                    break
+                if isinstance(page, _Failed):
+                    _put(chunks_q, page, stop)
+                    break
+                for chunk in self.chunker([page]):
+                    if not _put(chunks_q, chunk, stop):
+                        return
+        except BaseException as exc:
+            _put(chunks_q, _Failed(exc), stop)
+        finally:
+            _put(chunks_q, _DONE, stop)
+
+    def run(
+        self,
+        paths: List[str],
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray, Dict[str, Any]]:
+        """
+        Returns (chunks, vectors aligned with chunks, stats).
+        stats: pages, chunks, embedded, seconds, pages_per_s, chunks_per_s.
+        """
+        pages_q = queue.Queue(maxsize=self.queue_size)
+        chunks_q = queue.Queue(maxsize=self.queue_size * 8)
+        stop = threading.Event()
+        counters = {"pages": 0}
+
+        threads = [threading.Thread(
+            target=self._extract_stage, args=(paths, pages_q, stop, counters), daemon=True
+        )]
+        threads += [
+            threading.Thread(target=self._chunk_stage, args=(pages_q, chunks_q, stop), daemon=True)
+            for _ in range(self.chunk_workers)
+        ]
+
+        chunks: List[Dict[str, Any]] = []
+        vec_parts: List[Tuple[List[int], np.ndarray]] = []
+        batch: List[int] = []
+        seen = set()
+        embedded = 0
+        t0 = time.time()
+
+        def stats() -> Dict[str, Any]:
+            elapsed = max(time.time() - t0, 1e-9)
+            return {
+                "pages": counters["pages"],
+                "chunks": len(chunks),
+                "embedded": embedded,
+                "seconds": round(elapsed, 3),
+                "pages_per_s": round(counters["pages"] / elapsed, 2),
+                "chunks_per_s": round(len(chunks) / elapsed, 2),
+            }
+
+        def flush():
+            nonlocal embedded
+            if not batch:
+                return
+            vec_parts.append((list(batch), self.embed_fn([chunks[i]["text"] for i in batch])))
+            embedded += len(batch)
+            batch.clear()
+            if on_progress:
+                on_progress(stats())
+
+        for t in threads:
+            t.start()
+        try:
+            remaining = self.chunk_workers
+            while remaining:
+                item = chunks_q.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(item, _Failed):
+                    raise item.exc
+                if item["chunk_id"] in seen:
+                    continue
+                seen.add(item["chunk_id"])
+                chunks.append(item)
+                if self.skip_chunk is None or not self.skip_chunk(item):
+                    batch.append(len(chunks) - 1)
+                    if len(batch) >= self.batch_size:
+                        flush()
+            flush()
+        finally:
+            stop.set()
+            for t in threads:
+                t.join(timeout=5)
+
+        dim = vec_parts[0][1].shape[1] if vec_parts else 0
+        vectors = np.zeros((len(chunks), dim), dtype="float32")
+        for rows, vecs in vec_parts:
+            vectors[rows] = vecs
+
+        # deterministic output order regardless of which worker finished first
+        order = sorted(range(len(chunks)), key=lambda i: (chunks[i]["source"], chunks[i]["page"], i))
+        chunks = [chunks[i] for i in order]
+        vectors = vectors[order]
+        out = stats()
+        if on_progress:
+            on_progress(out)
+        return chunks, vectors, out
+
+def make_chunker(mode: str, chunk_tokens: int, overlap_tokens: int, embedder=None):
+    """
+    pages -> chunks function for a chunking mode.
+      tokens:    cl100k token windows (chunk_pages)
+      sentences: sentence-packed chunks budgeted in the embedder's own tokenizer,
+                 capped at its max_seq_length
+    """
+    if mode == "sentences":
+        budget = min(chunk_tokens, embedder.token_budget())
+        overlap = min(overlap_tokens, budget // 2)
+        return lambda pages: chunk_pages_by_sentences(pages, budget, overlap, embedder.count_tokens)
+    return lambda pages: chunk_pages(pages, chunk_tokens, overlap_tokens)
+
+def index_files(
+    paths: List[str],
+    store,
+    embed_fn: Callable[[List[str]], np.ndarray],
+    chunk_tokens: int,
+    overlap_tokens: int,
+    rebuild: bool = False,
+    index_type: str = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    workers: int = SETTINGS.ingest_workers,
+    chunker: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Runs the pipeline over PDFs and writes the result into a FaissStore:
+      - rebuild (or empty store): full build from every chunk
+      - otherwise: per-document upsert, saved once; chunks already in the store are not embedded
+    Returns (chunks, stats); incremental runs add per-document counts under stats["documents"].
+    """
+    incremental = not rebuild and len(store) > 0
+    skip = (lambda c: bool(store.has_ids([faiss_id(c["chunk_id"])])[0])) if incremental else None
+
+    pipeline = IngestPipeline(
+        chunk_tokens, overlap_tokens, embed_fn, workers=workers, skip_chunk=skip, chunker=chunker
+    )
+    chunks, vectors, stats = pipeline.run(paths, on_progress)
+    if not chunks:
+        return chunks, stats
+    if not incremental:
+        store.build(vectors, chunks, index_type=index_type)
+        return chunks, stats
+
+    # upsert_sources only asks for vectors of chunks not yet in the store, which are
+    # exactly the ones the pipeline embedded. Skipped chunks hold zero placeholders,
+    # so they must stay out of the map: their text can repeat (headers, footers).
+    by_text = {c["text"]: v for c, v in zip(chunks, vectors) if not skip(c)}
+    lookup = lambda texts: np.stack([by_text[t] for t in texts])
+    docs: Dict[str, List[Dict[str, Any]]] = {}
+    for c in chunks:
+        docs.setdefault(c["source"], []).append(c)
+    # every document in one delete + add, and a single save for the run
+    counts = store.upsert_sources(dict(sorted(docs.items())), lookup, index_type)
+    stats["documents"] = [{"source": source, **n} for source, n in counts.items()]
+    return chunks, stats
@@ -0,0 +1,164 @@
+"""
+Opt-in per-request profiling: cProfile function stats and tracemalloc memory for
+a sampled fraction of requests (PROFILE_SAMPLE_RATE), or on demand (the
+X-Profile request header in api.py, a checkbox on the Ask page).
+
+    prof = start_profile(forced)          # None when this request isn't profiled
+    with profiling(prof):                 # sync sections only, any thread
+        retrieved = retrieve(...)
+    row["profile"] = prof.finish() if prof else None   # stored against the runs row
+
+cProfile follows one thread and tracemalloc is process-wide, so only one request
+is profiled at a time; others proceed unprofiled. Only the sections wrapped in
+profiling() are recorded: an awaited Gemini call would otherwise pick up every
+other coroutine on the event loop. Both tools slow the request down noticeably
+(tracemalloc most), which is why this is opt-in.
+"""
+import cProfile
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import SETTINGS
+
+PROFILE_HEADER = "X-Profile"
+TOP_FUNCTIONS = 200  # by cumulative time
+TOP_ALLOCATIONS = 50  # by bytes still allocated at finish()
+
+_slot = threading.Lock()  # held by the one request being profiled
+
+def _release(state: Dict[str, bool]) -> None:
+    # once per profile: from finish(), or when an unfinished profile is garbage collected
+    if state["released"]:
+        return
+    state["released"] = True
+    if state["owns_tracemalloc"]:
+        tracemalloc.stop()
+    _slot.release()
+
+def _func_label(func) -> str:
+    filename, line, name = func
+    if filename == "~":  # builtins
+        return name
+    return f"{filename}:{line}({name})"
+
+class RequestProfile:
+    def __init__(self, trace_memory: bool):
+        self.profiler = cProfile.Profile()
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()  # the profiler is enabled in one thread at a time
+        self._state = {"released": False, "owns_tracemalloc": False}
+        self._snapshot = None
+        self._t0 = time.perf_counter()
+        self._finished = False
+
+    def _start(self) -> None:
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._state["owns_tracemalloc"] = True
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+
+    @contextmanager
+    def active(self):
+        with self._lock:
+            self.profiler.enable()
+            try:
+                yield
+            finally:
+                self.profiler.disable()
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        fn run under active(), e.g. for serving.run_cpu on a worker thread.
+        """
+        def profiled(*args, **kwargs):
+            with self.active():
+                return fn(*args, **kwargs)
+        return profiled
+
+    def _functions(self) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(self.profiler)
+        rows = []
+        for func, (cc, nc, tt, ct, _callers) in stats.stats.items():
+            rows.append({
+                "function": _func_label(func),
+                "ncalls": nc,
+                "tottime_ms": round(tt * 1000, 3),
+                "cumtime_ms": round(ct * 1000, 3),
+            })
+        rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+        return rows[:TOP_FUNCTIONS]
+
+    def _allocations(self) -> List[Dict[str, Any]]:
+        # leave out the profiler's own bookkeeping
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(self._snapshot.filter_traces(ignore), "lineno")
+        rows = []
+        for s in diff[:TOP_ALLOCATIONS]:
+            if s.size_diff <= 0:
+                break
+            frame = s.traceback[0]
+            rows.append({
+                "site": f"{frame.filename}:{frame.lineno}",
+                "size_kb": round(s.size_diff / 1024, 1),
+                "count": s.count_diff,
+            })
+        return rows
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        {wall_ms, peak_kb, functions, allocations}; releases the profiling slot.
+        peak_kb is the process-wide traced peak while the request ran; allocations
+        are the sites still holding memory at the end (vs the start).
+        """
+        if self._finished:
+            raise RuntimeError("profile already finished")
+        self._finished = True
+        try:
+            out = {
+                "wall_ms": round((time.perf_counter() - self._t0) * 1000, 1),
+                "peak_kb": None,
+                "functions": self._functions(),
+                "allocations": [],
+            }
+            if self.trace_memory and tracemalloc.is_tracing():
+                out["peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+                out["allocations"] = self._allocations()
+            return out
+        finally:
+            self._snapshot = None
+            _release(self._state)
+
+def start_profile(forced: bool = False) -> Optional[RequestProfile]:
+    """
+    A started RequestProfile when this request is sampled (or forced) and no other
+    request is being profiled; otherwise None. Call finish() on it once; an
+    unfinished profile frees the slot when it is garbage collected.
+    """
+    if not forced and not (SETTINGS.profile_sample_rate > 0 and random.random() < SETTINGS.profile_sample_rate):
+        return None
+    if not _slot.acquire(blocking=False):
+        return None
+    prof = RequestProfile(SETTINGS.profile_tracemalloc)
+    # a request that errors out before finish() must not block profiling for good
+    weakref.finalize(prof, _release, prof._state)
+    prof._start()
+    return prof
+
+@contextmanager
+def profiling(prof: Optional[RequestProfile]):
+    """
+    Records the enclosed block into prof; a no-op when prof is None.
+    """
+    if prof is None:
+        yield
+        return
+    with prof.active():
+        yield
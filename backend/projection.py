@@ -0,0 +1,183 @@
+"""
+2D projections of the index for the Embedding Explorer, computed from the stored
+vectors (no re-embedding) and persisted under outputs/projections/.
+
+A projection file is keyed by its UMAP parameters and records the index version it
+was computed for:
+  - same version:        the saved coordinates are returned as they are
+  - index changed since: points still in the sample keep their coordinates, new
+                         chunks are placed with the saved reducer's transform();
+                         it is refit only when most of the sample is new, or when
+                         the vectors were re-embedded (chunk ids are content hashes,
+                         so a new embedding model keeps them; a few saved probe
+                         vectors are compared to catch that)
+Large samples are first reduced with PCA, which makes UMAP's neighbour search
+several times cheaper on 384-768 dim embeddings.
+"""
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+import pickle
+import time
+import numpy as np
+
+from .config import SETTINGS
+from .utils import ensure_dir
+
+PCA_DIMS = 50
+PCA_MIN_POINTS = 1000  # below this UMAP on the raw vectors is already fast
+REFIT_FRACTION = 0.5  # refit once more than this share of the sample would be transformed
+MAX_FILES = 8  # most recently used projection files kept
+PROBES = 16  # stored vectors compared to detect a re-embedded index
+
+def stratified_sample(ids: np.ndarray, sources: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Row positions of at most max_points chunks, allocated across sources in
+    proportion to their size (every source gets at least a small share).
+    Within a source the smallest FAISS ids are taken: ids are content hashes, so
+    this is a uniform sample that stays the same as documents are added or removed.
+    """
+    n = len(ids)
+    if n <= max_points:
+        return np.arange(n)
+    uniq, inv, counts = np.unique(sources, return_inverse=True, return_counts=True)
+    quota = np.minimum(counts, max_points // (4 * len(uniq)))
+    # largest-remainder split of what is left, proportional to the remaining counts
+    spare = counts - quota
+    share = (max_points - quota.sum()) * spare / max(1, spare.sum())
+    quota += np.floor(share).astype(int)
+    left = max_points - quota.sum()
+    if left > 0:
+        order = np.argsort(-(share - np.floor(share)), kind="stable")
+        quota[order[:left]] += 1
+    quota = np.minimum(quota, counts)
+
+    rows = []
+    for s in range(len(uniq)):
+        members = np.flatnonzero(inv == s)
+        rows.append(members[np.argsort(ids[members], kind="stable")[:quota[s]]])
+    return np.sort(np.concatenate(rows))
+
+def projection_key(params: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _path(key: str) -> str:
+    return os.path.join(SETTINGS.projections_dir, f"{key}.pkl")
+
+def _load(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_path(key), "rb") as f:
+            entry = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    os.utime(_path(key))  # recency for eviction
+    return entry
+
+def _save(key: str, entry: Dict[str, Any]) -> None:
+    ensure_dir(SETTINGS.projections_dir)
+    tmp = _path(key) + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, _path(key))
+    files = sorted(
+        (os.path.join(SETTINGS.projections_dir, f) for f in os.listdir(SETTINGS.projections_dir) if f.endswith(".pkl")),
+        key=os.path.getmtime, reverse=True
+    )
+    for old in files[MAX_FILES:]:
+        os.remove(old)
+
+def _fit(vecs: np.ndarray, n_neighbors: int, min_dist: float, seed: int) -> Dict[str, Any]:
+    import umap
+
+    pca = None
+    x = vecs
+    if len(vecs) >= PCA_MIN_POINTS and vecs.shape[1] > PCA_DIMS:
+        from sklearn.decomposition import PCA
+        pca = PCA(n_components=PCA_DIMS, random_state=seed)
+        x = pca.fit_transform(vecs)
+
+    n = len(vecs)
+    reducer = umap.UMAP(
+        n_neighbors=min(n_neighbors, max(2, n - 1)),  # n_neighbors must be < N
+        min_dist=min_dist,
+        metric="cosine",
+        init="random" if n < 20 else "spectral",  # spectral init can fail for very small N
+        random_state=seed
+    )
+    xy = reducer.fit_transform(x)
+    return {"pca": pca, "reducer": reducer, "xy": np.asarray(xy, dtype="float32")}
+
+def _params(store, n_neighbors: int, min_dist: float, max_points: int, seed: int) -> Dict[str, Any]:
+    # dim: a projection fitted in one embedding space can't transform another
+    return {"n_neighbors": n_neighbors, "min_dist": min_dist, "max_points": max_points, "seed": seed,
+            "dim": int(store.index.d)}
+
+def _same_space(store, entry: Dict[str, Any]) -> bool:
+    """
+    Whether the probe chunks saved with entry still have the same vectors.
+    False when none of them is left to compare.
+    """
+    ids = entry.get("probe_ids")
+    if ids is None:
+        return False
+    keep = store.has_ids(ids)
+    if not keep.any():
+        return False
+    return bool(np.allclose(store.get_vectors(ids[keep]), entry["probe_vecs"][keep], atol=1e-4))
+
+def _transform(entry: Dict[str, Any], vecs: np.ndarray) -> np.ndarray:
+    x = entry["pca"].transform(vecs) if entry["pca"] is not None else vecs
+    return np.asarray(entry["reducer"].transform(x), dtype="float32")
+
+def cached_projection(store, n_neighbors: int, min_dist: float, max_points: int, seed: int = 42) -> Optional[Dict[str, Any]]:
+    """
+    The saved projection for exactly this index version and parameters, or None.
+    """
+    entry = _load(projection_key(_params(store, n_neighbors, min_dist, max_points, seed)))
+    if entry is None or entry["index_version"] != store.version:
+        return None
+    return {"ids": entry["ids"], "xy": entry["xy"], "mode": "cached", "new": 0, "seconds": 0.0,
+            "pca": entry["pca"] is not None, "n_neighbors": entry["reducer"].n_neighbors}
+
+def project(store, n_neighbors: int, min_dist: float, max_points: int, seed: int = 42) -> Dict[str, Any]:
+    """
+    2D coordinates for a stratified sample of the index.
+    Returns {ids (FAISS ids), xy (len(ids), 2), mode: cached | transformed | fitted,
+    new: points placed with transform(), seconds, pca, n_neighbors}.
+    """
+    hit = cached_projection(store, n_neighbors, min_dist, max_points, seed)
+    if hit is not None:
+        return hit
+
+    t0 = time.perf_counter()
+    params = _params(store, n_neighbors, min_dist, max_points, seed)
+    key = projection_key(params)
+    all_ids = np.asarray(store.ids)
+    rows = stratified_sample(all_ids, np.asarray(store.chunks.cols["source"]), max_points)
+    ids = all_ids[rows]
+
+    entry = _load(key)
+    if entry is not None and not _same_space(store, entry):
+        entry = None  # re-embedded: the saved reducer no longer applies
+    known = np.isin(ids, entry["ids"]) if entry is not None else np.zeros(len(ids), dtype=bool)
+    new_ids = ids[~known]
+    if entry is not None and len(new_ids) <= REFIT_FRACTION * len(ids):
+        mode = "transformed"
+        pos = {int(i): p for p, i in enumerate(entry["ids"])}
+        xy = np.zeros((len(ids), 2), dtype="float32")
+        xy[known] = entry["xy"][[pos[int(i)] for i in ids[known]]]
+        if len(new_ids):
+            xy[~known] = _transform(entry, store.get_vectors(new_ids))
+        fitted = {"pca": entry["pca"], "reducer": entry["reducer"]}
+    else:
+        mode = "fitted"
+        fitted = _fit(store.get_vectors(ids), n_neighbors, min_dist, seed)
+        xy = fitted.pop("xy")
+        new_ids = ids[:0]
+
+    probe_ids = ids[np.unique(np.linspace(0, len(ids) - 1, PROBES).astype(int))]  # spread across sources
+    _save(key, {"params": params, "index_version": store.version, "ids": ids, "xy": xy,
+                "probe_ids": probe_ids, "probe_vecs": store.get_vectors(probe_ids), **fitted})
+    return {"ids": ids, "xy": xy, "mode": mode, "new": len(new_ids), "seconds": round(time.perf_counter() - t0, 3),
+            "pca": fitted["pca"] is not None, "n_neighbors": fitted["reducer"].n_neighbors}
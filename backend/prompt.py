@@ -1,16 +1,130 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
+import re
+
+from .chunking import count_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+def _chunk_block(r: Dict[str, Any], text: str) -> str:
+    return (
+        f"[{r['chunk_id']}] Source: {r['source']} | Page: {r['page']}\n"
+        f"{text}\n"
+    )
 
 def build_context(retrieved: List[Dict[str, Any]]) -> str:
     """
     Creates a structured context block with chunk ids and metadata.
     """
-    parts = []
-    for r in retrieved:
-        parts.append(
-            f"[{r['chunk_id']}] Source: {r['source']} | Page: {r['page']}\n"
-            f"{r['text']}\n"
-        )
-    return "\n---\n".join(parts)
+    return "\n---\n".join(_chunk_block(r, r["text"]) for r in retrieved)
+
+def _overlap(a: str, b: str, probe: int = 48) -> int:
+    """
+    Length of the longest suffix of a that is also a prefix of b; this is the text
+    adjacent windows of one page share. The search anchors on b's first probe
+    chars, so overlaps shorter than min(probe, len(b)) are not found.
+    """
+    head = b[:probe]
+    if not head:
+        return 0
+    p = a.find(head)
+    while p != -1:
+        if b.startswith(a[p:]):
+            return len(a) - p
+        p = a.find(head, p + 1)
+    return 0
+
+def _relevant_sentences(text: str, question: str, budget_tokens: int, tokens_per_char: float) -> str:
+    """
+    Keeps the sentences sharing the most words with the question that fit the budget,
+    in their original order. Empty if none of them overlaps the question.
+    """
+    q_words = {w for w in _WORD.findall(question.lower()) if len(w) > 2}
+    sentences = [x for x in _SENTENCE_END.split(text) if x.strip()]
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: len(q_words & set(_WORD.findall(sentences[i].lower()))),
+        reverse=True
+    )
+    keep, used = [], 0.0
+    for i in scored:
+        if not q_words & set(_WORD.findall(sentences[i].lower())):
+            break
+        cost = len(sentences[i]) * tokens_per_char
+        if used + cost <= budget_tokens:
+            keep.append(i)
+            used += cost
+    return " ".join(sentences[i] for i in sorted(keep))
+
+def pack_context(
+    retrieved_items: List[Tuple[float, Dict[str, Any]]],
+    budget_tokens: int,
+    question: str = "",
+    trim_sentences: bool = False
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Token-budgeted version of build_context.
+      - chunks are taken greedily by score while they fit budget_tokens
+        (<= 0: no limit), costed with their stored token_count
+      - text a chunk shares with an already-packed neighbour from the same page
+        (window overlap) is dropped
+      - trim_sentences: a chunk that doesn't fit contributes only its sentences
+        that overlap the question, if those fit
+    Returns (context, info) where info reports token use, what was dropped and
+    chunk_ids: the chunks that made it into the context, best first.
+    """
+    packed: List[Tuple[Dict[str, Any], str]] = []
+    used = 0
+    info = {
+        "budget_tokens": budget_tokens,
+        "chunks_in": len(retrieved_items),
+        "chunks_used": 0,
+        "chunks_trimmed": 0,
+        "tokens_full": 0,
+        "tokens_used": 0,
+        "overlap_tokens_dropped": 0,
+    }
+    for _, r in sorted(retrieved_items, key=lambda x: x[0], reverse=True):
+        text = r["text"]
+        n_full = int(r.get("token_count") or count_tokens(text))
+        info["tokens_full"] += n_full
+        tokens_per_char = n_full / max(1, len(text))
+
+        for prev, prev_text in packed:
+            if (prev["source"], prev["page"]) != (r["source"], r["page"]):
+                continue
+            head = _overlap(prev_text, text)
+            if head:
+                text = text[head:]
+            tail = _overlap(text, prev_text)
+            if tail:
+                text = text[:len(text) - tail]
+        text = text.strip()
+        n_tokens = round(len(text) * tokens_per_char)
+        dropped = n_full - n_tokens
+        if not text:
+            info["overlap_tokens_dropped"] += dropped
+            continue
+
+        header_tokens = count_tokens(f"[{r['chunk_id']}] Source: {r['source']} | Page: {r['page']}")
+        remaining = budget_tokens - used - header_tokens
+        if budget_tokens > 0 and n_tokens > remaining:
+            if not (trim_sentences and question and remaining > 0):
+                continue
+            text = _relevant_sentences(text, question, remaining, tokens_per_char)
+            if not text:
+                continue
+            n_tokens = round(len(text) * tokens_per_char)
+            info["chunks_trimmed"] += 1
+
+        packed.append((r, text))
+        used += n_tokens + header_tokens
+        info["overlap_tokens_dropped"] += dropped
+
+    info["chunks_used"] = len(packed)
+    info["chunk_ids"] = [r["chunk_id"] for r, _ in packed]
+    info["tokens_used"] = used
+    return "\n---\n".join(_chunk_block(r, text) for r, text in packed), info
 
 def system_prompt() -> str:
     return (
@@ -18,7 +132,7 @@ def system_prompt() -> str:
         "Rules:\n"
         "1) If the answer is not in the context, say you don't know.\n"
         "2) Provide a concise answer.\n"
-        "3) Always include 2–3 citations referencing chunk ids like [c000123].\n"
+        "3) Always include 2–3 citations referencing chunk ids like [c3f9a0b1c2d4e5f].\n"
         "4) Do not invent sources.\n"
     )
 
@@ -1,8 +1,12 @@
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Iterator, AsyncIterator
+import inspect
 import re
 
-from .prompt import build_context
+from .config import SETTINGS
+from .chunking import count_tokens
+from .prompt import pack_context
 from .citations import pick_top_citations
+from .telemetry import span
 
 def _system_rules() -> str:
     return (
@@ -10,7 +14,7 @@ def _system_rules() -> str:
         "Rules:\n"
         "1) If the answer is not in the context, say you don't know.\n"
         "2) Provide a concise answer.\n"
-        "3) Always include 2–3 citations referencing chunk ids like [c000123].\n"
+        "3) Always include 2–3 citations referencing chunk ids like [c3f9a0b1c2d4e5f].\n"
         "4) Do not invent sources.\n"
     )
 
@@ -26,6 +30,58 @@ def extractive_answer(question: str, retrieved_items: List[Tuple[float, Dict[str
     sentences = re.split(r"(?<=[.!?])\s+", top)
     return " ".join(sentences[:3]).strip() or "I don't know."
 
+def _build_prompt(question: str, context: str) -> str:
+    # Gemini prompt: keep it explicit and grounded
+    return (
+        f"{_system_rules()}\n"
+        f"Question:\n{question}\n\n"
+        f"Context:\n{context}\n\n"
+        "Return ONLY the final answer text. Include citations inline like [c3f9a0b1c2d4e5f]."
+    )
+
+def _response_text(resp) -> str:
+    # google-genai exposes response text via resp.text
+    answer = (resp.text or "").strip() if hasattr(resp, "text") else str(resp).strip()
+    return answer or "I don't know."
+
+def context_budget(n_chunks: int) -> int:
+    """
+    Prompt token budget for n_chunks retrieved chunks (the request's top_k):
+    CONTEXT_TOKEN_BUDGET if set, else CONTEXT_TOKENS_PER_CHUNK per chunk. 0 = no limit.
+    """
+    if SETTINGS.context_token_budget > 0:
+        return SETTINGS.context_token_budget
+    return n_chunks * max(0, SETTINGS.context_tokens_per_chunk)
+
+def answer_sources(retrieved_items: List[Tuple[float, Dict[str, Any]]], question: str = "") -> Dict[str, Any]:
+    """
+    Citations + generator context for a retrieval result; everything a client
+    can show before generation starts. The context is packed into
+    context_budget(len(retrieved_items)) (see prompt.pack_context) and citations
+    are drawn only from the chunks that made it in; prompt_tokens estimates the
+    full Gemini prompt (cl100k tokens).
+    """
+    with span("context_build"):
+        context, info = pack_context(
+            retrieved_items, context_budget(len(retrieved_items)), question, SETTINGS.context_trim_sentences
+        )
+        packed = set(info["chunk_ids"])
+        return {
+            "citations": pick_top_citations([x for x in retrieved_items if x[1]["chunk_id"] in packed], max_cites=3),
+            "context": context,
+            "context_info": info,
+            "prompt_tokens": info["tokens_used"] + count_tokens(_build_prompt(question, "")),
+        }
+
+def _result(answer: str, src: Dict[str, Any], generated: bool) -> Dict[str, Any]:
+    return {
+        "answer": answer,
+        "citations": src["citations"],
+        "context": src["context"],
+        "context_info": src["context_info"],
+        "prompt_tokens": src["prompt_tokens"] if generated else 0,  # 0: no prompt was sent
+    }
+
 def answer_with_optional_llm(
     question: str,
     retrieved_items: List[Tuple[float, Dict[str, Any]]],
@@ -38,36 +94,112 @@ def answer_with_optional_llm(
       {
         answer: str,
         citations: [{chunk_id, source, page, score}],
-        context: str
+        context: str,
+        context_info: {...},  # see prompt.pack_context
+        prompt_tokens: int
       }
     """
-    citations = pick_top_citations(retrieved_items, max_cites=3)
-    retrieved = [it for _, it in retrieved_items]
-    context = build_context(retrieved)
+    src = answer_sources(retrieved_items, question)
 
     if not retrieved_items:
-        return {"answer": "I don't know.", "citations": [], "context": context}
+        return _result("I don't know.", src, False)
 
     if not use_gemini:
-        ans = extractive_answer(question, retrieved_items)
-        return {"answer": ans, "citations": citations, "context": context}
+        return _result(extractive_answer(question, retrieved_items), src, False)
 
-    # Gemini prompt: keep it explicit and grounded
-    prompt = (
-        f"{_system_rules()}\n"
-        f"Question:\n{question}\n\n"
-        f"Context:\n{context}\n\n"
-        "Return ONLY the final answer text. Include citations inline like [c000123]."
-    )
+    with span("generation"):
+        resp = gemini_client.models.generate_content(
+            model=gemini_model,
+            contents=_build_prompt(question, src["context"])
+        )
+    return _result(_response_text(resp), src, True)
 
-    resp = gemini_client.models.generate_content(
-        model=gemini_model,
-        contents=prompt
-    )
+async def answer_with_llm_async(
+    question: str,
+    retrieved_items: List[Tuple[float, Dict[str, Any]]],
+    gemini_client,
+    gemini_model: str
+) -> Dict[str, Any]:
+    """
+    Same as answer_with_optional_llm(use_gemini=True) but awaits the async genai client
+    (gemini_client.aio), so the event loop isn't blocked during generation.
+    """
+    src = answer_sources(retrieved_items, question)
 
-    # google-genai exposes response text via resp.text
-    answer = (resp.text or "").strip() if hasattr(resp, "text") else str(resp).strip()
-    if not answer:
-        answer = "I don't know."
+    if not retrieved_items:
+        return _result("I don't know.", src, False)
+
+    with span("generation"):
+        resp = await gemini_client.aio.models.generate_content(
+            model=gemini_model,
+            contents=_build_prompt(question, src["context"])
+        )
+    return _result(_response_text(resp), src, True)
+
+# ---- streaming ----
+
+def stream_answer(
+    question: str,
+    retrieved_items: List[Tuple[float, Dict[str, Any]]],
+    use_gemini: bool,
+    gemini_client=None,
+    gemini_model: str = "",
+    context: Optional[str] = None
+) -> Iterator[str]:
+    """
+    Yields answer text pieces as Gemini produces them (generate_content_stream).
+    Extractive mode, or nothing retrieved, yields the whole answer as one piece.
+    Citations/context come from answer_sources(); pass its context to avoid packing it twice.
+    """
+    if not retrieved_items:
+        yield "I don't know."
+        return
+    if not use_gemini:
+        yield extractive_answer(question, retrieved_items)
+        return
 
-    return {"answer": answer, "citations": citations, "context": context}
+    if context is None:
+        context = answer_sources(retrieved_items, question)["context"]
+    # includes the consumer's time between pieces
+    with span("generation"):
+        for chunk in gemini_client.models.generate_content_stream(
+            model=gemini_model,
+            contents=_build_prompt(question, context)
+        ):
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+async def stream_answer_async(
+    question: str,
+    retrieved_items: List[Tuple[float, Dict[str, Any]]],
+    gemini_client,
+    gemini_model: str,
+    context: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Async-client version of stream_answer (Gemini only).
+    """
+    if not retrieved_items:
+        yield "I don't know."
+        return
+
+    if context is None:
+        context = answer_sources(retrieved_items, question)["context"]
+    stream = gemini_client.aio.models.generate_content_stream(
+        model=gemini_model,
+        contents=_build_prompt(question, context)
+    )
+    # newer google-genai returns a coroutine resolving to the async iterator
+    if inspect.isawaitable(stream):
+        stream = await stream
+    try:
+        async for chunk in stream:
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+    finally:
+        # closed early (client gone, timeout fallback): end the HTTP stream too
+        close = getattr(stream, "aclose", None)
+        if close is not None:
+            await close()
@@ -1,7 +1,53 @@
 from typing import List, Dict, Any, Tuple
 import numpy as np
 
+from .config import SETTINGS
 from .vectorstore import FaissStore
+from .telemetry import span
+
+def mmr_select_batch(
+    rel: np.ndarray,
+    candidate_vecs: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    valid: np.ndarray = None
+) -> np.ndarray:
+    """
+    Vectorized MMR for a batch of B queries with N candidates each.
+    rel: (B, N) relevance scores (cosine via IP from FAISS)
+    candidate_vecs: (B, N, d) normalized vectors aligned with rel
+    valid: optional (B, N) bool mask for padded candidate slots
+    Returns (B, min(k, N)) candidate positions in selection order, -1 where a row ran out.
+
+    Keeps a running max-similarity-to-selected vector per query and updates it with
+    one (B, N) product per round, so the cost is O(k·N·d) instead of a Python loop
+    over all selected pairs.
+    """
+    rel = np.asarray(rel, dtype="float32")
+    B, N = rel.shape
+    k = min(k, N)
+    rows = np.arange(B)
+
+    available = np.ones((B, N), dtype=bool) if valid is None else np.asarray(valid, dtype=bool).copy()
+    max_sim = np.full((B, N), -np.inf, dtype="float32")
+    chosen = np.full((B, k), -1, dtype="int64")
+
+    for step in range(k):
+        # start with best relevance, then trade relevance against redundancy
+        score = rel if step == 0 else lambda_mult * rel - (1 - lambda_mult) * max_sim
+        score = np.where(available, score, -np.inf)
+        pick = score.argmax(axis=1)
+        has = available[rows, pick]
+        if not has.any():
+            break
+        chosen[:, step] = np.where(has, pick, -1)
+        available[rows, pick] = False
+
+        picked_vecs = candidate_vecs[rows, pick]  # (B, d)
+        sim = np.einsum("bnd,bd->bn", candidate_vecs, picked_vecs)
+        max_sim = np.maximum(max_sim, sim)
+
+    return chosen
 
 def mmr_select(
     query_vec: np.ndarray,
@@ -18,58 +64,79 @@ def mmr_select(
     if not candidates:
         return []
 
-    selected = []
-    selected_idxs = []
-
     # relevance is the score already from FAISS (cosine via IP)
     rel = np.array([c[0] for c in candidates], dtype="float32")
-
-    # similarity between candidates
-    sim = candidate_vecs @ candidate_vecs.T  # (N, N)
-
-    # start with best relevance
-    first = int(rel.argmax())
-    selected_idxs.append(first)
-    selected.append(candidates[first])
-
-    while len(selected) < min(k, len(candidates)):
-        remaining = [i for i in range(len(candidates)) if i not in selected_idxs]
-        best_i = None
-        best_score = -1e9
-        for i in remaining:
-            diversity = max(sim[i, j] for j in selected_idxs)
-            mmr_score = lambda_mult * rel[i] - (1 - lambda_mult) * diversity
-            if mmr_score > best_score:
-                best_score = mmr_score
-                best_i = i
-        selected_idxs.append(best_i)
-        selected.append(candidates[best_i])
-
-    return selected
+    order = mmr_select_batch(rel[None, :], np.asarray(candidate_vecs)[None, :, :], k, lambda_mult)[0]
+    return [candidates[i] for i in order.tolist() if i != -1]
 
 def retrieve(
     store: FaissStore,
     embed_query_fn,
     query: str,
     top_k: int,
-    use_mmr: bool = True
+    use_mmr: bool = True,
+    lambda_mult: float = SETTINGS.mmr_lambda,
+    candidate_k: int = SETTINGS.mmr_candidate_k
 ) -> List[Tuple[float, Dict[str, Any]]]:
     """
     Retrieves chunks. If MMR enabled, expands candidates and selects diverse top_k.
+    lambda_mult: 1.0 = pure relevance, 0.0 = pure diversity.
+    candidate_k: cap on how many FAISS hits MMR chooses from.
     """
-    qv = embed_query_fn(query)  # (1, d)
+    with span("query_embed"):
+        qv = embed_query_fn(query)  # (1, d)
     if not use_mmr:
-        return store.search(qv, top_k)
+        with span("faiss_search"):
+            return store.search(qv, top_k)
 
     # Get more candidates first, then select top_k via MMR
-    candidate_k = min(30, max(top_k * 5, top_k))
-    cands = store.search(qv, candidate_k)
+    candidate_k = min(candidate_k, max(top_k * 5, top_k))
+    with span("faiss_search"):
+        scores, ids = store.search_ids(qv, candidate_k)
+        cands = list(zip(scores.tolist(), store.get_items(ids)))
 
-    # Need candidate vectors for MMR diversity:
-    # We approximate by re-embedding candidate texts (fast enough for demo),
-    # or you can persist vectors in meta for production.
-    texts = [c[1]["text"] for c in cands]
-    vecs = embed_query_fn.__self__.embed_texts(texts)  # using Embedder instance
-    selected = mmr_select(qv, cands, vecs, k=top_k)
+        # Candidate vectors for MMR diversity come straight from the store
+        # (persisted at build time), so no chunk text is re-embedded per query.
+        vecs = store.get_vectors(ids)
+    with span("mmr"):
+        selected = mmr_select(qv, cands, vecs, k=top_k, lambda_mult=lambda_mult)
 
     return selected
+
+def retrieve_many(
+    store: FaissStore,
+    embed_queries_fn,
+    queries: List[str],
+    top_k: int,
+    use_mmr: bool = True,
+    lambda_mult: float = SETTINGS.mmr_lambda,
+    candidate_k: int = SETTINGS.mmr_candidate_k
+) -> List[List[Tuple[float, Dict[str, Any]]]]:
+    """
+    Batched retrieve(): embeds all queries in one model call (e.g. Embedder.embed_queries),
+    searches them in one FAISS call and runs MMR for the whole batch at once.
+    Returns one (score, item) list per query, in input order.
+    """
+    if not queries:
+        return []
+    with span("query_embed"):
+        qv = embed_queries_fn(list(queries))  # (B, d)
+    if not use_mmr:
+        with span("faiss_search"):
+            return store.search_batch(qv, top_k)
+
+    candidate_k = min(candidate_k, max(top_k * 5, top_k))
+    with span("faiss_search"):
+        scores, ids = store.search_ids_batch(qv, candidate_k)  # (B, C), -1 padded
+        valid = ids != -1
+
+        vecs = np.zeros((ids.shape[0], ids.shape[1], qv.shape[1]), dtype="float32")
+        vecs[valid] = store.get_vectors(ids[valid])
+    with span("mmr"):
+        order = mmr_select_batch(scores, vecs, top_k, lambda_mult, valid=valid)
+
+    results = []
+    for b, picks in enumerate(order.tolist()):
+        picks = [i for i in picks if i != -1]
+        results.append(list(zip(scores[b, picks].tolist(), store.get_items(ids[b, picks]))))
+    return results
@@ -0,0 +1,174 @@
+"""
+Time-bucketed latency rollups for runs.db.
+
+The `rollups` table holds one row per (granularity, bucket, stage), where
+granularity is minute or hour. Each row keeps count / sum / max plus a
+log-scale histogram (10% wide bins). Histograms merge by addition, so buckets
+are updated incrementally as the telemetry writer inserts runs, and p50/p95/p99
+stay available after raw rows are compacted away.
+"""
+import math
+import sqlite3
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+from .config import SETTINGS
+from .utils import now_ms
+
+GRANULARITY_MS = {"minute": 60_000, "hour": 3_600_000}
+
+# run-level timings rolled up alongside the spans (telemetry.SPAN_NAMES)
+RUN_STAGES = {"total": "total_ms", "retrieval": "retrieval_ms", "generation": "generation_ms", "ttft": "ttft_ms"}
+
+# histogram bins: [0, 0.1ms), then 10% wide bins up to ~20 minutes, then overflow
+_BASE_MS = 0.1
+_GROWTH = 1.1
+_N_BINS = 175
+_EDGES = _BASE_MS * _GROWTH ** np.arange(_N_BINS)
+_MIDS = np.concatenate([[_BASE_MS / 2], np.sqrt(_EDGES[:-1] * _EDGES[1:]), [_EDGES[-1]]])
+
+ROLLUP_COLUMNS = ("granularity", "bucket_ms", "stage", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+def create_schema(cur: sqlite3.Cursor) -> None:
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rollups (
+        granularity TEXT,
+        bucket_ms INTEGER,
+        stage TEXT,
+        count INTEGER,
+        sum_ms REAL,
+        max_ms REAL,
+        p50_ms REAL,
+        p95_ms REAL,
+        p99_ms REAL,
+        hist BLOB,
+        PRIMARY KEY (granularity, bucket_ms, stage)
+    )
+    """)
+
+def _bins(values: np.ndarray) -> np.ndarray:
+    idx = np.searchsorted(_EDGES, values, side="right")  # 0 .. _N_BINS
+    return np.bincount(idx, minlength=_N_BINS + 1).astype("int64")
+
+def _percentiles(hist: np.ndarray, count: int, max_ms: float) -> List[float]:
+    cum = np.cumsum(hist)
+    out = []
+    for q in (0.50, 0.95, 0.99):
+        b = int(np.searchsorted(cum, max(1, math.ceil(q * count))))
+        out.append(float(min(_MIDS[b], max_ms)))
+    return out
+
+def stage_values(row: Dict[str, Any]) -> Dict[str, float]:
+    """
+    {stage: ms} for one logged run: run-level timings plus its spans.
+    """
+    vals = {stage: row.get(col) for stage, col in RUN_STAGES.items()}
+    vals.update(row.get("spans") or {})
+    return {k: float(v) for k, v in vals.items() if v is not None}
+
+def update_rollups(conn: sqlite3.Connection, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Folds logged runs into the minute and hour rollups; call inside the writer's
+    transaction. Returns the number of buckets touched.
+    """
+    groups: Dict[Tuple[str, int, str], List[float]] = defaultdict(list)
+    for row in rows:
+        ts = int(row.get("ts_ms") or now_ms())
+        for stage, ms in stage_values(row).items():
+            for gran, width in GRANULARITY_MS.items():
+                groups[(gran, ts - ts % width, stage)].append(ms)
+
+    for (gran, bucket, stage), values in groups.items():
+        values = np.asarray(values, dtype="float64")
+        hist = _bins(values)
+        count, total, peak = len(values), float(values.sum()), float(values.max())
+        old = conn.execute(
+            "SELECT count, sum_ms, max_ms, hist FROM rollups WHERE granularity = ? AND bucket_ms = ? AND stage = ?",
+            (gran, bucket, stage)
+        ).fetchone()
+        if old is not None:
+            count += old[0]
+            total += old[1]
+            peak = max(peak, old[2])
+            hist += np.frombuffer(old[3], dtype="int64")
+        p50, p95, p99 = _percentiles(hist, count, peak)
+        conn.execute("""
+        INSERT OR REPLACE INTO rollups (granularity, bucket_ms, stage, count, sum_ms, max_ms, p50_ms, p95_ms, p99_ms, hist)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (gran, bucket, stage, count, total, peak, p50, p95, p99, hist.tobytes()))
+    return len(groups)
+
+def backfill(conn: sqlite3.Connection, batch: int = 5000) -> int:
+    """
+    Builds rollups from raw runs + spans already in the db (runs.db files that
+    predate rollups). No-op once any rollup exists. Returns runs processed.
+    """
+    if conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone():
+        return 0
+    done, last_id = 0, 0
+    while True:
+        runs = conn.execute("""
+        SELECT id, ts_ms, total_ms, retrieval_ms, generation_ms, ttft_ms
+        FROM runs WHERE id > ? ORDER BY id LIMIT ?
+        """, (last_id, batch)).fetchall()
+        if not runs:
+            return done
+        spans = defaultdict(dict)
+        for run_id, name, ms in conn.execute(
+            "SELECT run_id, name, ms FROM spans WHERE run_id > ? AND run_id <= ?", (last_id, runs[-1][0])
+        ):
+            spans[run_id][name] = ms
+        update_rollups(conn, [{
+            "ts_ms": ts, "total_ms": total, "retrieval_ms": retrieval, "generation_ms": generation,
+            "ttft_ms": ttft, "spans": spans.get(run_id),
+        } for run_id, ts, total, retrieval, generation, ttft in runs])
+        done += len(runs)
+        last_id = runs[-1][0]
+
+def compact(conn: sqlite3.Connection, now: Optional[int] = None) -> Dict[str, int]:
+    """
+    Retention: raw runs/spans/profiles older than TELEMETRY_RAW_DAYS are deleted (their
+    timings live on in the rollups), minute rollups after TELEMETRY_MINUTE_DAYS,
+    hour rollups after TELEMETRY_HOUR_DAYS.
+    """
+    now = now or now_ms()
+    day = 86_400_000
+    raw_cut = now - SETTINGS.telemetry_raw_days * day
+    # by timestamp, not id range: batched writes and client-supplied ts_ms can
+    # leave a newer run with a smaller id than an older one
+    old_runs = "SELECT id FROM runs WHERE ts_ms < ?"
+    deleted = {
+        "spans": conn.execute(f"DELETE FROM spans WHERE run_id IN ({old_runs})", (raw_cut,)).rowcount,
+        "profiles": conn.execute(f"DELETE FROM profiles WHERE run_id IN ({old_runs})", (raw_cut,)).rowcount,
+        "runs": conn.execute("DELETE FROM runs WHERE ts_ms < ?", (raw_cut,)).rowcount,
+    }
+    deleted["minute_rollups"] = conn.execute(
+        "DELETE FROM rollups WHERE granularity = 'minute' AND bucket_ms < ?",
+        (now - SETTINGS.telemetry_minute_days * day,)
+    ).rowcount
+    deleted["hour_rollups"] = conn.execute(
+        "DELETE FROM rollups WHERE granularity = 'hour' AND bucket_ms < ?",
+        (now - SETTINGS.telemetry_hour_days * day,)
+    ).rowcount
+    return deleted
+
+def fetch_rollups(
+    conn: sqlite3.Connection,
+    granularity: str,
+    start_ms: int,
+    end_ms: int,
+    stages: Optional[List[str]] = None
+) -> List[tuple]:
+    """
+    ROLLUP_COLUMNS rows for buckets in [start_ms, end_ms), ordered by time.
+    """
+    sql = """
+    SELECT granularity, bucket_ms, stage, count, sum_ms / count, p50_ms, p95_ms, p99_ms, max_ms
+    FROM rollups WHERE granularity = ? AND bucket_ms >= ? AND bucket_ms < ?
+    """
+    params: List[Any] = [granularity, start_ms - start_ms % GRANULARITY_MS[granularity], end_ms]
+    if stages:
+        sql += f" AND stage IN ({','.join('?' * len(stages))})"
+        params += list(stages)
+    return conn.execute(sql + " ORDER BY bucket_ms", params).fetchall()
@@ -0,0 +1,104 @@
+"""
+Async serving helpers for api.py.
+
+CPU-bound work (query embedding, FAISS search, MMR) runs on a dedicated thread pool
+sized to the CPU count, so the event loop only waits on it. An admission limit and
+per-stage timeouts turn overload into fast 503s instead of an ever-growing queue.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .config import SETTINGS
+
+class Overloaded(Exception):
+    """
+    Request was not admitted, or a stage exceeded its timeout. api.py maps it to 503.
+    """
+    def __init__(self, reason: str, stage: str = "admission"):
+        super().__init__(reason)
+        self.reason = reason
+        self.stage = stage
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+def cpu_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(
+            max_workers=max(1, SETTINGS.api_cpu_workers), thread_name_prefix="rag-cpu"
+        )
+    return _EXECUTOR
+
+def shutdown_executor() -> None:
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _EXECUTOR = None
+
+async def run_cpu(stage: str, timeout_s: float, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs fn on the CPU executor; raises Overloaded(stage) if it takes longer than timeout_s.
+    The worker thread can't be interrupted, but the request is released immediately.
+    fn runs in a copy of the caller's context, so telemetry spans it records land
+    in the request's collect_spans() dict.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    fut = loop.run_in_executor(cpu_executor(), lambda: ctx.run(fn, *args, **kwargs))
+    try:
+        return await asyncio.wait_for(fut, timeout=timeout_s)
+    except asyncio.TimeoutError:
+        raise Overloaded(f"{stage} exceeded {timeout_s}s", stage=stage)
+
+class AdmissionLimiter:
+    """
+    At most max_inflight requests in the handler at once. A request that can't get
+    a slot within max_wait_s is rejected with Overloaded rather than queued.
+
+        async with admission:
+            ...
+
+    acquire() / release() are for responses that outlive the handler (streaming).
+    """
+    def __init__(self, max_inflight: int, max_wait_s: float = 0.0):
+        self.max_inflight = max(1, max_inflight)
+        self.max_wait_s = max_wait_s
+        self._sem: Optional[asyncio.Semaphore] = None
+        self.inflight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_inflight)
+        try:
+            if self._sem.locked() and self.max_wait_s <= 0:
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(self._sem.acquire(), timeout=max(self.max_wait_s, 1e-3))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(f"more than {self.max_inflight} requests in flight")
+        self.inflight += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._sem.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
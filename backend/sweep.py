@@ -0,0 +1,260 @@
+"""
+Chunking parameter sweep: compares CHUNK_TOKENS / CHUNK_OVERLAP (and chunk mode)
+settings without re-running ingest once per setting.
+
+  1) extraction: every PDF is parsed once with load_pdf_pages (process pool)
+  2) chunking:   one job per config in a process pool that receives the pages once
+                 per worker (sentence mode needs the embedder's tokenizer and is
+                 chunked in the parent while the pool runs)
+  3) embedding:  the union of chunk texts across configs, each distinct text once
+                 (the embedder's on-disk chunk cache also skips texts seen in earlier runs)
+  4) scoring:    per config, a FaissStore in a temp dir, retrieval latency over the
+                 eval questions and evaluate_retrieval() metrics
+
+Configs are scored one after another so latency numbers don't compete for cores.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import os
+import tempfile
+import time
+import numpy as np
+
+from .chunking import CHUNK_MODES, chunk_pages
+from .config import SETTINGS
+from .eval import evaluate_retrieval, relevance_kind
+from .pipeline import _extract, _page_jobs, make_chunker
+from .retriever import retrieve
+from .utils import ensure_dir, write_json
+from .vectorstore import FaissStore
+
+SWEEP_REPORT_FILE = "chunk_sweep.json"
+EMBED_BATCH = 256
+
+def parse_configs(spec: str, default_mode: str = "tokens") -> List[Dict[str, Any]]:
+    """
+    "300/50, 420/80, sentences:380/60" -> [{mode, chunk_tokens, overlap}, ...]
+    Entries are chunk_tokens/overlap, optionally prefixed with a chunk mode.
+    """
+    configs = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        mode, _, sizes = part.rpartition(":")
+        mode = mode.strip() or default_mode
+        if mode not in CHUNK_MODES:
+            raise ValueError(f"unknown chunk mode {mode!r} in {part!r}")
+        size, _, overlap = sizes.partition("/")
+        cfg = {"mode": mode, "chunk_tokens": int(size), "overlap": int(overlap or 0)}
+        if cfg["chunk_tokens"] <= 0 or not 0 <= cfg["overlap"] < cfg["chunk_tokens"]:
+            raise ValueError(f"need 0 <= overlap < chunk_tokens in {part!r}")
+        if cfg not in configs:
+            configs.append(cfg)
+    return configs
+
+def config_label(cfg: Dict[str, Any]) -> str:
+    return f"{cfg['mode']} {cfg['chunk_tokens']}/{cfg['overlap']}"
+
+def extract_pages(paths: List[str], workers: int = SETTINGS.ingest_workers, pages_per_job: int = 8) -> List[Dict[str, Any]]:
+    """
+    Every page of every PDF, in (source, page) order.
+    """
+    jobs = _page_jobs(paths, pages_per_job)
+    if workers <= 0:
+        parts = [_extract(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_extract, jobs))
+    return sorted((p for part in parts for p in part), key=lambda p: (p["source"], p["page"]))
+
+# ---- chunking workers ----
+
+_PAGES: List[Dict[str, Any]] = []
+
+def _init_pages(pages: List[Dict[str, Any]]) -> None:
+    # pool initializer: each worker receives the pages once, not once per config
+    global _PAGES
+    _PAGES = pages
+
+def _chunk_tokens_job(cfg: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], float]:
+    # top-level so it pickles into worker processes (spawn on Windows / macOS)
+    t0 = time.perf_counter()
+    chunks = chunk_pages(_PAGES, cfg["chunk_tokens"], cfg["overlap"])
+    return chunks, time.perf_counter() - t0
+
+def _dedupe(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # same rule as IngestPipeline: one chunk per chunk_id (ids key the FAISS index)
+    seen = set()
+    out = []
+    for c in chunks:
+        if c["chunk_id"] not in seen:
+            seen.add(c["chunk_id"])
+            out.append(c)
+    return out
+
+def chunk_configs(
+    pages: List[Dict[str, Any]],
+    configs: List[Dict[str, Any]],
+    embedder=None,
+    workers: int = SETTINGS.ingest_workers
+) -> List[Tuple[List[Dict[str, Any]], float]]:
+    """
+    (chunks, chunk seconds) per config, in config order.
+    Token-window configs run in a process pool; sentence configs need
+    embedder.count_tokens and run in this process meanwhile.
+    """
+    out: List[Optional[Tuple[List[Dict[str, Any]], float]]] = [None] * len(configs)
+    token_jobs = [i for i, cfg in enumerate(configs) if cfg["mode"] != "sentences"]
+
+    def run_local(i: int) -> None:
+        cfg = configs[i]
+        chunker = make_chunker(cfg["mode"], cfg["chunk_tokens"], cfg["overlap"], embedder)
+        t0 = time.perf_counter()
+        chunks = chunker(pages)
+        out[i] = (chunks, time.perf_counter() - t0)
+
+    if workers <= 0 or len(token_jobs) < 2:
+        for i in range(len(configs)):
+            run_local(i)
+    else:
+        n = min(workers, len(token_jobs))
+        with ProcessPoolExecutor(max_workers=n, initializer=_init_pages, initargs=(pages,)) as pool:
+            futures = {i: pool.submit(_chunk_tokens_job, configs[i]) for i in token_jobs}
+            for i in range(len(configs)):
+                if i not in futures:
+                    run_local(i)
+            for i, fut in futures.items():
+                out[i] = fut.result()
+    return [(_dedupe(chunks), secs) for chunks, secs in out]
+
+# ---- scoring ----
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def _latency(store: FaissStore, embed_query_fn, questions: List[str], top_k: int, use_mmr: bool) -> Dict[str, float]:
+    retrieve(store, embed_query_fn, questions[0], top_k, use_mmr)  # warm-up
+    ms = []
+    for q in questions:
+        t0 = time.perf_counter()
+        retrieve(store, embed_query_fn, q, top_k, use_mmr)
+        ms.append((time.perf_counter() - t0) * 1000)
+    return {
+        "retrieve_p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "retrieve_p95_ms": round(float(np.percentile(ms, 95)), 3),
+    }
+
+def sweep_chunking(
+    paths: List[str],
+    configs: List[Dict[str, Any]],
+    embed_fn: Callable[[List[str]], np.ndarray],
+    embed_queries_fn: Callable[[List[str]], np.ndarray],
+    eval_items: List[Dict[str, Any]],
+    ks: Sequence[int] = (1, 3, 5, 10),
+    top_k: int = SETTINGS.top_k,
+    use_mmr: bool = SETTINGS.use_mmr,
+    index_type: str = None,
+    embedder=None,
+    workers: int = SETTINGS.ingest_workers,
+    out_dir: Optional[str] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Extracts the PDFs once, builds one index per chunk config and scores each with
+    the eval set. embedder is only needed for sentence-mode configs.
+
+    Eval items are matched by source / page / expected phrase; chunk_ids
+    annotations are ignored since ids change with the chunking.
+
+    Returns {pages, extract_s, embedding: {chunks, unique_texts, embedded, embed_s},
+    eval: {n, skipped}, rows: one per config, elapsed_s}. Each row has chunks,
+    avg_tokens, chunk_s, new_texts (distinct texts no earlier config produced),
+    build_s, index_mb, retrieve_p50_ms / retrieve_p95_ms, and hit_rate@k / mrr@k /
+    ndcg@k for every k (plain similarity ranking).
+    """
+    def progress(stage: str, done: int, total: int) -> None:
+        if on_progress:
+            on_progress({"stage": stage, "done": done, "total": total, "elapsed_s": round(time.time() - t0, 1)})
+
+    t0 = time.time()
+    ks = sorted({int(k) for k in ks if int(k) > 0})
+    items = [{k: v for k, v in it.items() if k != "chunk_ids"} for it in eval_items]
+    items = [it for it in items if relevance_kind(it)]
+    report: Dict[str, Any] = {
+        "configs": configs, "ks": ks, "top_k": top_k, "use_mmr": use_mmr,
+        "eval": {"n": len(items), "skipped": len(eval_items) - len(items)}, "rows": [],
+    }
+
+    progress("extract", 0, len(paths))
+    t = time.perf_counter()
+    pages = extract_pages(paths, workers)
+    report["pages"] = len(pages)
+    report["extract_s"] = round(time.perf_counter() - t, 3)
+    if not pages or not configs:
+        report["elapsed_s"] = round(time.time() - t0, 3)
+        return report
+
+    progress("chunk", 0, len(configs))
+    chunked = chunk_configs(pages, configs, embedder, workers)
+    del pages
+
+    # every distinct text once, in first-seen order, so new_texts is per config
+    text_row: Dict[str, int] = {}
+    new_texts = []
+    for chunks, _secs in chunked:
+        before = len(text_row)
+        for c in chunks:
+            text_row.setdefault(c["text"], len(text_row))
+        new_texts.append(len(text_row) - before)
+    texts = list(text_row)
+    report["embedding"] = {"chunks": sum(len(c) for c, _ in chunked), "unique_texts": len(texts)}
+
+    t = time.perf_counter()
+    parts = []
+    for i in range(0, len(texts), EMBED_BATCH):
+        progress("embed", i, len(texts))
+        parts.append(np.asarray(embed_fn(texts[i:i + EMBED_BATCH]), dtype="float32"))
+    progress("embed", len(texts), len(texts))
+    vectors = np.concatenate(parts) if parts else np.zeros((0, 0), dtype="float32")
+    report["embedding"].update({"embedded": len(texts), "embed_s": round(time.perf_counter() - t, 3)})
+    del texts
+
+    questions = [it["question"] for it in items]
+    qvecs = np.asarray(embed_queries_fn(questions), dtype="float32") if questions else None
+    qv_by_text = {q: qvecs[i:i + 1] for i, q in enumerate(questions)}
+    embed_query = lambda q: qv_by_text[q]
+    embed_queries = lambda qs: np.concatenate([qv_by_text[q] for q in qs])
+
+    for n, (cfg, (chunks, chunk_s), new) in enumerate(zip(configs, chunked, new_texts)):
+        progress("index", n, len(configs))
+        row: Dict[str, Any] = {"config": config_label(cfg), **cfg, "chunks": len(chunks)}
+        row["avg_tokens"] = round(float(np.mean([c["token_count"] for c in chunks])), 1) if chunks else 0.0
+        row["chunk_s"] = round(chunk_s, 3)
+        row["new_texts"] = new
+        if not chunks:
+            report["rows"].append(row)
+            continue
+        vecs = vectors[[text_row[c["text"]] for c in chunks]]
+        with tempfile.TemporaryDirectory() as d:
+            store = FaissStore(d)
+            t = time.perf_counter()
+            store.build(vecs, chunks, index_type=index_type)
+            row["build_s"] = round(time.perf_counter() - t, 3)
+            row["index"] = store.meta.get("index", {}).get("type")
+            row["index_mb"] = round(_dir_bytes(d) / 2**20, 2)
+            if questions:
+                row.update(_latency(store, embed_query, questions, top_k, use_mmr))
+                res = evaluate_retrieval(store, embed_queries, items, ks)
+                for r in res["rows"]:
+                    for metric in ("hit_rate", "mrr", "ndcg"):
+                        row[f"{metric}@{r['k']}"] = r[metric]
+            del store
+        report["rows"].append(row)
+    progress("index", len(configs), len(configs))
+
+    report["elapsed_s"] = round(time.time() - t0, 3)
+    if out_dir:
+        ensure_dir(out_dir)
+        write_json(os.path.join(out_dir, SWEEP_REPORT_FILE), report)
+    return report
@@ -1,36 +1,137 @@
+import atexit
+import json
+import logging
+import queue
 import sqlite3
-from typing import Any, Dict
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
 from .config import SETTINGS
 from .utils import ensure_dir, now_ms
+from . import rollups
+
+# fetch_runs() row layout
+RUN_COLUMNS = (
+    "ts_ms", "query", "top_k", "use_mmr", "retrieval_ms", "generation_ms", "total_ms", "citations",
+    "ttft_ms", "cache_hit", "saved_ms", "prompt_tokens",
+)
+# added after the original schema; init_db() migrates existing runs.db files
+ADDED_COLUMNS = ("ttft_ms", "cache_hit", "saved_ms", "prompt_tokens")
+
+# per-request stages recorded in the spans table (see span())
+SPAN_NAMES = ("query_embed", "faiss_search", "mmr", "context_build", "generation")
+
+_log = logging.getLogger(__name__)
+
+_db_ready = set()
+_db_lock = threading.Lock()
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(SETTINGS.runs_db_path, timeout=10)
+    # WAL: readers (dashboard) don't block the writer; NORMAL: no fsync per commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
 
 def init_db():
-    ensure_dir(SETTINGS.outputs_dir)
-    conn = sqlite3.connect(SETTINGS.runs_db_path)
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS runs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ts_ms INTEGER,
-        query TEXT,
-        top_k INTEGER,
-        use_mmr INTEGER,
-        retrieval_ms INTEGER,
-        generation_ms INTEGER,
-        total_ms INTEGER,
-        citations TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
+    """
+    Creates / migrates the schema, once per process and db path.
+    """
+    with _db_lock:
+        if SETTINGS.runs_db_path in _db_ready:
+            return
+        ensure_dir(SETTINGS.outputs_dir)
+        conn = _connect()
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts_ms INTEGER,
+            query TEXT,
+            top_k INTEGER,
+            use_mmr INTEGER,
+            retrieval_ms INTEGER,
+            generation_ms INTEGER,
+            total_ms INTEGER,
+            citations TEXT,
+            ttft_ms INTEGER,
+            cache_hit INTEGER,
+            saved_ms INTEGER,
+            prompt_tokens INTEGER
+        )
+        """)
+        # runs.db files from older versions lack the newer columns
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(runs)")}
+        for name in ADDED_COLUMNS:
+            if name not in cols:
+                cur.execute(f"ALTER TABLE runs ADD COLUMN {name} INTEGER")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS spans (
+            run_id INTEGER,
+            name TEXT,
+            ms REAL
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS spans_run_id ON spans (run_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS runs_ts_ms ON runs (ts_ms)")
+        # profiling.RequestProfile.finish() output for profiled runs
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS profiles (
+            run_id INTEGER PRIMARY KEY,
+            wall_ms REAL,
+            peak_kb REAL,
+            functions TEXT,
+            allocations TEXT
+        )
+        """)
+        rollups.create_schema(cur)
+        conn.commit()
+        # one-off: rollups for runs logged before rollups existed
+        with conn:
+            rollups.backfill(conn)
+        conn.close()
+        _db_ready.add(SETTINGS.runs_db_path)
 
-def log_run(row: Dict[str, Any]):
-    init_db()
-    conn = sqlite3.connect(SETTINGS.runs_db_path)
-    cur = conn.cursor()
-    cur.execute("""
-    INSERT INTO runs (ts_ms, query, top_k, use_mmr, retrieval_ms, generation_ms, total_ms, citations)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+# ---- per-stage spans ----
+
+_SPANS: ContextVar[Optional[Dict[str, float]]] = ContextVar("telemetry_spans", default=None)
+
+@contextmanager
+def collect_spans(spans: Optional[Dict[str, float]] = None):
+    """
+    Collects span() timings recorded in this context into a dict {stage: ms}.
+    Pass an existing dict to keep adding to it. Code run via
+    contextvars.copy_context() (e.g. serving.run_cpu) records into the same dict.
+    """
+    spans = {} if spans is None else spans
+    token = _SPANS.set(spans)
+    try:
+        yield spans
+    finally:
+        _SPANS.reset(token)
+
+@contextmanager
+def span(name: str):
+    """
+    Times a stage into the active collect_spans() dict; a no-op outside one.
+    Repeated stages accumulate.
+    """
+    spans = _SPANS.get()
+    if spans is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans[name] = spans.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+# ---- background writer ----
+
+def _run_values(row: Dict[str, Any]) -> tuple:
+    return (
         row.get("ts_ms", now_ms()),
         row.get("query", ""),
         row.get("top_k", 0),
@@ -39,20 +140,263 @@ def log_run(row: Dict[str, Any]):
         row.get("generation_ms", 0),
         row.get("total_ms", 0),
         row.get("citations", ""),
-    ))
-    conn.commit()
-    conn.close()
+        row.get("ttft_ms"),  # NULL for non-streamed runs
+        None if row.get("cache_hit") is None else int(bool(row["cache_hit"])),  # NULL when the cache wasn't consulted
+        row.get("saved_ms"),  # generation time a cache hit avoided
+        row.get("prompt_tokens"),  # NULL when no prompt was sent (cache hit / extractive)
+    )
+
+class TelemetryWriter:
+    """
+    Background thread owning one long-lived WAL connection. log_run() only
+    enqueues; the thread inserts queued runs (and their spans) in one transaction
+    once batch_size rows are waiting or flush_interval_s after the first one,
+    folding them into the minute/hour rollups in the same transaction.
+    A full queue drops rows rather than blocking requests.
+    Retention (rollups.compact) runs at start and every compact_interval_s.
+    """
+    compact_interval_s = 600.0
+
+    def __init__(self, batch_size: int, flush_interval_s: float, max_queue: int):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self._q: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_compaction: Dict[str, int] = {}
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="telemetry-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row: Dict[str, Any]) -> None:
+        self._ensure_thread()
+        try:
+            self._q.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Blocks until everything queued so far is written (or timeout).
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._q.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _loop(self) -> None:
+        init_db()
+        conn = _connect()
+        last_compact = 0.0
+        while True:
+            if time.monotonic() - last_compact > self.compact_interval_s:
+                self._compact(conn)
+                last_compact = time.monotonic()
+            batch, markers = [], []
+            try:
+                item = self._q.get(timeout=self.compact_interval_s)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval_s
+            while True:
+                if isinstance(item, threading.Event):
+                    markers.append(item)  # flush(): write what we have now
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write(conn, batch)
+            finally:
+                for m in markers:  # a flush() never waits out its timeout
+                    m.set()
+
+    def _write(self, conn: sqlite3.Connection, rows: List[Dict[str, Any]]) -> None:
+        try:
+            with conn:
+                for row in rows:
+                    cur = conn.execute("""
+                    INSERT INTO runs (ts_ms, query, top_k, use_mmr, retrieval_ms, generation_ms, total_ms, citations,
+                                      ttft_ms, cache_hit, saved_ms, prompt_tokens)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, _run_values(row))
+                    spans = row.get("spans") or {}
+                    if spans:
+                        conn.executemany(
+                            "INSERT INTO spans (run_id, name, ms) VALUES (?, ?, ?)",
+                            [(cur.lastrowid, name, float(ms)) for name, ms in spans.items()]
+                        )
+                    prof = row.get("profile")
+                    if prof:
+                        conn.execute(
+                            "INSERT INTO profiles (run_id, wall_ms, peak_kb, functions, allocations) VALUES (?, ?, ?, ?, ?)",
+                            (cur.lastrowid, prof["wall_ms"], prof["peak_kb"],
+                             json.dumps(prof["functions"]), json.dumps(prof["allocations"]))
+                        )
+                rollups.update_rollups(conn, rows)
+            self.written += len(rows)
+            self.batches += 1
+        except Exception:
+            # telemetry must never take requests down (or this thread: a malformed
+            # row would stop all later writes); the batch is lost
+            self.errors += 1
+            _log.exception("telemetry: dropped a batch of %d runs", len(rows))
+
+    def _compact(self, conn: sqlite3.Connection) -> None:
+        try:
+            with conn:
+                self.last_compaction = rollups.compact(conn)
+        except Exception:
+            self.errors += 1
+            _log.exception("telemetry: compaction failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._q.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_compaction": self.last_compaction,
+        }
 
-def fetch_runs(limit: int = 200):
+WRITER = TelemetryWriter(SETTINGS.telemetry_batch_size, SETTINGS.telemetry_flush_ms / 1000.0, SETTINGS.telemetry_max_queue)
+atexit.register(WRITER.flush)
+
+def log_run(row: Dict[str, Any]):
+    """
+    Queues a run for the background writer; returns immediately.
+    row["spans"] ({stage: ms}, e.g. from collect_spans) goes to the spans table,
+    row["profile"] (profiling.RequestProfile.finish()) to the profiles table.
+    """
+    row = dict(row)
+    row.setdefault("ts_ms", now_ms())
+    WRITER.submit(row)
+
+def _range_clause(start_ms: Optional[int], end_ms: Optional[int], col: str = "ts_ms") -> Tuple[str, list]:
+    clauses, params = [], []
+    if start_ms is not None:
+        clauses.append(f"{col} >= ?")
+        params.append(int(start_ms))
+    if end_ms is not None:
+        clauses.append(f"{col} < ?")
+        params.append(int(end_ms))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def fetch_runs(limit: int = 200, start_ms: Optional[int] = None, end_ms: Optional[int] = None):
+    """
+    Latest runs (RUN_COLUMNS rows), optionally within [start_ms, end_ms).
+    Raw runs are only kept for TELEMETRY_RAW_DAYS; use fetch_rollups for history.
+    """
     init_db()
+    WRITER.flush()  # include this process's own queued runs
+    where, params = _range_clause(start_ms, end_ms)
     conn = sqlite3.connect(SETTINGS.runs_db_path)
     cur = conn.cursor()
-    cur.execute("""
-    SELECT ts_ms, query, top_k, use_mmr, retrieval_ms, generation_ms, total_ms, citations
-    FROM runs
-    ORDER BY id DESC
+    cur.execute(f"""
+    SELECT ts_ms, query, top_k, use_mmr, retrieval_ms, generation_ms, total_ms, citations,
+           ttft_ms, cache_hit, saved_ms, prompt_tokens
+    FROM runs{where}
+    ORDER BY ts_ms DESC
     LIMIT ?
-    """, (limit,))
+    """, (*params, limit))
     rows = cur.fetchall()
     conn.close()
     return rows
+
+def fetch_spans(limit: int = 200, start_ms: Optional[int] = None, end_ms: Optional[int] = None):
+    """
+    (ts_ms, name, ms) for the spans of the latest `limit` runs (optionally in a time range).
+    """
+    init_db()
+    WRITER.flush()
+    where, params = _range_clause(start_ms, end_ms)
+    conn = sqlite3.connect(SETTINGS.runs_db_path)
+    cur = conn.cursor()
+    cur.execute(f"""
+    SELECT r.ts_ms, s.name, s.ms
+    FROM spans s JOIN (SELECT id, ts_ms FROM runs{where} ORDER BY ts_ms DESC LIMIT ?) r ON s.run_id = r.id
+    """, (*params, limit))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+def rollup_granularity(start_ms: int, end_ms: int) -> str:
+    # minute buckets up to a day, hour buckets beyond
+    return "minute" if end_ms - start_ms <= 86_400_000 else "hour"
+
+def fetch_rollups(
+    start_ms: int,
+    end_ms: int,
+    granularity: Optional[str] = None,
+    stages: Optional[List[str]] = None
+):
+    """
+    rollups.ROLLUP_COLUMNS rows (count, mean/p50/p95/p99/max ms per stage and bucket)
+    for [start_ms, end_ms). granularity: minute | hour | None (picked from the range).
+    """
+    init_db()
+    WRITER.flush()
+    conn = sqlite3.connect(SETTINGS.runs_db_path)
+    rows = rollups.fetch_rollups(conn, granularity or rollup_granularity(start_ms, end_ms), start_ms, end_ms, stages)
+    conn.close()
+    return rows
+
+# ---- profiled runs ----
+
+PROFILED_RUN_COLUMNS = ("run_id", "ts_ms", "query", "total_ms", "retrieval_ms", "generation_ms", "wall_ms", "peak_kb")
+
+def fetch_profiled_runs(limit: int = 200):
+    """
+    PROFILED_RUN_COLUMNS rows, slowest first.
+    """
+    init_db()
+    WRITER.flush()
+    conn = sqlite3.connect(SETTINGS.runs_db_path)
+    rows = conn.execute("""
+    SELECT r.id, r.ts_ms, r.query, r.total_ms, r.retrieval_ms, r.generation_ms, p.wall_ms, p.peak_kb
+    FROM profiles p JOIN runs r ON r.id = p.run_id
+    ORDER BY r.total_ms DESC
+    LIMIT ?
+    """, (limit,)).fetchall()
+    conn.close()
+    return rows
+
+def fetch_profile(run_id: int) -> Optional[Dict[str, Any]]:
+    """
+    {wall_ms, peak_kb, functions, allocations, spans} for one profiled run, else None.
+    """
+    init_db()
+    conn = sqlite3.connect(SETTINGS.runs_db_path)
+    row = conn.execute(
+        "SELECT wall_ms, peak_kb, functions, allocations FROM profiles WHERE run_id = ?", (run_id,)
+    ).fetchone()
+    spans = dict(conn.execute("SELECT name, ms FROM spans WHERE run_id = ?", (run_id,)).fetchall())
+    conn.close()
+    if row is None:
+        return None
+    return {
+        "wall_ms": row[0],
+        "peak_kb": row[1],
+        "functions": json.loads(row[2] or "[]"),
+        "allocations": json.loads(row[3] or "[]"),
+        "spans": spans,
+    }
@@ -1,70 +1,410 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Callable
 import os
+import uuid
 import numpy as np
 import faiss
 
+from .config import SETTINGS
+from .index_factory import build_index, apply_search_params, wrap_with_ids
+from .metastore import MetaStore, META_FORMAT, faiss_id, migrate_meta_json, _save_npy_atomic
 from .utils import ensure_dir, write_json, read_json
 
 INDEX_FILE = "faiss.index"
 META_FILE = "meta.json"
+VECTORS_FILE = "vectors.npy"
+ID_SCHEME = "chunk_hash"  # FAISS ids are faiss_id(chunk_id), not row positions
 
 class FaissStore:
     """
     FAISS index + metadata store.
     Stores:
-      - FAISS vectors in index/faiss.index
-      - Metadata (aligned by vector position) in index/meta.json
+      - FAISS vectors in index/faiss.index (IndexIDMap keyed by faiss_id(chunk_id))
+      - Normalized vectors (aligned by row) in index/vectors.npy
+      - Chunk metadata + text (aligned by row) in a MetaStore (index/meta_*)
+      - A small header in index/meta.json: index type and build/search
+        parameters under meta["index"], and a version that changes on every save
+
+    Supports incremental updates (add_documents / delete_source / upsert_sources):
+    only new or changed chunks are embedded. Each update saves once by default;
+    with persist=False it stays in memory until the caller's save(), so a run
+    of updates writes the index files once. HNSW graphs can't remove nodes, so
+    deleted ids are tombstoned (meta["tombstones"], filtered out at search time)
+    and the graph is rebuilt once they exceed INDEX_COMPACT_FRACTION of the corpus.
     """
     def __init__(self, index_dir: str):
         self.index_dir = index_dir
         ensure_dir(index_dir)
         self.index_path = os.path.join(index_dir, INDEX_FILE)
         self.meta_path = os.path.join(index_dir, META_FILE)
+        self.vectors_path = os.path.join(index_dir, VECTORS_FILE)
 
         self.index = None
-        self.meta = {"items": []}
+        self.vectors = None
+        self.meta = {}
+        self.chunks = MetaStore()
+        self._order = None
+        self._search_params = None
 
-    def build(self, vectors: np.ndarray, items: List[Dict[str, Any]]) -> None:
+    def build(
+        self,
+        vectors: np.ndarray,
+        items: List[Dict[str, Any]],
+        index_type: str = None,
+        index_params: Dict[str, Any] = None,
+        persist: bool = True
+    ) -> None:
         """
+        Full rebuild.
         vectors: (N, d) float32 normalized
         items: list of chunk metadata + text
+        index_type: flat | ivf_flat | ivf_pq | hnsw | auto (default: SETTINGS.index_type)
+        index_params: overrides for nlist / nprobe / pq_m / hnsw_m / ef_search ...
         """
-        d = vectors.shape[1]
-        index = faiss.IndexFlatIP(d)  # inner product, good for normalized embeddings (cosine)
-        index.add(vectors)
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        ids = np.array([faiss_id(it["chunk_id"]) for it in items], dtype="int64")
+        # inner product on normalized embeddings == cosine, for every index type
+        index, info = build_index(
+            vectors,
+            index_type=index_type or SETTINGS.index_type,
+            params=index_params,
+            target_recall=SETTINGS.index_target_recall,
+            ids=ids
+        )
 
         self.index = index
-        self.meta = {"items": items}
-        self.save()
+        self.vectors = vectors
+        self.meta = {"index": info, "id_scheme": ID_SCHEME, "format": META_FORMAT}
+        self.chunks = MetaStore.from_items(items)
+        self._order = None
+        self._search_params = None
+        if persist:
+            self.save()
 
     def save(self) -> None:
         if self.index is None:
             return
         faiss.write_index(self.index, self.index_path)
+        self.chunks.save(self.index_dir)
+        self.meta["version"] = uuid.uuid4().hex[:12]
         write_json(self.meta_path, self.meta)
+        if self.vectors is not None:
+            self.vectors = np.array(self.vectors, dtype="float32")  # detach from the mapped file
+            _save_npy_atomic(self.vectors_path, self.vectors)
 
     def load(self) -> bool:
         if not (os.path.exists(self.index_path) and os.path.exists(self.meta_path)):
             return False
+        # one-shot upgrade of a monolithic meta.json (all items + text) to the columnar store
+        migrate_meta_json(self.index_dir)
+
         self.index = faiss.read_index(self.index_path)
         self.meta = read_json(self.meta_path)
+        self.chunks = MetaStore.load(self.index_dir) or MetaStore()
+        self._order = None
+        self._search_params = None
+        # Memory-mapped so only the rows we touch (e.g. MMR candidates) are paged in.
+        # Indexes built before vectors.npy existed fall back to index reconstruction.
+        if os.path.exists(self.vectors_path):
+            self.vectors = np.load(self.vectors_path, mmap_mode="r")
+        else:
+            self.vectors = self.index.reconstruct_n(0, self.index.ntotal)
+
+        if self.meta.get("id_scheme") != ID_SCHEME:
+            # legacy position-addressed index: re-key it by chunk id (no re-embedding),
+            # once; saved so later loads skip the rebuild
+            self._rebuild_index(self.meta.get("index", {"type": "flat"}))
+            self.meta["id_scheme"] = ID_SCHEME
+            self.save()
+        # nprobe / efSearch are not stored in faiss.index itself
+        apply_search_params(self.index, self.meta.get("index", {}))
+        # headers written before versioning: the index file's mtime stands in
+        self.meta.setdefault("version", f"m{int(os.path.getmtime(self.index_path))}")
         return True
 
+    @property
+    def version(self) -> str:
+        """
+        Identifies the saved index contents; changes on every save().
+        Caches derived from the index (answers, projections) are scoped by it.
+        """
+        return self.meta.get("version", "")
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def items(self, rows=None) -> List[Dict[str, Any]]:
+        """
+        Materializes chunk dicts (with text) for the given rows, or all rows.
+        """
+        return self.chunks.items(rows)
+
+    def source_counts(self) -> Dict[str, int]:
+        return self.chunks.source_counts()
+
+    def sources(self) -> List[str]:
+        return sorted(self.source_counts())
+
+    # ---- id <-> row bookkeeping ----
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.chunks.cols["id"]
+
+    def _sorted(self):
+        # lazily built on first lookup and dropped whenever rows change
+        if self._order is None:
+            self._order = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = np.asarray(self.ids)[self._order]
+        return self._order, self._sorted_ids
+
+    def rows_for(self, ids) -> np.ndarray:
+        """
+        Row positions (into chunks / vectors) for FAISS ids.
+        """
+        order, sorted_ids = self._sorted()
+        ids = np.asarray(ids, dtype="int64")
+        pos = np.searchsorted(sorted_ids, ids)
+        pos = np.minimum(pos, max(0, len(sorted_ids) - 1))
+        if len(ids) and (len(sorted_ids) == 0 or not np.array_equal(sorted_ids[pos], ids)):
+            raise KeyError("Unknown FAISS id(s) in store.")
+        return order[pos]
+
+    def has_ids(self, ids) -> np.ndarray:
+        _, sorted_ids = self._sorted()
+        ids = np.asarray(ids, dtype="int64")
+        if len(sorted_ids) == 0:
+            return np.zeros(len(ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return sorted_ids[pos] == ids
+
+    def get_items(self, ids) -> List[Dict[str, Any]]:
+        """
+        Chunk dicts for FAISS ids; only these rows' text is read from the blob.
+        """
+        return self.chunks.items(self.rows_for(ids).tolist())
+
+    # ---- search ----
+
+    def _tombstone_params(self):
+        """
+        HNSW search parameters excluding tombstoned ids (None when there are none).
+        Built once per change; holds the selectors so they outlive each search call.
+        """
+        tombstones = self.meta.get("tombstones")
+        if not tombstones:
+            return None
+        if self._search_params is None:
+            batch = faiss.IDSelectorBatch(np.asarray(tombstones, dtype="int64"))
+            sel = faiss.IDSelectorNot(batch)
+            params = faiss.SearchParametersHNSW()
+            params.sel = sel
+            # explicit params replace the index's own efSearch, so carry it over
+            params.efSearch = faiss.downcast_index(self.index.index).hnsw.efSearch
+            self._search_params = (params, sel, batch)
+        return self._search_params[0]
+
+    def search_ids_batch(self, query_vecs: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        One FAISS call for a (B, d) matrix of queries.
+        Returns (scores, ids), both (B, top_k), best-first; empty slots have id == -1.
+        """
+        if self.index is None:
+            raise RuntimeError("FAISS index not loaded. Build or load first.")
+        query_vecs = np.ascontiguousarray(query_vecs, dtype="float32")
+        params = self._tombstone_params()
+        if params is None:
+            return self.index.search(query_vecs, top_k)
+        return self.index.search(query_vecs, top_k, params=params)
+
+    def search_ids(self, query_vec: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Raw FAISS search for a single query.
+        Returns (scores, ids) best-first, with empty slots (id == -1) dropped.
+        """
+        scores, idxs = self.search_ids_batch(query_vec, top_k)
+        keep = idxs[0] != -1
+        return scores[0][keep], idxs[0][keep]
+
     def search(self, query_vec: np.ndarray, top_k: int) -> List[Tuple[float, Dict[str, Any]]]:
         """
         Returns list of (score, item) sorted best-first.
         """
+        scores, ids = self.search_ids(query_vec, top_k)
+        return list(zip(scores.tolist(), self.get_items(ids)))
+
+    def search_batch(self, query_vecs: np.ndarray, top_k: int) -> List[List[Tuple[float, Dict[str, Any]]]]:
+        """
+        Like search() for a (B, d) matrix of queries: one FAISS call, one result list per query.
+        """
+        scores, ids = self.search_ids_batch(query_vecs, top_k)
+        out = []
+        for row_scores, row_ids in zip(scores, ids):
+            keep = row_ids != -1
+            out.append(list(zip(row_scores[keep].tolist(), self.get_items(row_ids[keep]))))
+        return out
+
+    def get_vectors(self, ids) -> np.ndarray:
+        """
+        Returns the stored (len(ids), d) normalized vectors for the given FAISS ids,
+        without touching the embedding model.
+        """
         if self.index is None:
             raise RuntimeError("FAISS index not loaded. Build or load first.")
+        return np.asarray(self.vectors[self.rows_for(ids)], dtype="float32")
+
+    # ---- incremental updates ----
+
+    def add_documents(
+        self,
+        chunks: List[Dict[str, Any]],
+        embed_fn: Callable[[List[str]], np.ndarray],
+        index_type: str = None,
+        persist: bool = True
+    ) -> Dict[str, int]:
+        """
+        Adds chunks whose chunk_id is not in the store yet; only those are embedded.
+        embed_fn: e.g. Embedder.embed_texts
+        index_type: only used when the store is still empty (first build)
+        persist: False leaves the save() to the caller
+        Returns {"added": n, "skipped": n}.
+        """
+        ids = np.array([faiss_id(c["chunk_id"]) for c in chunks], dtype="int64")
+        _, first = np.unique(ids, return_index=True)
+        fresh = np.sort(first[~self.has_ids(ids[first])])
+        new_chunks = [chunks[i] for i in fresh.tolist()]
+        if not new_chunks:
+            return {"added": 0, "skipped": len(chunks)}
+
+        vecs = np.ascontiguousarray(embed_fn([c["text"] for c in new_chunks]), dtype="float32")
+        new_ids = ids[fresh]
+        if self.meta.get("tombstones") and np.isin(new_ids, self.meta["tombstones"]).any():
+            # a deleted chunk coming back would stay hidden behind its tombstone
+            self._compact()
+
+        if self.index is None or len(self.ids) == 0:
+            self.build(vecs, new_chunks, index_type=index_type, persist=persist)
+            return {"added": len(new_chunks), "skipped": len(chunks) - len(new_chunks)}
+
+        if vecs.shape[1] != self.index.d:
+            raise ValueError(
+                f"Embedding dim {vecs.shape[1]} != index dim {self.index.d}. "
+                "Rebuild the index when switching embedding models."
+            )
+        self.index.add_with_ids(vecs, new_ids)
+        self._search_params = None  # efSearch is re-read from the index
+        self.vectors = np.concatenate([np.asarray(self.vectors, dtype="float32"), vecs])
+        self.chunks.extend(new_chunks)
+        self._order = None
+        if persist:
+            self.save()
+        return {"added": len(new_chunks), "skipped": len(chunks) - len(new_chunks)}
+
+    def delete_ids(self, ids, persist: bool = True) -> int:
+        """
+        Removes chunks by FAISS id (no re-embedding). Returns the number removed.
+        persist: False leaves the save() to the caller
+        """
+        ids = np.asarray(ids, dtype="int64")
+        ids = ids[self.has_ids(ids)]
+        if self.index is None or len(ids) == 0:
+            return 0
+
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[self.rows_for(ids)] = False
+        self.chunks.select(keep)
+        self.vectors = np.asarray(self.vectors, dtype="float32")[keep]
+        self._order = None
 
-        scores, idxs = self.index.search(query_vec, top_k)
-        scores = scores[0].tolist()
-        idxs = idxs[0].tolist()
-
-        results = []
-        for s, i in zip(scores, idxs):
-            if i == -1:
-                continue
-            item = self.meta["items"][i]
-            results.append((float(s), item))
-        return results
+        if self.meta.get("index", {}).get("type") == "hnsw":
+            # HNSW cannot remove nodes: tombstone them, rebuild only once they pile up
+            self.meta["tombstones"] = sorted(set(self.meta.get("tombstones", [])) | set(ids.tolist()))
+            self._search_params = None
+            if len(self.meta["tombstones"]) > SETTINGS.index_compact_fraction * max(1, len(self.ids)):
+                self._compact()
+        else:
+            self.index.remove_ids(faiss.IDSelectorBatch(ids))
+        if persist:
+            self.save()
+        return len(ids)
+
+    def _compact(self) -> None:
+        """
+        Rebuilds the index from the live vectors, dropping tombstoned nodes.
+        """
+        self._rebuild_index(self.meta.get("index", {"type": "flat"}))
+        self.meta.pop("tombstones", None)
+        self._search_params = None
+
+    def delete_source(self, source: str, persist: bool = True) -> int:
+        """
+        Removes every chunk of a source document. Returns the number removed.
+        """
+        return self.delete_ids(np.asarray(self.ids)[self.chunks.source_rows(source)], persist=persist)
+
+    def upsert_sources(
+        self,
+        docs: Dict[str, List[Dict[str, Any]]],
+        embed_fn: Callable[[List[str]], np.ndarray],
+        index_type: str = None,
+        persist: bool = True
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Replaces each source document's chunks ({source: chunks}).
+        Unchanged chunks (same content-hash id) keep their vectors; only new or
+        changed chunks are embedded, and chunks that disappeared are deleted.
+        All documents go through one delete, one add and (with persist) one save.
+        Returns {source: {"added": n, "deleted": n, "unchanged": n}}.
+        """
+        ids = np.asarray(self.ids)
+        stats, gone, fresh = {}, [], []
+        for source, chunks in docs.items():
+            new_ids = {faiss_id(c["chunk_id"]) for c in chunks}
+            old_ids = set(ids[self.chunks.source_rows(source)].tolist())
+            gone.extend(old_ids - new_ids)
+            doc_fresh = [c for c in chunks if faiss_id(c["chunk_id"]) not in old_ids]
+            fresh.extend(doc_fresh)
+            # chunk ids hash the source, so documents never share ids
+            stats[source] = {"added": len({c["chunk_id"] for c in doc_fresh}), "deleted": len(old_ids - new_ids),
+                             "unchanged": len(old_ids & new_ids)}
+
+        self.delete_ids(np.array(sorted(gone), dtype="int64"), persist=False)
+        self.add_documents(fresh, embed_fn, index_type=index_type, persist=False)
+        if persist and (gone or fresh):
+            self.save()
+        return stats
+
+    def upsert_source(
+        self,
+        source: str,
+        chunks: List[Dict[str, Any]],
+        embed_fn: Callable[[List[str]], np.ndarray],
+        index_type: str = None,
+        persist: bool = True
+    ) -> Dict[str, int]:
+        """
+        Replaces a source document's chunks with `chunks` (see upsert_sources).
+        Returns {"added": n, "deleted": n, "unchanged": n}.
+        """
+        return self.upsert_sources({source: chunks}, embed_fn, index_type, persist)[source]
+
+    def _rebuild_index(self, info: Dict[str, Any]) -> None:
+        """
+        Rebuilds the FAISS index from the stored vectors, keeping the index type.
+        """
+        index_type = info.get("type", "flat")
+        # graph params carry over; IVF list counts are re-derived for the new corpus size
+        params = {} if index_type.startswith("ivf") else {
+            k: v for k, v in info.items() if k not in ("type", "factory", "tuned_recall")
+        }
+        vectors = np.ascontiguousarray(self.vectors, dtype="float32")
+        if len(vectors) == 0:
+            self.index = wrap_with_ids(faiss.IndexFlatIP(self.index.d))
+            return
+        self.index, info = build_index(
+            vectors,
+            index_type=index_type,
+            params=params,
+            target_recall=None,
+            ids=np.asarray(self.ids)
+        )
+        self.meta["index"] = info
@@ -0,0 +1,2 @@
+# offline benchmarks: `python -m bench run` for the suite (see bench/suite.py), or
+# single studies with `python -m bench.<name>`
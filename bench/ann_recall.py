@@ -0,0 +1,97 @@
+"""
+Recall@k vs latency for each FAISS index type, against the exact (flat) baseline.
+
+Vectors are clustered Gaussians (fast to generate at any N), or hash-stub embeddings
+of synthetic chunk text with --text. Every index is built through
+backend.index_factory.build_index, so nprobe / efSearch are tuned exactly as in
+FaissStore.build.
+
+Usage:
+  python -m bench.ann_recall --n 100000 --dim 384 --k 10
+  python -m bench.ann_recall --n 20000 --text --out outputs/ann_recall.json
+"""
+import argparse
+import time
+import numpy as np
+import faiss
+
+from backend.index_factory import INDEX_TYPES, build_index, recall_at_k
+from backend.utils import write_json
+
+def clustered_vectors(n: int, d: int, n_clusters: int = 256, spread: float = 0.35, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, d)).astype("float32")
+    vecs = centers[rng.integers(0, n_clusters, size=n)] + spread * rng.standard_normal((n, d)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs
+
+def _per_query_ms(index, queries: np.ndarray, k: int) -> np.ndarray:
+    ms = []
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        index.search(queries[i:i + 1], k)
+        ms.append((time.perf_counter() - t0) * 1000)
+    return np.asarray(ms)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=50000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--target-recall", type=float, default=0.95)
+    ap.add_argument("--types", default=",".join(INDEX_TYPES))
+    ap.add_argument("--text", action="store_true", help="embed synthetic chunk text with the hash stub")
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    if args.text:
+        from .stubs import HashEmbedder
+        from .synthetic import make_chunks, make_queries
+        embedder = HashEmbedder(dim=args.dim)
+        chunks = make_chunks(args.n)
+        vecs = embedder.embed_texts([c["text"] for c in chunks])
+        queries = embedder.embed_texts(make_queries(chunks, args.queries))
+    else:
+        # queries share the corpus' cluster centers but are held out of the index
+        both = clustered_vectors(args.n + args.queries, args.dim)
+        vecs, queries = both[:args.n], both[args.n:]
+
+    exact = faiss.IndexFlatIP(args.dim)
+    exact.add(vecs)
+    _, truth = exact.search(queries, args.k)
+
+    rows = []
+    for index_type in args.types.split(","):
+        t0 = time.perf_counter()
+        index, info = build_index(vecs, index_type, target_recall=args.target_recall)
+        build_s = time.perf_counter() - t0
+
+        _, found = index.search(queries, args.k)
+        ms = _per_query_ms(index, queries, args.k)
+        t0 = time.perf_counter()
+        index.search(queries, args.k)
+        batch_qps = len(queries) / max(time.perf_counter() - t0, 1e-9)
+
+        rows.append({
+            "type": index_type,
+            "params": info,
+            f"recall@{args.k}": round(recall_at_k(found, truth), 4),
+            "p50_ms": round(float(np.percentile(ms, 50)), 4),
+            "p95_ms": round(float(np.percentile(ms, 95)), 4),
+            "batch_qps": round(batch_qps, 1),
+            "build_s": round(build_s, 3),
+            "index_mb": round(faiss.serialize_index(index).nbytes / 1e6, 2),
+        })
+
+    report = {"n": args.n, "dim": args.dim, "queries": args.queries, "k": args.k, "results": rows}
+    if args.out:
+        write_json(args.out, report)
+
+    print(f"{'type':<10}{'recall@' + str(args.k):>11}{'p50_ms':>10}{'p95_ms':>10}{'qps':>11}{'build_s':>10}{'MB':>9}")
+    for r in rows:
+        print(f"{r['type']:<10}{r[f'recall@{args.k}']:>11}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['batch_qps']:>11}{r['build_s']:>10}{r['index_mb']:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Load test for POST /ask against a local stub generator (no network, no model).
+
+  blocking: the previous sync handler (def endpoint, blocking generate_content,
+            runs on Starlette's 40-thread pool)
+  async:    api.ask (CPU executor for embed + search, async genai client,
+            admission limit and per-stage timeouts)
+
+Requests go straight into the ASGI app from N concurrent closed-loop clients, so
+the numbers measure the server's scheduling, not a socket stack.
+
+Usage:
+  python -m bench.api_load
+  python -m bench.api_load --gen-ms 800 --concurrency 32,128,512 --slo-ms 1500
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from fastapi import FastAPI
+
+from backend.config import SETTINGS
+from backend.vectorstore import FaissStore
+from backend.retriever import retrieve
+from backend.qa import answer_with_optional_llm
+from backend.serving import AdmissionLimiter
+from .stubs import HashEmbedder, StubGenerator
+from .synthetic import make_chunks, make_queries
+
+def _blocking_app(store, embedder, client) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/ask")
+    def ask(req: dict):
+        retrieved = retrieve(store, embedder.embed_query, req["question"], SETTINGS.top_k, True)
+        out = answer_with_optional_llm(req["question"], retrieved, True, client, SETTINGS.gemini_model)
+        return {"answer": out["answer"], "citations": out["citations"]}
+
+    return app
+
+async def _post(app, path: str, body: bytes) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": ("bench", 0), "server": ("bench", 80),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+    delivered = False
+    status = 0
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # never disconnects
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+async def _load(app, queries, concurrency: int, seconds: float):
+    latencies, codes = [], {}
+    deadline = time.perf_counter() + seconds
+
+    async def client(i: int):
+        j = i
+        while time.perf_counter() < deadline:
+            body = json.dumps({"question": queries[j % len(queries)]}).encode()
+            t0 = time.perf_counter()
+            code = await _post(app, "/ask", body)
+            codes[code] = codes.get(code, 0) + 1
+            if code == 200:
+                latencies.append((time.perf_counter() - t0) * 1000)
+            elif code == 503:
+                await asyncio.sleep(0.05)  # shed: back off instead of hammering
+            j += concurrency
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(concurrency)])
+    wall = time.perf_counter() - t0
+    ms = np.asarray(latencies or [0.0])
+    return {
+        "concurrency": concurrency,
+        "ok_rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "status": {str(k): v for k, v in sorted(codes.items())},
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=5000)
+    ap.add_argument("--gen-ms", type=float, default=300.0, help="stub generator latency")
+    ap.add_argument("--concurrency", default="16,64,256")
+    ap.add_argument("--seconds", type=float, default=5.0, help="per load level")
+    ap.add_argument("--slo-ms", type=float, default=1000.0, help="p95 target for the summary")
+    ap.add_argument("--out", default="", help="also write the report as JSON")
+    args = ap.parse_args()
+
+    import api
+
+    embedder = HashEmbedder()
+    client = StubGenerator(args.gen_ms / 1000)
+    chunks = make_chunks(args.chunks)
+    queries = make_queries(chunks, 500)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as d:
+        # run logging goes to <tmp>/outputs/runs.db, not the app's telemetry
+        os.chdir(d)
+        FaissStore(d).build(embedder.embed_texts([c["text"] for c in chunks]), chunks)
+        store = FaissStore(d)
+        store.load()
+        api.store, api.embedder, api.gemini_client = store, embedder, client
+        api.init_resources()
+
+        apps = {"blocking": _blocking_app(store, embedder, client), "async": api.app}
+        report = {"gen_ms": args.gen_ms, "slo_ms": args.slo_ms, "levels": {}}
+        for name, app in apps.items():
+            rows = []
+            for c in [int(x) for x in args.concurrency.split(",")]:
+                # fresh limiter per event loop
+                api.admission = AdmissionLimiter(SETTINGS.api_max_inflight, SETTINGS.api_admission_wait_s)
+                rows.append(asyncio.run(_load(app, queries, c, args.seconds)))
+            report["levels"][name] = rows
+        os.chdir(cwd)
+
+    print(f"{'mode':10}{'conc':>6}{'ok_rps':>10}{'p50_ms':>10}{'p95_ms':>10}  status")
+    for name, rows in report["levels"].items():
+        for r in rows:
+            print(f"{name:10}{r['concurrency']:>6}{r['ok_rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}  {r['status']}")
+        within = [r["ok_rps"] for r in rows if r["p95_ms"] <= args.slo_ms]
+        report[f"{name}_max_rps_within_slo"] = max(within) if within else 0.0
+        print(f"{name}: max ok rps with p95 <= {args.slo_ms:.0f} ms: {report[f'{name}_max_rps_within_slo']}")
+
+    if args.out:
+        from backend.utils import write_json
+        write_json(args.out, report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Chunker microbenchmark on a large synthetic page corpus.
+
+  legacy:      per-page encode, per-window decode, then count_tokens() re-encodes each
+               chunk and tiktoken.get_encoding() is looked up on every call
+  single-pass: backend.chunking.chunk_pages (batched encode/decode, token_count from
+               the window length, cached encoder)
+
+Usage:
+  python -m bench.chunking_speed --pages 2000 --words 600
+"""
+import argparse
+import json
+import time
+import numpy as np
+import tiktoken
+
+from backend.chunking import chunk_pages
+from .synthetic import make_vocab
+
+def _legacy_chunk_pages(pages, chunk_tokens, overlap_tokens):
+    out = []
+    for p in pages:
+        enc = tiktoken.get_encoding("cl100k_base")
+        tokens = enc.encode(p["text"])
+        start = 0
+        while start < len(tokens):
+            end = min(start + chunk_tokens, len(tokens))
+            piece = enc.decode(tokens[start:end]).strip()
+            if piece:
+                out.append({"text": piece, "token_count": len(tiktoken.get_encoding("cl100k_base").encode(piece))})
+            if end == len(tokens):
+                break
+            start = max(0, end - overlap_tokens)
+    return out
+
+def make_pages(n: int, words: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vocab = make_vocab(seed=seed)
+    ranks = np.minimum(rng.zipf(1.3, size=(n, words)), len(vocab)) - 1
+    pages = []
+    for i in range(n):
+        toks = [vocab[j] for j in ranks[i]]
+        # sentence-ish punctuation so the tokenizer sees realistic text
+        text = " ".join(w + ("." if k % 17 == 16 else "") for k, w in enumerate(toks))
+        pages.append({"source": f"doc_{i // 50:04d}.pdf", "page": i % 50 + 1, "text": text})
+    return pages
+
+def _best_of(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", type=int, default=2000)
+    ap.add_argument("--words", type=int, default=600)
+    ap.add_argument("--chunk-tokens", type=int, default=420)
+    ap.add_argument("--overlap", type=int, default=80)
+    ap.add_argument("--repeats", type=int, default=3)
+    args = ap.parse_args()
+
+    pages = make_pages(args.pages, args.words)
+    legacy_s, legacy = _best_of(lambda: _legacy_chunk_pages(pages, args.chunk_tokens, args.overlap), args.repeats)
+    new_s, new = _best_of(lambda: chunk_pages(pages, args.chunk_tokens, args.overlap), args.repeats)
+
+    n_tokens = sum(c["token_count"] for c in new)
+    print(json.dumps({
+        "pages": args.pages,
+        "chunks": len(new),
+        "legacy_s": round(legacy_s, 3),
+        "single_pass_s": round(new_s, 3),
+        "speedup": round(legacy_s / max(new_s, 1e-9), 2),
+        "single_pass_tokens_per_s": round(n_tokens / max(new_s, 1e-9)),
+        "same_chunks": [c["text"] for c in legacy] == [c["text"] for c in new],
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Cold start and per-click latency of the embedding model.
+
+  imports: import time of the API and the app's heavy modules, each in a fresh
+           interpreter (best of --repeats; "missing" when not installed)
+  model:   the first get_embedder() call (load + warm-up), then --clicks simulated
+           Ask clicks, each embedding a new question:
+             fresh:  Embedder(name) per click, as the pages did before the registry
+             shared: get_embedder(name), the registry's loaded instance
+
+Usage:
+  python -m bench.cold_start
+  python -m bench.cold_start --model sentence-transformers/all-MiniLM-L6-v2 --clicks 5
+  python -m bench.cold_start --imports-only
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+
+from backend.config import SETTINGS
+
+MODULES = (
+    "api", "backend.embeddings", "backend.vectorstore",
+    "faiss", "sentence_transformers", "torch", "umap", "plotly.express", "google.genai",
+)
+
+def import_seconds(module: str, repeats: int = 3):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    best = None
+    for _ in range(max(1, repeats)):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if proc.returncode != 0:
+            return "missing" if "ModuleNotFoundError" in proc.stderr else "error"
+        secs = float(proc.stdout.strip().splitlines()[-1])
+        best = secs if best is None else min(best, secs)
+    return round(best, 3)
+
+def _click_ms(get, clicks: int):
+    ms = []
+    for i in range(clicks):
+        t0 = time.perf_counter()
+        get().embed_query(f"cold start question {i} {time.time()}")  # new text: no query-cache hit
+        ms.append((time.perf_counter() - t0) * 1000)
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 1), "max_ms": round(max(ms), 1)}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", default=SETTINGS.embedding_model)
+    ap.add_argument("--clicks", type=int, default=5)
+    ap.add_argument("--repeats", type=int, default=3, help="fresh interpreters per import timing")
+    ap.add_argument("--imports-only", action="store_true")
+    args = ap.parse_args()
+
+    report = {"imports_s": {m: import_seconds(m, args.repeats) for m in MODULES}}
+    if not args.imports_only:
+        from backend.embeddings import Embedder
+        from backend.models import get_embedder, loaded_models
+
+        t0 = time.perf_counter()
+        get_embedder(args.model)
+        report["first_get_embedder_s"] = round(time.perf_counter() - t0, 3)
+        report["model"] = loaded_models()[args.model]
+        report["click_fresh"] = _click_ms(lambda: Embedder(args.model), args.clicks)
+        report["click_shared"] = _click_ms(lambda: get_embedder(args.model), args.clicks)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Query-embedding throughput with and without the API's micro-batcher.
+
+  direct:  each concurrent caller encodes its own query (batch of one)
+  batched: QueryMicroBatcher collects queries for --window-ms / up to --max-batch
+
+Usage:
+  python -m bench.embed_batching
+  python -m bench.embed_batching --model sentence-transformers/all-MiniLM-L6-v2 --concurrency 1,8,32
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+
+from backend.batching import QueryMicroBatcher
+from .stubs import HashEmbedder
+from .synthetic import make_chunks, make_queries
+
+async def _load(batcher: QueryMicroBatcher, queries, concurrency: int, seconds: float):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(i: int):
+        j = i
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            await batcher.embed(queries[j % len(queries)])
+            latencies.append((time.perf_counter() - t0) * 1000)
+            j += concurrency
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(concurrency)])
+    wall = time.perf_counter() - t0
+    ms = np.asarray(latencies)
+    return {
+        "concurrency": concurrency,
+        "qps": round(len(latencies) / wall, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "mean_batch": batcher.stats()["mean_batch"],
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", default="", help="real SentenceTransformer model (default: hash stub)")
+    ap.add_argument("--window-ms", type=float, default=3.0)
+    ap.add_argument("--max-batch", type=int, default=32)
+    ap.add_argument("--concurrency", default="1,8,32,128")
+    ap.add_argument("--seconds", type=float, default=3.0, help="per load level")
+    args = ap.parse_args()
+
+    if args.model:
+        from backend.embeddings import Embedder
+        embedder = Embedder(args.model)
+        # straight to the model: the query LRU would turn repeats into free hits
+        embed_fn = lambda texts: embedder._encode(texts, batch_size=len(texts))
+    else:
+        embedder = HashEmbedder()
+        embed_fn = embedder.embed_texts
+
+    queries = make_queries(make_chunks(2000), 5000)
+    report = {"embedder": args.model or "hash-stub", "window_ms": args.window_ms, "max_batch": args.max_batch, "levels": []}
+    for c in [int(x) for x in args.concurrency.split(",")]:
+        direct = asyncio.run(_load(QueryMicroBatcher(embed_fn, 0, 1), queries, c, args.seconds))
+        batcher = QueryMicroBatcher(embed_fn, args.window_ms, args.max_batch)
+        batched = asyncio.run(_load(batcher, queries, c, args.seconds))
+        report["levels"].append({"direct": direct, "batched": batched, "histogram": batcher.stats()["histogram"]})
+
+    print(f"{'conc':>5}{'direct_qps':>12}{'p95_ms':>9}{'batched_qps':>13}{'p95_ms':>9}{'mean_batch':>12}")
+    for lv in report["levels"]:
+        d, b = lv["direct"], lv["batched"]
+        print(f"{d['concurrency']:>5}{d['qps']:>12}{d['p95_ms']:>9}{b['qps']:>13}{b['p95_ms']:>9}{b['mean_batch']:>12}")
+    print(json.dumps({"histogram_at_max_concurrency": report["levels"][-1]["histogram"]}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Load time and memory: legacy monolithic meta.json vs the columnar MetaStore.
+
+Each variant is loaded in a fresh subprocess so peak RSS is not polluted by the
+benchmark itself. "hit_ms" materializes 10 random rows the way search() does.
+
+Usage:
+  python -m bench.meta_load --chunks 200000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from backend.metastore import MetaStore
+from backend.utils import write_json
+from .synthetic import make_chunks
+
+_PROBE = r"""
+import json, resource, sys, time
+import numpy as np
+t0 = time.perf_counter()
+if sys.argv[1] == "json":
+    with open(sys.argv[2], encoding="utf-8") as f:
+        items = json.load(f)["items"]
+    get = lambda rows: [items[r] for r in rows]
+    n = len(items)
+else:
+    from backend.metastore import MetaStore
+    meta = MetaStore.load(sys.argv[2])
+    get = meta.items
+    n = len(meta)
+load_ms = (time.perf_counter() - t0) * 1000
+rows = np.random.default_rng(0).integers(0, n, size=10).tolist()
+t0 = time.perf_counter()
+get(rows)
+hit_ms = (time.perf_counter() - t0) * 1000
+try:
+    # VmHWM is per address space; ru_maxrss would include the parent's peak
+    with open("/proc/self/status") as f:
+        peak_kb = int(next(l for l in f if l.startswith("VmHWM")).split()[1])
+except OSError:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"load_ms": round(load_ms, 1), "hit_ms": round(hit_ms, 3),
+                  "peak_rss_mb": round(peak_kb / 1024, 1)}))
+"""
+
+def _probe(kind: str, path: str) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", _PROBE, kind, path], cwd=root,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=200000)
+    args = ap.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    with tempfile.TemporaryDirectory() as d:
+        legacy = os.path.join(d, "meta.json")
+        write_json(legacy, {"items": chunks})
+        MetaStore.from_items(chunks).save(d)
+
+        report = {
+            "chunks": args.chunks,
+            "meta_json_mb": round(os.path.getsize(legacy) / 1e6, 1),
+            "meta_json": _probe("json", legacy),
+            "columnar": _probe("columnar", d),
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Before/after latency of MMR retrieval.
+
+  before: candidate texts are re-embedded on every query (old retrieve path)
+  after:  candidate vectors are read from the store by FAISS id
+
+Usage:
+  python -m bench.mmr_latency --chunks 5000 --queries 200
+  python -m bench.mmr_latency --model sentence-transformers/all-MiniLM-L6-v2
+"""
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+
+from backend.vectorstore import FaissStore
+from backend.retriever import mmr_select, retrieve
+from .stubs import HashEmbedder
+from .synthetic import make_chunks, make_queries
+
+def _retrieve_reembed(store, embedder, query, top_k):
+    qv = embedder.embed_query(query)
+    candidate_k = min(30, max(top_k * 5, top_k))
+    cands = store.search(qv, candidate_k)
+    vecs = embedder.embed_texts([c[1]["text"] for c in cands])
+    return mmr_select(qv, cands, vecs, k=top_k)
+
+def _timed(fn, queries):
+    ms = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        ms.append((time.perf_counter() - t0) * 1000)
+    ms = np.asarray(ms)
+    return {
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=5000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--model", default="", help="real SentenceTransformer model (default: hash stub)")
+    args = ap.parse_args()
+
+    if args.model:
+        from backend.embeddings import Embedder
+        embedder = Embedder(args.model)
+    else:
+        embedder = HashEmbedder()
+
+    chunks = make_chunks(args.chunks)
+    queries = make_queries(chunks, args.queries)
+
+    with tempfile.TemporaryDirectory() as d:
+        FaissStore(d).build(embedder.embed_texts([c["text"] for c in chunks]), chunks)
+        store = FaissStore(d)
+        store.load()
+
+        before = _timed(lambda q: _retrieve_reembed(store, embedder, q, args.top_k), queries)
+        after = _timed(lambda q: retrieve(store, embedder.embed_query, q, args.top_k, use_mmr=True), queries)
+
+    print(json.dumps({
+        "embedder": args.model or "hash-stub",
+        "chunks": args.chunks,
+        "queries": args.queries,
+        "top_k": args.top_k,
+        "before_reembed": before,
+        "after_stored_vectors": after,
+        "speedup_p50": round(before["p50_ms"] / max(after["p50_ms"], 1e-9), 2),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
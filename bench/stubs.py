@@ -0,0 +1,74 @@
+from typing import List
+import asyncio
+import time
+import zlib
+import numpy as np
+
+class HashEmbedder:
+    """
+    Deterministic stand-in for backend.embeddings.Embedder.
+    Hashed bag-of-words -> fixed random projection, L2-normalized.
+    Same interface (embed_texts / embed_query) but needs no model download.
+    """
+    def __init__(self, dim: int = 384, buckets: int = 4096, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.dim = dim
+        self.buckets = buckets
+        self.proj = rng.standard_normal((buckets, dim)).astype("float32")
+
+    def _bag_of_words(self, texts: List[str]) -> np.ndarray:
+        m = np.zeros((len(texts), self.buckets), dtype="float32")
+        for row, text in enumerate(texts):
+            for w in text.lower().split():
+                m[row, zlib.crc32(w.encode("utf-8")) % self.buckets] += 1.0
+        return m
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        vecs = self._bag_of_words(texts) @ self.proj
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+        return vecs.astype("float32")
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_texts([text])
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        return self.embed_texts(list(texts))
+
+class _StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class _StubModels:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    def generate_content(self, model: str, contents: str) -> _StubResponse:
+        time.sleep(self.latency_s)
+        return _StubResponse(f"stub answer ({len(contents)} prompt chars)")
+
+    def generate_content_stream(self, model: str, contents: str):
+        # first piece after latency_s, then a few more, like a streamed completion
+        for i, word in enumerate(f"stub answer ({len(contents)} prompt chars)".split()):
+            time.sleep(self.latency_s if i == 0 else self.latency_s / 10)
+            yield _StubResponse(word + " ")
+
+class _StubAsyncModels(_StubModels):
+    async def generate_content(self, model: str, contents: str) -> _StubResponse:
+        await asyncio.sleep(self.latency_s)
+        return _StubResponse(f"stub answer ({len(contents)} prompt chars)")
+
+    async def generate_content_stream(self, model: str, contents: str):
+        for i, word in enumerate(f"stub answer ({len(contents)} prompt chars)".split()):
+            await asyncio.sleep(self.latency_s if i == 0 else self.latency_s / 10)
+            yield _StubResponse(word + " ")
+
+class StubGenerator:
+    """
+    Stand-in for google.genai.Client: client.models.generate_content (blocking) and
+    client.aio.models.generate_content (async), plus the *_stream variants, all sleeping
+    latency_s like a remote LLM.
+    """
+    def __init__(self, latency_s: float = 0.3):
+        self.models = _StubModels(latency_s)
+        self.aio = type("Aio", (), {})()
+        self.aio.models = _StubAsyncModels(latency_s)
@@ -0,0 +1,252 @@
+"""
+Offline benchmark suite: chunking, index build/save/load, search and retrieve
+(with and without MMR) on synthetic corpora, with the hash stub embedder so it
+runs without downloading a model. Results go to JSON; a run can be compared
+against a stored baseline and fails (exit 1) on regressions.
+
+Usage:
+  python -m bench run --sizes 10k,100k --save-baseline outputs/bench/baseline.json
+  python -m bench run --sizes 10k,100k --baseline outputs/bench/baseline.json --threshold 0.2
+  python -m bench run --sizes 1M --words 40 --queries 100      # ~1.5 GB of vectors
+  python -m bench compare outputs/bench/latest.json outputs/bench/baseline.json
+
+Baselines are machine-specific: record one on the machine that runs the comparison.
+
+Every *_ms / *_s value is a "lower is better" timing; compare() flags those that
+grew by more than threshold (relative) and min_delta_ms (absolute, to ignore
+jitter on sub-millisecond stages). setup_* timings are reported but not compared.
+Timings are the best of --repeats runs (build_s: a single run, it dominates at 1M).
+"""
+import argparse
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+
+from backend.config import SETTINGS
+from backend.utils import ensure_dir, now_ms, read_json, write_json
+from backend.vectorstore import FaissStore
+from backend.retriever import retrieve, retrieve_many
+from .stubs import HashEmbedder
+from .synthetic import make_chunks, make_queries
+
+EMBED_BATCH = 4096  # HashEmbedder builds a (batch, 4096) bag-of-words matrix
+
+def parse_size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+def _pcts(ms: List[float], prefix: str) -> Dict[str, float]:
+    a = np.asarray(ms)
+    return {
+        f"{prefix}_p50_ms": round(float(np.percentile(a, 50)), 4),
+        f"{prefix}_p95_ms": round(float(np.percentile(a, 95)), 4),
+    }
+
+def _per_query(fn: Callable[[int], Any], n: int, prefix: str, repeats: int = 1) -> Dict[str, float]:
+    """
+    p50/p95 of fn(i) over i < n; per percentile, the best pass out of `repeats`.
+    """
+    fn(0)  # warm-up
+    passes = []
+    for _ in range(max(1, repeats)):
+        ms = []
+        for i in range(n):
+            t0 = time.perf_counter()
+            fn(i)
+            ms.append((time.perf_counter() - t0) * 1000)
+        passes.append(_pcts(ms, prefix))
+    return {k: min(p[k] for p in passes) for k in passes[0]}
+
+def _timed(fn: Callable[[], Any], repeats: int = 1) -> Tuple[float, Any]:
+    best, out = float("inf"), None
+    for _ in range(max(1, repeats)):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return round(best, 4), out
+
+def bench_chunking(pages: int, words: int, chunk_tokens: int, overlap: int, repeats: int = 1) -> Dict[str, float]:
+    from backend.chunking import chunk_pages
+    from .chunking_speed import make_pages
+
+    docs = make_pages(pages, words)
+    chunk_pages(docs[:10], chunk_tokens, overlap)  # warm-up: loads the tokenizer
+    secs, chunks = _timed(lambda: chunk_pages(docs, chunk_tokens, overlap), repeats)
+    return {"chunk_pages_s": secs, "pages": pages, "chunks": len(chunks), "pages_per_sec": round(pages / max(secs, 1e-9), 1)}
+
+def bench_size(n: int, args, embedder: HashEmbedder) -> Dict[str, Any]:
+    """
+    One corpus of n chunks: build -> save -> load, then per-query search / retrieve timings.
+    """
+    res: Dict[str, Any] = {"chunks": n}
+    res["setup_corpus_s"], chunks = _timed(lambda: make_chunks(n, words_per_chunk=args.words))
+    texts = [c["text"] for c in chunks]
+    res["setup_embed_s"], vecs = _timed(lambda: np.concatenate([
+        embedder.embed_texts(texts[i:i + EMBED_BATCH]) for i in range(0, n, EMBED_BATCH)
+    ]))
+    del texts
+    queries = make_queries(chunks, args.queries)
+    qvecs = embedder.embed_texts(queries)
+    qv_by_text = {q: qvecs[i:i + 1] for i, q in enumerate(queries)}
+
+    with tempfile.TemporaryDirectory() as d:
+        store = FaissStore(d)
+        res["build_s"], _ = _timed(lambda: store.build(vecs, chunks, index_type=args.index_type or None))
+        res["index"] = store.meta.get("index", {}).get("type")
+        res["save_s"], _ = _timed(store.save, args.repeats)
+        del store, vecs, chunks
+
+        def load():
+            st = FaissStore(d)
+            st.load()
+            return st
+
+        res["load_s"], store = _timed(load, args.repeats)
+
+        def embed(q):
+            return qv_by_text[q]
+
+        def embed_many(qs):
+            return np.concatenate([qv_by_text[q] for q in qs])
+
+        k, nq, reps = args.top_k, len(queries), args.repeats
+        res.update(_per_query(lambda i: store.search(qvecs[i:i + 1], k), nq, "search", reps))
+        res.update(_per_query(lambda i: retrieve(store, embed, queries[i], k, use_mmr=False), nq, "retrieve", reps))
+        res.update(_per_query(lambda i: retrieve(store, embed, queries[i], k, use_mmr=True), nq, "retrieve_mmr", reps))
+        # batched path (/ask/batch): whole query set in one call, reported per query
+        secs, _ = _timed(lambda: retrieve_many(store, embed_many, queries, k, use_mmr=True), reps)
+        res["retrieve_many_mmr_per_query_ms"] = round(secs * 1000 / len(queries), 4)
+    return res
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def run_suite(args) -> Dict[str, Any]:
+    import faiss
+
+    report: Dict[str, Any] = {
+        "ts_ms": now_ms(),
+        "commit": _git_commit(),
+        "env": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "faiss": getattr(faiss, "__version__", ""),
+            "cpus": os.cpu_count(),
+            "platform": platform.platform(),
+        },
+        "params": {
+            "sizes": args.sizes, "words": args.words, "queries": args.queries, "top_k": args.top_k, "repeats": args.repeats,
+            "index_type": args.index_type or SETTINGS.index_type,
+            "mmr_candidate_k": SETTINGS.mmr_candidate_k, "mmr_lambda": SETTINGS.mmr_lambda,
+        },
+        "results": {},
+    }
+    if args.chunk_pages > 0:
+        report["results"]["chunking"] = bench_chunking(
+            args.chunk_pages, 600, SETTINGS.chunk_tokens, SETTINGS.chunk_overlap, args.repeats
+        )
+        print(f"chunking: {report['results']['chunking']}", flush=True)
+
+    embedder = HashEmbedder()
+    for n in [parse_size(s) for s in args.sizes.split(",") if s.strip()]:
+        res = bench_size(n, args, embedder)
+        report["results"][f"n{n}"] = res
+        print(f"n={n}: {res}", flush=True)
+    return report
+
+def _timings(report: Dict[str, Any]) -> Dict[str, float]:
+    out = {}
+    for group, vals in report.get("results", {}).items():
+        for key, v in vals.items():
+            if key.startswith("setup_") or not isinstance(v, (int, float)):
+                continue
+            if key.endswith("_ms"):
+                out[f"{group}.{key}"] = float(v)
+            elif key.endswith("_s"):
+                out[f"{group}.{key[:-2]}_ms"] = float(v) * 1000
+    return out
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Rows for every timing present in both reports; "regression" marks those more
+    than threshold (fraction) and min_delta_ms slower than the baseline.
+    """
+    cur, base = _timings(current), _timings(baseline)
+    rows = []
+    for key in sorted(cur.keys() & base.keys()):
+        c, b = cur[key], base[key]
+        change = (c - b) / b if b > 0 else 0.0
+        rows.append({
+            "metric": key,
+            "baseline_ms": round(b, 4),
+            "current_ms": round(c, 4),
+            "change": round(change, 4),
+            "regression": change > threshold and (c - b) > min_delta_ms,
+        })
+    return rows
+
+def print_comparison(rows: List[Dict[str, Any]], threshold: float) -> bool:
+    print(f"\n{'metric':48}{'baseline_ms':>14}{'current_ms':>14}{'change':>9}")
+    for r in rows:
+        flag = "  REGRESSION" if r["regression"] else ""
+        print(f"{r['metric']:48}{r['baseline_ms']:>14}{r['current_ms']:>14}{r['change']:>+9.1%}{flag}")
+    bad = [r for r in rows if r["regression"]]
+    print(f"\n{len(bad)} regression(s) beyond {threshold:.0%} across {len(rows)} shared metrics")
+    return not bad
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="run the suite")
+    run.add_argument("--sizes", default="10k", help="corpus sizes in chunks, e.g. 10k,100k,1M")
+    run.add_argument("--words", type=int, default=120, help="words per synthetic chunk (lower it for 1M)")
+    run.add_argument("--queries", type=int, default=200)
+    run.add_argument("--top-k", type=int, default=SETTINGS.top_k)
+    run.add_argument("--index-type", default="", help="flat | ivf_flat | ivf_pq | hnsw | auto (default: INDEX_TYPE)")
+    run.add_argument("--repeats", type=int, default=3, help="best-of passes per timing")
+    run.add_argument("--chunk-pages", type=int, default=500, help="pages for the chunk_pages timing (0: skip)")
+    run.add_argument("--out", default=os.path.join(SETTINGS.outputs_dir, "bench", "latest.json"))
+    run.add_argument("--baseline", default="", help="compare against this report; exit 1 on regressions")
+    run.add_argument("--save-baseline", default="", help="also write this run as the new baseline")
+    run.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    run.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+
+    cmp_ = sub.add_parser("compare", help="compare two saved reports")
+    cmp_.add_argument("current")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("--threshold", type=float, default=0.2)
+    cmp_.add_argument("--min-delta-ms", type=float, default=0.05)
+
+    args = ap.parse_args(argv)
+
+    if args.cmd == "compare":
+        rows = compare(read_json(args.current), read_json(args.baseline), args.threshold, args.min_delta_ms)
+        sys.exit(0 if print_comparison(rows, args.threshold) else 1)
+
+    report = run_suite(args)
+    for path in filter(None, (args.out, args.save_baseline)):
+        ensure_dir(os.path.dirname(path) or ".")
+        write_json(path, report)
+        print(f"wrote {path}")
+
+    if args.baseline:
+        baseline = read_json(args.baseline)
+        rows = compare(report, baseline, args.threshold, args.min_delta_ms)
+        report["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "rows": rows}
+        if args.out:
+            write_json(args.out, report)
+        if not print_comparison(rows, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from typing import List, Dict, Any
+import numpy as np
+
+def make_vocab(size: int = 5000, seed: int = 0) -> List[str]:
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(3, 10, size=size)
+    return ["".join(rng.choice(letters, size=n)) for n in lengths]
+
+def make_chunks(n: int, words_per_chunk: int = 120, n_sources: int = 20, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Synthetic chunk objects shaped like backend.chunking.chunk_pages output.
+    Word frequencies are Zipf-like so retrieval has something to latch onto.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = make_vocab(seed=seed)
+    ranks = np.minimum(rng.zipf(1.3, size=(n, words_per_chunk)), len(vocab)) - 1
+    chunks = []
+    for i in range(n):
+        text = " ".join(vocab[j] for j in ranks[i])
+        chunks.append({
+            "chunk_id": f"c{i + 1:06d}",
+            "source": f"doc_{i % n_sources:03d}.pdf",
+            "page": i // n_sources + 1,
+            "text": text,
+            "token_count": words_per_chunk,
+        })
+    return chunks
+
+def make_queries(chunks: List[Dict[str, Any]], n: int, words: int = 8, seed: int = 1) -> List[str]:
+    """Queries sampled as short word windows from random chunks."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in rng.integers(0, len(chunks), size=n):
+        toks = chunks[i]["text"].split()
+        start = int(rng.integers(0, max(1, len(toks) - words)))
+        out.append(" ".join(toks[start:start + words]))
+    return out
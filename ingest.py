@@ -0,0 +1,50 @@
+"""
+Headless ingestion (same pipeline as the Ingest & Index page).
+
+  python ingest.py data/*.pdf
+  python ingest.py data/report.pdf --rebuild --chunk-tokens 300 --workers 8
+  python ingest.py data/*.pdf --chunk-mode sentences
+"""
+import argparse
+import json
+import sys
+
+from backend.config import SETTINGS
+from backend.embeddings import Embedder
+from backend.chunking import CHUNK_MODES, model_limit_warning
+from backend.pipeline import index_files, make_chunker
+from backend.vectorstore import FaissStore
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+", help="PDF files")
+    ap.add_argument("--index-dir", default=SETTINGS.index_dir)
+    ap.add_argument("--model", default=SETTINGS.embedding_model)
+    ap.add_argument("--chunk-tokens", type=int, default=SETTINGS.chunk_tokens)
+    ap.add_argument("--overlap", type=int, default=SETTINGS.chunk_overlap)
+    ap.add_argument("--chunk-mode", default=SETTINGS.chunk_mode, choices=CHUNK_MODES)
+    ap.add_argument("--workers", type=int, default=SETTINGS.ingest_workers, help="PDF extraction processes (0 = in-process)")
+    ap.add_argument("--index-type", default=None, help="flat | ivf_flat | ivf_pq | hnsw | auto")
+    ap.add_argument("--rebuild", action="store_true", help="rebuild from these files only instead of upserting")
+    args = ap.parse_args()
+
+    store = FaissStore(args.index_dir)
+    store.load()
+    embedder = Embedder(args.model)
+    limit_msg = model_limit_warning(args.chunk_mode, args.chunk_tokens, embedder.token_budget())
+    if limit_msg:
+        print(f"warning: {limit_msg}", file=sys.stderr)
+
+    def progress(s):
+        print(f"pages={s['pages']} chunks={s['chunks']} embedded={s['embedded']} "
+              f"({s['pages_per_s']} pages/s, {s['chunks_per_s']} chunks/s)", flush=True)
+
+    _, stats = index_files(
+        args.paths, store, embedder.embed_texts, args.chunk_tokens, args.overlap,
+        rebuild=args.rebuild, index_type=args.index_type, on_progress=progress, workers=args.workers,
+        chunker=make_chunker(args.chunk_mode, args.chunk_tokens, args.overlap, embedder)
+    )
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import SETTINGS
+from bench.stubs import HashEmbedder
+
+@pytest.fixture
+def settings():
+    """
+    set(**fields) overrides SETTINGS (a frozen dataclass) for one test.
+    """
+    saved = {}
+
+    def set_(**fields):
+        for name, value in fields.items():
+            saved.setdefault(name, getattr(SETTINGS, name))
+            object.__setattr__(SETTINGS, name, value)
+
+    yield set_
+    for name, value in saved.items():
+        object.__setattr__(SETTINGS, name, value)
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder(dim=64)
+
+def make_doc(source: str, texts, page: int = 1):
+    """
+    Chunks shaped like chunking.chunk_pages output, with content-hash ids.
+    """
+    from backend.chunking import chunk_id_for
+    return [
+        {"chunk_id": chunk_id_for(source, page, t), "source": source, "page": page, "text": t,
+         "token_count": len(t.split())}
+        for t in texts
+    ]
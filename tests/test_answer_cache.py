@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import backend.answer_cache as answer_cache
+from backend.answer_cache import SemanticAnswerCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    now[0] is what time.time() returns inside the cache.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    return now
+
+def vec(i: int, dim: int = 8) -> np.ndarray:
+    return np.eye(dim, dtype="float32")[i]
+
+def test_similar_query_hits_within_its_scope(clock):
+    cache = SemanticAnswerCache(10, 0.95, ttl_s=60)
+    cache.put(vec(0), "v1", {"answer": "a", "generation_ms": 120})
+
+    near = vec(0) + 0.01 * vec(1)
+    sim, value = cache.lookup(near / np.linalg.norm(near), "v1")
+    assert value["answer"] == "a" and sim > 0.95
+    assert cache.lookup(vec(0), "v2") is None  # other index version / settings
+    assert cache.lookup(vec(1), "v1") is None  # below threshold
+    assert cache.stats()["saved_generation_ms"] == 120
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticAnswerCache(10, 0.9, ttl_s=60)
+    cache.put(vec(0), "s", {"answer": "a"})
+    clock[0] += 61
+    assert cache.lookup(vec(0), "s") is None
+    assert cache.stats()["entries"] == 0
+
+def test_a_hit_does_not_extend_the_ttl(clock):
+    cache = SemanticAnswerCache(3, 0.9, ttl_s=10)
+    cache.put(vec(0), "s", {"answer": "a"})
+    clock[0] += 5
+    cache.put(vec(1), "s", {"answer": "b"})
+    clock[0] += 1
+    assert cache.lookup(vec(0), "s") is not None  # now the most recently used
+
+    clock[0] += 6  # a is past its TTL, b is not
+    cache.put(vec(2), "s", {"answer": "c"})
+    assert cache.expired == 1
+    cache.put(vec(3), "s", {"answer": "d"})
+    assert cache.evictions == 0  # the expired entry made room, not the live b
+    assert cache.lookup(vec(1), "s")[1]["answer"] == "b"
+
+def test_least_recently_used_is_evicted(clock):
+    cache = SemanticAnswerCache(2, 0.9, ttl_s=60)
+    cache.put(vec(0), "s", {"answer": "a"})
+    cache.put(vec(1), "s", {"answer": "b"})
+    cache.lookup(vec(0), "s")
+    cache.put(vec(2), "s", {"answer": "c"})
+
+    assert cache.evictions == 1
+    assert cache.lookup(vec(1), "s") is None
+    assert cache.lookup(vec(0), "s")[1]["answer"] == "a"
+    assert cache.lookup(vec(2), "s")[1]["answer"] == "c"
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = SemanticAnswerCache(0, 0.9, ttl_s=60)
+    cache.put(vec(0), "s", {"answer": "a"})
+    assert cache.lookup(vec(0), "s") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+import api
+from backend.answer_cache import ANSWER_CACHE
+from backend.batching import QueryMicroBatcher
+from backend.serving import AdmissionLimiter
+from backend.vectorstore import FaissStore
+from bench.stubs import StubGenerator
+from bench.synthetic import make_chunks, make_queries
+
+@pytest.fixture
+def runs(monkeypatch):
+    """
+    Runs the handlers log, instead of the telemetry writer.
+    """
+    rows = []
+    monkeypatch.setattr(api, "log_run", rows.append)
+    return rows
+
+@pytest.fixture
+def app(tmp_path, embedder, settings, monkeypatch, runs):
+    """
+    api wired to a synthetic index, HashEmbedder and StubGenerator. Loop-bound
+    objects (admission limiter, batcher, batch semaphore) are fresh per test,
+    since each test runs its own event loop.
+    """
+    settings(profile_sample_rate=0.0, generation_timeout_s=5.0)
+    chunks = make_chunks(200)
+    store = FaissStore(str(tmp_path))
+    store.build(embedder.embed_texts([c["text"] for c in chunks]), chunks, index_type="flat")
+    monkeypatch.setattr(api, "store", store)
+    monkeypatch.setattr(api, "embedder", embedder)
+    monkeypatch.setattr(api, "gemini_client", StubGenerator(0.01))
+    monkeypatch.setattr(api, "batcher", QueryMicroBatcher(embedder.embed_queries, 0, 1))
+    monkeypatch.setattr(api, "admission", AdmissionLimiter(4, 0.0))
+    monkeypatch.setattr(api, "_batch_generations", None)
+    ANSWER_CACHE.clear()
+    yield api
+    ANSWER_CACHE.clear()
+
+@pytest.fixture
+def questions():
+    return make_queries(make_chunks(200), 20)
+
+async def call(path: str, payload, disconnect: bool = False):
+    """
+    (status, body) of one request straight through the ASGI app. disconnect: the
+    client is gone before anything can be sent.
+    """
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "client": ("test", 0), "server": ("test", 80),
+        "headers": [(b"content-type", b"application/json")],
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    status, chunks = None, []
+
+    async def send(message):
+        nonlocal status
+        if disconnect:
+            raise OSError("client disconnected")
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await api.app(scope, receive, send)
+    except Exception:
+        if not disconnect:
+            raise
+    return status, b"".join(chunks)
+
+def test_ask_answers_and_releases_its_slot(app, questions, runs):
+    status, body = asyncio.run(call("/ask", {"question": questions[0]}))
+    assert status == 200
+    assert json.loads(body)["answer"].startswith("stub answer")
+    assert app.admission.inflight == 0
+    assert len(runs) == 1
+
+def test_ask_is_rejected_when_no_slot_is_free(app, questions):
+    async def scenario():
+        for _ in range(app.admission.max_inflight):
+            await app.admission.acquire()
+        try:
+            return await call("/ask", {"question": questions[0]})
+        finally:
+            for _ in range(app.admission.max_inflight):
+                app.admission.release()
+
+    status, body = asyncio.run(scenario())
+    assert status == 503
+    assert json.loads(body)["stage"] == "admission"
+    assert app.admission.rejected == 1
+
+def test_batch_generations_are_bounded(app, questions, settings, monkeypatch):
+    settings(api_batch_generations=3)
+    live, peak = [0], [0]
+    answer = app._answer
+
+    async def counted(*args):
+        live[0] += 1
+        peak[0] = max(peak[0], live[0])
+        try:
+            await asyncio.sleep(0.02)
+            return await answer(*args)
+        finally:
+            live[0] -= 1
+    monkeypatch.setattr(app, "_answer", counted)
+
+    status, body = asyncio.run(call("/ask/batch", {"questions": questions}))
+    assert status == 200
+    assert len(json.loads(body)["results"]) == len(questions)
+    assert peak[0] == 3
+    assert app.admission.inflight == 0
+
+def test_empty_batch_is_a_client_error(app):
+    status, _ = asyncio.run(call("/ask/batch", {"questions": []}))
+    assert status == 422
+
+def test_stream_releases_its_slot(app, questions):
+    status, body = asyncio.run(call("/ask/stream", {"question": questions[0]}))
+    events = [line.split(": ", 1)[1] for line in body.decode().splitlines() if line.startswith("event: ")]
+    assert status == 200
+    assert events[0] == "retrieval" and events[-1] == "done"
+    assert app.admission.inflight == 0
+
+def test_stream_releases_its_slot_when_the_client_leaves_early(app, questions):
+    for q in questions[:3]:
+        asyncio.run(call("/ask/stream", {"question": q}, disconnect=True))
+    assert app.admission.inflight == 0
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import backend.pipeline as pipeline
+from backend.pipeline import IngestPipeline, index_files
+from backend.vectorstore import FaissStore
+from conftest import make_doc
+
+FOOTER = "Confidential footer shared by every document"
+
+@pytest.fixture
+def pdfs(monkeypatch):
+    """
+    {path: [page texts]} served to the pipeline in place of pypdf (workers=0
+    extracts in-thread with _extract).
+    """
+    docs = {}
+    monkeypatch.setattr(pipeline, "_page_jobs", lambda paths, per_job: [(p, 0, len(docs[p])) for p in paths])
+    monkeypatch.setattr(pipeline, "_extract", lambda job: [
+        {"source": job[0], "page": i + 1, "text": t} for i, t in enumerate(docs[job[0]][job[1]:job[2]])
+    ])
+    return docs
+
+def one_chunk_per_page(pages):
+    return [c for p in pages for c in make_doc(p["source"], [p["text"]], p["page"])]
+
+def run_index(store, embed_fn, paths, rebuild=False):
+    return index_files(paths, store, embed_fn, 100, 10, rebuild=rebuild, workers=0, chunker=one_chunk_per_page)
+
+def test_incremental_run_keeps_real_vectors_for_repeated_text(tmp_path, embedder, pdfs):
+    pdfs["b.pdf"] = ["beta body about mice", FOOTER]
+    store = FaissStore(str(tmp_path))
+    run_index(store, embedder.embed_texts, ["b.pdf"], rebuild=True)
+
+    # a.pdf's footer page is new (other source) but its text is already stored for b.pdf
+    pdfs["a.pdf"] = ["alpha body about lions", FOOTER]
+    _, stats = run_index(store, embedder.embed_texts, ["a.pdf", "b.pdf"])
+
+    assert len(store) == 4
+    np.testing.assert_allclose(np.linalg.norm(np.asarray(store.vectors), axis=1), 1.0, atol=1e-5)
+    assert {d["source"]: d["added"] for d in stats["documents"]} == {"a.pdf": 2, "b.pdf": 0}
+
+def test_incremental_run_saves_once(tmp_path, embedder, pdfs, monkeypatch):
+    pdfs.update({"a.pdf": ["a one", "a two"], "b.pdf": ["b one"], "c.pdf": ["c one"]})
+    store = FaissStore(str(tmp_path))
+    run_index(store, embedder.embed_texts, ["a.pdf", "b.pdf"], rebuild=True)
+    saves = []
+    save = store.save
+    monkeypatch.setattr(store, "save", lambda: (saves.append(1), save()))
+
+    pdfs["a.pdf"] = ["a one", "a two changed"]
+    _, stats = run_index(store, embedder.embed_texts, ["a.pdf", "b.pdf", "c.pdf"])
+
+    assert len(saves) == 1
+    assert [d["source"] for d in stats["documents"]] == ["a.pdf", "b.pdf", "c.pdf"]
+    reloaded = FaissStore(str(tmp_path))
+    reloaded.load()
+    assert sorted(c["text"] for c in reloaded.items()) == ["a one", "a two changed", "b one", "c one"]
+
+def test_failed_embedding_tears_the_pipeline_down(embedder, pdfs, monkeypatch):
+    pdfs.update({f"{i}.pdf": [f"page {j} of doc {i}" for j in range(50)] for i in range(20)})
+    extract = pipeline._extract
+
+    def slow_extract(job):
+        time.sleep(0.01)
+        return extract(job)
+    monkeypatch.setattr(pipeline, "_extract", slow_extract)
+
+    def failing_embed(texts):
+        raise RuntimeError("embedding backend down")
+
+    before = set(threading.enumerate())
+    pipe = IngestPipeline(100, 10, failing_embed, workers=0, chunk_workers=2, batch_size=4, queue_size=2,
+                          chunker=one_chunk_per_page)
+    t0 = time.time()
+    with pytest.raises(RuntimeError, match="embedding backend down"):
+        pipe.run(sorted(pdfs))
+    assert time.time() - t0 < 5
+    assert [t for t in threading.enumerate() if t not in before and t.is_alive()] == []
@@ -0,0 +1,72 @@
+from backend.chunking import count_tokens
+from backend.prompt import pack_context
+from backend.qa import answer_sources, context_budget
+from conftest import make_doc
+
+def header_tokens(c) -> int:
+    return count_tokens(f"[{c['chunk_id']}] Source: {c['source']} | Page: {c['page']}")
+
+def scored(chunks):
+    # best first: 0.9, 0.8, ...
+    return [(0.9 - i / 10, c) for i, c in enumerate(chunks)]
+
+def sentences(topic: str, n: int = 6) -> str:
+    return " ".join(f"Sentence {i} is about {topic} number {i}." for i in range(n))
+
+def test_no_budget_packs_everything():
+    items = scored(make_doc("a.pdf", [sentences("cats"), sentences("dogs"), sentences("owls")]))
+    context, info = pack_context(items, 0)
+    assert info["chunks_used"] == 3
+    assert info["chunk_ids"] == [c["chunk_id"] for _, c in items]
+    assert all(c["text"] in context for _, c in items)
+
+def test_budget_keeps_the_best_chunks_that_fit():
+    chunks = make_doc("a.pdf", [sentences("cats"), sentences("dogs"), sentences("owls")])
+    budget = sum(c["token_count"] + header_tokens(c) for c in chunks[:2])
+    # lowest score first in the input: packing goes by score, not input order
+    context, info = pack_context(list(reversed(scored(chunks))), budget)
+
+    assert info["chunk_ids"] == [chunks[0]["chunk_id"], chunks[1]["chunk_id"]]
+    assert info["tokens_used"] <= budget
+    assert "owls" not in context
+
+def test_overlap_between_windows_of_one_page_is_dropped():
+    shared = "This passage is shared by two adjacent windows of the same page, word for word."
+    first, second = f"Opening text about rivers. {shared}", f"{shared} Closing text about lakes."
+    items = scored(make_doc("a.pdf", [first, second]))
+
+    context, info = pack_context(items, 0)
+    assert context.count(shared) == 1
+    assert info["overlap_tokens_dropped"] > 0
+
+    other_page = scored(make_doc("a.pdf", [first]) + make_doc("a.pdf", [second], page=2))
+    context, _ = pack_context(other_page, 0)
+    assert context.count(shared) == 2
+
+def test_trim_sentences_keeps_question_relevant_sentences():
+    chunks = make_doc("a.pdf", [sentences("cats"), "Filler text. Parrots can mimic speech. More filler here."])
+    budget = chunks[0]["token_count"] + header_tokens(chunks[0]) + header_tokens(chunks[1]) + 8
+
+    _, info = pack_context(scored(chunks), budget, "Can parrots mimic speech?")
+    assert info["chunks_used"] == 1
+
+    context, info = pack_context(scored(chunks), budget, "Can parrots mimic speech?", trim_sentences=True)
+    assert info["chunks_used"] == 2 and info["chunks_trimmed"] == 1
+    assert "Parrots can mimic speech." in context and "Filler" not in context
+
+def test_budget_scales_with_top_k(settings):
+    settings(context_tokens_per_chunk=100, context_token_budget=0)
+    assert context_budget(3) == 300
+    assert context_budget(12) == 1200
+    settings(context_token_budget=500)
+    assert context_budget(3) == context_budget(12) == 500
+    settings(context_token_budget=0, context_tokens_per_chunk=0)
+    assert context_budget(12) == 0
+
+def test_citations_come_from_packed_chunks_only(settings):
+    chunks = make_doc("a.pdf", [sentences("cats"), sentences("dogs"), sentences("owls")])
+    settings(context_token_budget=chunks[0]["token_count"] + header_tokens(chunks[0]), context_trim_sentences=False)
+
+    src = answer_sources(scored(chunks), "cats")
+    assert src["context_info"]["chunk_ids"] == [chunks[0]["chunk_id"]]
+    assert [c["chunk_id"] for c in src["citations"]] == [chunks[0]["chunk_id"]]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from backend import rollups, telemetry
+
+DAY = 86_400_000
+NOW = 1000 * DAY
+
+@pytest.fixture
+def conn(tmp_path, settings):
+    settings(outputs_dir=str(tmp_path), runs_db_path=str(tmp_path / "runs.db"),
+             telemetry_raw_days=7, telemetry_minute_days=30, telemetry_hour_days=365)
+    telemetry.init_db()
+    conn = telemetry._connect()
+    yield conn
+    conn.close()
+
+def insert_run(conn, ts_ms: int, total_ms: float = 10.0) -> int:
+    run_id = conn.execute("INSERT INTO runs (ts_ms, total_ms) VALUES (?, ?)", (ts_ms, total_ms)).lastrowid
+    conn.execute("INSERT INTO spans (run_id, name, ms) VALUES (?, 'faiss_search', 1.0)", (run_id,))
+    rollups.update_rollups(conn, [{"ts_ms": ts_ms, "total_ms": total_ms, "spans": {"faiss_search": 1.0}}])
+    return run_id
+
+def rollup(conn, granularity: str, stage: str = "total"):
+    return conn.execute(
+        "SELECT bucket_ms, count, sum_ms, p50_ms, p95_ms, p99_ms, max_ms FROM rollups WHERE granularity = ? AND stage = ?",
+        (granularity, stage)
+    ).fetchall()
+
+def test_percentiles_track_the_raw_values(conn):
+    values = np.arange(1, 1001, dtype="float64")
+    with conn:
+        rollups.update_rollups(conn, [{"ts_ms": NOW, "total_ms": v} for v in values])
+    (_, count, total, p50, p95, p99, peak), = rollup(conn, "minute")
+    assert (count, total, peak) == (1000, values.sum(), 1000.0)
+    for got, q in ((p50, 50), (p95, 95), (p99, 99)):
+        assert got == pytest.approx(np.percentile(values, q), rel=0.1)
+
+def test_incremental_updates_match_one_batch(conn):
+    rows = [{"ts_ms": NOW + i, "total_ms": float(ms)} for i, ms in enumerate([3, 8, 120, 45, 9, 700])]
+    with conn:
+        rollups.update_rollups(conn, rows[:2])
+        rollups.update_rollups(conn, rows[2:])
+    split = rollup(conn, "hour")
+    conn.execute("DELETE FROM rollups")
+    with conn:
+        rollups.update_rollups(conn, rows)
+    assert rollup(conn, "hour") == split
+
+def test_compaction_goes_by_timestamp_not_id(conn):
+    with conn:
+        old = insert_run(conn, NOW - 30 * DAY)
+        recent = insert_run(conn, NOW - 1 * DAY)
+        late_old = insert_run(conn, NOW - 20 * DAY)  # backfilled: higher id than a recent run
+        newest = insert_run(conn, NOW)
+
+    with conn:
+        deleted = rollups.compact(conn, NOW)
+
+    assert deleted["runs"] == 2 and deleted["spans"] == 2
+    assert [r for r, in conn.execute("SELECT id FROM runs ORDER BY id")] == [recent, newest]
+    assert [r for r, in conn.execute("SELECT run_id FROM spans ORDER BY run_id")] == [recent, newest]
+    assert old < recent < late_old
+    # the timings of deleted runs live on in the rollups
+    assert sum(count for _, count, *_ in rollup(conn, "hour")) == 4
+
+def test_rollups_have_their_own_retention(conn):
+    with conn:
+        insert_run(conn, NOW - 100 * DAY)
+        insert_run(conn, NOW - 400 * DAY)
+        insert_run(conn, NOW)
+    with conn:
+        rollups.compact(conn, NOW)
+    assert [b for b, *_ in rollup(conn, "minute")] == [NOW]
+    assert len(rollup(conn, "hour")) == 2
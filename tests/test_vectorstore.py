@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from backend.metastore import faiss_id
+from backend.vectorstore import FaissStore
+from conftest import make_doc
+
+WORDS = "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa".split()
+
+def texts(n: int, offset: int = 0):
+    return [f"{WORDS[(i + offset) % len(WORDS)]} {WORDS[(3 * i + 1) % len(WORDS)]} chunk {i + offset}" for i in range(n)]
+
+def build(tmp_path, embedder, docs, index_type="flat"):
+    chunks = [c for doc in docs for c in doc]
+    store = FaissStore(str(tmp_path))
+    store.build(embedder.embed_texts([c["text"] for c in chunks]), chunks, index_type=index_type)
+    return store
+
+def recording(embedder):
+    seen = []
+
+    def embed(batch):
+        seen.extend(batch)
+        return embedder.embed_texts(batch)
+    return embed, seen
+
+def top_ids(store, embedder, text, k=50):
+    _, ids = store.search_ids(embedder.embed_query(text), k)
+    return set(np.ravel(ids).tolist()) - {-1}
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_upsert_embeds_only_new_chunks(tmp_path, embedder, index_type):
+    a, b = make_doc("a.pdf", texts(4)), make_doc("b.pdf", texts(3, 10))
+    store = build(tmp_path, embedder, [a, b], index_type)
+
+    a2 = a[:2] + make_doc("a.pdf", ["a brand new chunk"])
+    embed, seen = recording(embedder)
+    counts = store.upsert_sources({"a.pdf": a2, "b.pdf": b}, embed)
+
+    assert counts == {"a.pdf": {"added": 1, "deleted": 2, "unchanged": 2},
+                      "b.pdf": {"added": 0, "deleted": 0, "unchanged": 3}}
+    assert seen == ["a brand new chunk"]
+
+    reloaded = FaissStore(str(tmp_path))
+    assert reloaded.load()
+    assert sorted(c["chunk_id"] for c in reloaded.items()) == sorted(c["chunk_id"] for c in a2 + b)
+    for c in a[2:]:
+        assert faiss_id(c["chunk_id"]) not in top_ids(reloaded, embedder, c["text"])
+
+def test_upsert_sources_saves_once(tmp_path, embedder, monkeypatch):
+    store = build(tmp_path, embedder, [make_doc("a.pdf", texts(4)), make_doc("b.pdf", texts(4, 8))])
+    saves = []
+    save = store.save
+    monkeypatch.setattr(store, "save", lambda: (saves.append(1), save()))
+
+    store.upsert_sources({
+        "a.pdf": make_doc("a.pdf", texts(2)),
+        "b.pdf": make_doc("b.pdf", texts(5, 8)),
+        "c.pdf": make_doc("c.pdf", ["a third document"]),
+    }, embedder.embed_texts)
+    assert len(saves) == 1
+
+    store.upsert_source("c.pdf", make_doc("c.pdf", ["a third document"]), embedder.embed_texts)
+    assert len(saves) == 1  # nothing changed, nothing written
+
+def test_persist_false_leaves_the_save_to_the_caller(tmp_path, embedder):
+    a = make_doc("a.pdf", texts(4))
+    store = build(tmp_path, embedder, [a])
+    version = store.version
+
+    store.delete_ids([faiss_id(a[0]["chunk_id"])], persist=False)
+    assert store.version == version
+    on_disk = FaissStore(str(tmp_path))
+    on_disk.load()
+    assert len(on_disk) == 4
+
+    store.save()
+    on_disk.load()
+    assert len(on_disk) == 3 and on_disk.version != version
+
+def test_hnsw_delete_tombstones_instead_of_rebuilding(tmp_path, embedder, settings):
+    settings(index_compact_fraction=0.5)
+    doc = make_doc("a.pdf", texts(12))
+    store = build(tmp_path, embedder, [doc], "hnsw")
+    gone = faiss_id(doc[0]["chunk_id"])
+
+    assert store.delete_ids([gone]) == 1
+    assert store.meta["tombstones"] == [gone]
+    assert store.index.ntotal == 12  # the graph node stays
+    assert gone not in top_ids(store, embedder, doc[0]["text"])
+
+    reloaded = FaissStore(str(tmp_path))
+    reloaded.load()
+    assert len(reloaded) == 11
+    assert gone not in top_ids(reloaded, embedder, doc[0]["text"])
+
+def test_hnsw_compacts_once_tombstones_pile_up(tmp_path, embedder, settings):
+    settings(index_compact_fraction=0.2)
+    doc = make_doc("a.pdf", texts(10))
+    store = build(tmp_path, embedder, [doc], "hnsw")
+
+    store.delete_ids([faiss_id(doc[0]["chunk_id"])])
+    assert store.meta.get("tombstones")
+    store.delete_ids([faiss_id(c["chunk_id"]) for c in doc[1:3]])
+    assert "tombstones" not in store.meta
+    assert store.index.ntotal == len(store) == 7
+
+def test_hnsw_readded_chunk_is_found_again(tmp_path, embedder, settings):
+    settings(index_compact_fraction=0.5)
+    doc = make_doc("a.pdf", texts(12))
+    store = build(tmp_path, embedder, [doc], "hnsw")
+    chunk_id = faiss_id(doc[0]["chunk_id"])
+
+    store.delete_ids([chunk_id])
+    store.add_documents(doc[:1], embedder.embed_texts)
+    assert not store.meta.get("tombstones")
+    assert chunk_id in top_ids(store, embedder, doc[0]["text"])
+    np.testing.assert_allclose(store.get_vectors([chunk_id]), embedder.embed_texts([doc[0]["text"]]), atol=1e-6)